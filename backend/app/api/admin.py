@@ -0,0 +1,112 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Dict
+
+from app.api.deps import get_analysis_service, get_comment_store, get_youtube_service
+from app.core.upstream import governor_stats
+from app.services.analysis_service import AnalysisService
+from app.services.comment_store import CommentStore
+from app.services.pre_classifier import LOCAL_VERSION_PREFIX
+from app.services.youtube_service import YouTubeService
+
+router = APIRouter()
+
+@router.get("/cache", response_model=Dict[str, Any])
+async def get_analysis_cache_stats(
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """分析結果キャッシュの統計を取得"""
+    if analysis_service.cache is None:
+        raise HTTPException(status_code=404, detail="分析キャッシュは無効です")
+    return {"prompt_version": analysis_service.prompt_version, **analysis_service.cache.stats()}
+
+@router.delete("/cache", response_model=Dict[str, str])
+async def clear_analysis_cache(
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """分析結果キャッシュを破棄"""
+    if analysis_service.cache is not None:
+        analysis_service.cache.clear()
+    return {"message": "分析キャッシュを破棄しました"}
+
+@router.get("/structured-output", response_model=Dict[str, Any])
+async def get_structured_output_stats(
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """LLM応答のJSON解析・修復・不足項目の再要求の件数を取得"""
+    return {
+        "enabled": analysis_service.structured_output,
+        "max_retries": analysis_service.repair_max_retries,
+        **analysis_service.parse_stats
+    }
+
+@router.get("/coalescing", response_model=Dict[str, Any])
+async def get_analysis_coalescing_stats(
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """同時に届いた同一コメントの分析を1回のLLM呼び出しにまとめた件数を取得"""
+    return analysis_service._inflight.stats()
+
+@router.get("/context-budget", response_model=Dict[str, Any])
+async def get_context_budget_stats(
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """文脈・会話履歴を予算内に切り詰めた件数と要約キャッシュの統計を取得"""
+    return analysis_service.context_budget.stats()
+
+@router.get("/protest-sessions", response_model=Dict[str, Any])
+async def get_protest_session_stats(
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """サーバー側で保持している抗議の会話の件数（開始・失効・破棄）を取得"""
+    return analysis_service.protest_sessions.stats()
+
+@router.get("/routing", response_model=Dict[str, Any])
+async def get_model_routing_stats(
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """モデルの階層ごとの振り分け件数・代替モデルへの切り替え・ヘッジの件数を取得"""
+    return analysis_service.router.stats()
+
+@router.get("/pre-classifier", response_model=Dict[str, Any])
+async def get_pre_classifier_stats(
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """ローカル分類器で判定した件数とLLMへ回した件数を取得"""
+    if analysis_service.pre_classifier is None:
+        raise HTTPException(status_code=404, detail="ローカル分類器は無効です")
+    return analysis_service.pre_classifier.stats()
+
+@router.post("/pre-classifier/train", response_model=Dict[str, Any])
+async def train_pre_classifier(
+    analysis_service: AnalysisService = Depends(get_analysis_service),
+    comment_store: CommentStore = Depends(get_comment_store)
+):
+    """保存済みのLLMによる分析結果からローカル分類器を学習"""
+    if analysis_service.pre_classifier is None:
+        raise HTTPException(status_code=404, detail="ローカル分類器は無効です")
+    try:
+        examples = await run_in_threadpool(comment_store.list_training_examples, LOCAL_VERSION_PREFIX)
+        counts = await run_in_threadpool(analysis_service.pre_classifier.train, examples)
+        return {"samples": sum(counts.values()), "labels": counts}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/quota", response_model=Dict[str, Any])
+async def get_youtube_quota(
+    youtube_service: YouTubeService = Depends(get_youtube_service)
+):
+    """YouTube API のクォータ消費量（APIキー・日ごと）と応答キャッシュ・先読みの統計を取得"""
+    return {
+        "key_id": youtube_service.key_id,
+        "remaining_today": youtube_service.quota.remaining(youtube_service.key_id),
+        **youtube_service.quota.snapshot(),
+        "cache": youtube_service.cache.stats(),
+        "coalescing": youtube_service._inflight.stats(),
+        "prefetch": youtube_service.prefetch_snapshot()
+    }
+
+@router.get("/upstream", response_model=Dict[str, Any])
+async def get_upstream_stats():
+    """上流API（APIキーごと）の呼び出し数・再試行・負荷制限・サーキットブレーカーの状態を取得"""
+    return governor_stats()
@@ -1,37 +1,85 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-import os
+import traceback
 
-from app.models.comment import Comment, AnalysisRequest, AnalysisResult, ProtestRequest, ProtestResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from typing import AsyncIterator, Dict, List, Tuple
+
+from app.api.deps import get_youtube_service, get_analysis_service, service_unavailable
+from app.core.log import log_event
+from app.core.sse import format_sse
+from app.core.upstream import UpstreamUnavailable
+from app.core.wire import encode_plain, list_response, rows_response
+from app.models.comment import Comment, AnalysisRequest, AnalysisResult, ProtestRequest, ProtestResponse, ProtestSessionInfo, ProtestSessionRequest, ProtestTurnRequest, BatchAnalysisItem, BatchAnalysisRequest, BatchAnalysisResponse
 from app.models.response import ErrorResponse
 from app.services.youtube_service import YouTubeService
 from app.services.analysis_service import AnalysisService
+from app.services.protest_sessions import ProtestSession
 
 router = APIRouter()
 
-def get_youtube_service():
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="YouTube API キーが設定されていません")
-    return YouTubeService(api_key)
+class RepliesBatchRequest(BaseModel):
+    comment_ids: List[str]
 
-def get_analysis_service():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="OpenAI API キーが設定されていません")
-    return AnalysisService(api_key)
+async def _stream_events(events: AsyncIterator[Tuple[str, object]]) -> AsyncIterator[str]:
+    """分析イベントをServer-Sent Events形式に変換"""
+    try:
+        async for kind, payload in events:
+            if kind == "delta":
+                yield format_sse({"text": payload}, event="delta")
+            else:
+                yield format_sse(payload.model_dump(mode="json"), event="result")
+    except ValueError as e:
+        yield format_sse({"detail": str(e)}, event="error")
+    except UpstreamUnavailable as e:
+        yield format_sse({"detail": str(e), "retry_after": e.retry_after}, event="error")
+    except Exception as e:
+        log_event("stream_error", level="error", error=type(e).__name__, detail=str(e))
+        yield format_sse({"detail": f"予期しないエラー: {str(e)}"}, event="error")
+
+def _sse_response(events: AsyncIterator[Tuple[str, object]]) -> StreamingResponse:
+    return StreamingResponse(
+        _stream_events(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/{comment_id}/replies", response_model=List[Comment])
 async def get_comment_replies(
     comment_id: str,
+    http_request: Request,
+    fields: str = None,
+    output_format: str = Query(None, alias="format"),
+    youtube_service: YouTubeService = Depends(get_youtube_service)
+):
+    """コメントの返信を取得（fields= で返す項目を絞り、format=ndjson で1行1件）"""
+    try:
+        replies = await run_in_threadpool(youtube_service.get_replies_batch, comment_id)
+        return rows_response(http_request, replies.rows, Comment, fields=fields, output_format=output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
+
+@router.post("/replies/batch", response_model=Dict[str, List[Comment]])
+async def get_replies_batch(
+    request: RepliesBatchRequest,
     youtube_service: YouTubeService = Depends(get_youtube_service)
 ):
-    """コメントの返信を取得"""
+    """複数コメントの返信をまとめて取得"""
     try:
-        replies = youtube_service.get_replies(comment_id)
-        return replies
+        batches = await run_in_threadpool(youtube_service.get_replies_batches, request.comment_ids)
+        return Response(
+            encode_plain({comment_id: list(batch.rows()) for comment_id, batch in batches.items()}),
+            media_type="application/json"
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
 
@@ -42,17 +90,44 @@ async def analyze_comment(
 ):
     """コメントをAI分析"""
     try:
-        print(f"Analyzing comment: {request.comment_text[:50]}...")
         result = await analysis_service.analyze_comment(request)
-        print(f"Analysis completed successfully")
+        log_event("comment_analyzed", chars=len(request.comment_text), safe_or_out=result.safe_or_out)
         return result
     except ValueError as e:
-        print(f"ValueError in analyze_comment: {str(e)}")
+        log_event("analysis_failed", level="warning", route="analyze", detail=str(e))
         raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
     except Exception as e:
-        print(f"Unexpected error in analyze_comment: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log_event("unexpected_error", level="error", route="analyze", error=type(e).__name__, detail=str(e), traceback=traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
+
+@router.post("/analyze/stream")
+async def analyze_comment_stream(
+    request: AnalysisRequest,
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """コメントをAI分析し、判定理由を生成途中からServer-Sent Eventsで配信"""
+    return _sse_response(analysis_service.analyze_comment_stream(request))
+
+@router.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_comments_batch(
+    request: BatchAnalysisRequest,
+    http_request: Request,
+    output_format: str = Query(None, alias="format"),
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """複数コメントをまとめてAI分析（結果はリクエストと同じ順序で返す。format=ndjson で1行1件）"""
+    try:
+        results = await analysis_service.analyze_batch(request.requests)
+        log_event("batch_analyzed", items=len(results), errors=sum(1 for item in results if item.error))
+        return list_response(http_request, BatchAnalysisResponse(results=results), BatchAnalysisItem, "results", output_format=output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
+    except Exception as e:
+        log_event("unexpected_error", level="error", route="analyze_batch", error=type(e).__name__, detail=str(e), traceback=traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
 
 @router.post("/protest", response_model=ProtestResponse)
@@ -62,15 +137,95 @@ async def protest_judgment(
 ):
     """判定に対する抗議を処理"""
     try:
-        print(f"Processing protest for comment: {request.comment_text[:50]}...")
         response = await analysis_service.handle_protest(request)
-        print(f"Protest handled successfully")
+        log_event("protest_handled", turns=len(request.conversation_history), judgment_changed=response.judgment_changed)
         return response
     except ValueError as e:
-        print(f"ValueError in protest_judgment: {str(e)}")
+        log_event("protest_failed", level="warning", detail=str(e))
         raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
     except Exception as e:
-        print(f"Unexpected error in protest_judgment: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
\ No newline at end of file
+        log_event("unexpected_error", level="error", route="protest", error=type(e).__name__, detail=str(e), traceback=traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
+
+@router.post("/protest/stream")
+async def protest_judgment_stream(
+    request: ProtestRequest,
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """判定に対する抗議を処理し、審判の応答を生成途中からServer-Sent Eventsで配信"""
+    return _sse_response(analysis_service.handle_protest_stream(request))
+
+def _get_session_or_404(analysis_service: AnalysisService, session_id: str) -> ProtestSession:
+    session = analysis_service.protest_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="抗議の会話が見つかりません（期限切れの場合は新しく開始してください）")
+    return session
+
+def _session_info(analysis_service: AnalysisService, session: ProtestSession) -> ProtestSessionInfo:
+    return ProtestSessionInfo(
+        session_id=session.session_id,
+        current_result=session.current_result,
+        conversation_history=session.history,
+        expires_in_seconds=analysis_service.protest_sessions.ttl_seconds
+    )
+
+@router.post("/protest/sessions", response_model=ProtestSessionInfo)
+async def start_protest_session(
+    request: ProtestSessionRequest,
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """抗議の会話を開始（以降は session_id に新しい抗議の本文だけを送る）"""
+    session = analysis_service.start_protest_session(request.comment_text, request.original_result)
+    log_event("protest_session_started", session_id=session.session_id)
+    return _session_info(analysis_service, session)
+
+@router.get("/protest/sessions/{session_id}", response_model=ProtestSessionInfo)
+async def get_protest_session(
+    session_id: str,
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """抗議の会話の履歴と現在の判定を取得"""
+    return _session_info(analysis_service, _get_session_or_404(analysis_service, session_id))
+
+@router.delete("/protest/sessions/{session_id}", response_model=Dict[str, str])
+async def end_protest_session(
+    session_id: str,
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """抗議の会話を終了"""
+    if not analysis_service.protest_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="抗議の会話が見つかりません")
+    return {"status": "deleted"}
+
+@router.post("/protest/sessions/{session_id}", response_model=ProtestResponse)
+async def protest_in_session(
+    session_id: str,
+    request: ProtestTurnRequest,
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """保持している会話に新しい抗議を送る"""
+    session = _get_session_or_404(analysis_service, session_id)
+    try:
+        response = await analysis_service.handle_protest_turn(session, request.protest_message)
+        log_event("protest_handled", session_id=session_id, turns=len(session.history), judgment_changed=response.judgment_changed)
+        return response
+    except ValueError as e:
+        log_event("protest_failed", level="warning", session_id=session_id, detail=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
+    except Exception as e:
+        log_event("unexpected_error", level="error", route="protest_session", error=type(e).__name__, detail=str(e), traceback=traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
+
+@router.post("/protest/sessions/{session_id}/stream")
+async def protest_in_session_stream(
+    session_id: str,
+    request: ProtestTurnRequest,
+    analysis_service: AnalysisService = Depends(get_analysis_service)
+):
+    """保持している会話に新しい抗議を送り、審判の応答を生成途中からServer-Sent Eventsで配信"""
+    session = _get_session_or_404(analysis_service, session_id)
+    return _sse_response(analysis_service.handle_protest_turn_stream(session, request.protest_message))
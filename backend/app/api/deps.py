@@ -0,0 +1,44 @@
+import math
+
+from fastapi import HTTPException, Request
+
+from app.core.prompt_registry import PromptRegistry
+from app.core.registry import ServiceRegistry
+from app.core.upstream import UpstreamUnavailable
+from app.services.youtube_service import YouTubeService
+from app.services.analysis_service import AnalysisService
+from app.services.judge_jobs import JudgeJobManager
+from app.services.comment_store import CommentStore
+
+
+def get_registry(request: Request) -> ServiceRegistry:
+    return request.app.state.services
+
+def get_youtube_service(request: Request) -> YouTubeService:
+    try:
+        return get_registry(request).youtube_service
+    except LookupError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def get_analysis_service(request: Request) -> AnalysisService:
+    try:
+        return get_registry(request).analysis_service
+    except LookupError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def get_prompt_registry(request: Request) -> PromptRegistry:
+    return get_registry(request).prompt_registry
+
+def get_comment_store(request: Request) -> CommentStore:
+    return get_registry(request).comment_store
+
+def get_judge_jobs(request: Request) -> JudgeJobManager:
+    return get_registry(request).judge_jobs
+
+def service_unavailable(error: UpstreamUnavailable) -> HTTPException:
+    """上流APIが使えないときの503応答（Retry-Afterで再試行の目安を伝える）"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
@@ -0,0 +1,99 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict
+
+from app.api.deps import get_judge_jobs
+from app.core.sse import format_sse, format_sse_comment
+from app.core.wire import list_response
+from app.models.job import JudgeJob, JudgeJobResult, JudgeJobResultsResponse
+from app.services.judge_jobs import JudgeJobManager, TERMINAL_STATUSES
+
+router = APIRouter()
+
+def _get_job_or_404(judge_jobs: JudgeJobManager, job_id: str) -> JudgeJob:
+    job = judge_jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
+
+@router.get("/{job_id}", response_model=JudgeJob)
+async def get_job(
+    job_id: str,
+    judge_jobs: JudgeJobManager = Depends(get_judge_jobs)
+):
+    """判定ジョブの進捗を取得"""
+    return _get_job_or_404(judge_jobs, job_id)
+
+@router.get("/{job_id}/results", response_model=JudgeJobResultsResponse)
+async def get_job_results(
+    job_id: str,
+    http_request: Request,
+    after: int = 0,
+    limit: int = 100,
+    fields: str = None,
+    output_format: str = Query(None, alias="format"),
+    judge_jobs: JudgeJobManager = Depends(get_judge_jobs)
+):
+    """判定ジョブの結果を取得（途中経過を含む、afterで続きから取得。fields= で項目を絞り、format=ndjson で1行1件）"""
+    _get_job_or_404(judge_jobs, job_id)
+    results = judge_jobs.store.list_results(job_id, after, min(max(limit, 1), 500))
+    response = JudgeJobResultsResponse(
+        results=results,
+        next_after=results[-1].seq if results else after
+    )
+    try:
+        return list_response(http_request, response, JudgeJobResult, "results", fields, output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    after: int = 0,
+    judge_jobs: JudgeJobManager = Depends(get_judge_jobs)
+):
+    """判定ジョブの進捗と新しい結果をServer-Sent Eventsで配信"""
+    _get_job_or_404(judge_jobs, job_id)
+
+    async def events():
+        last_seq = after
+        condition = judge_jobs.condition(job_id)
+        while True:
+            job = judge_jobs.store.get(job_id)
+            yield format_sse(job.model_dump(mode="json"), event="progress")
+
+            while True:
+                results = judge_jobs.store.list_results(job_id, last_seq, 100)
+                if not results:
+                    break
+                for result in results:
+                    yield format_sse(result.model_dump(mode="json"), event="result", event_id=str(result.seq))
+                last_seq = results[-1].seq
+
+            if job.status in TERMINAL_STATUSES or not judge_jobs.is_running(job_id):
+                yield format_sse(job.model_dump(mode="json"), event="done")
+                return
+
+            try:
+                async with condition:
+                    await asyncio.wait_for(condition.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield format_sse_comment()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/{job_id}/cancel", response_model=Dict[str, str])
+async def cancel_job(
+    job_id: str,
+    judge_jobs: JudgeJobManager = Depends(get_judge_jobs)
+):
+    """実行中の判定ジョブを中止"""
+    _get_job_or_404(judge_jobs, job_id)
+    if not judge_jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail="ジョブは実行中ではありません")
+    return {"message": "ジョブを中止しました"}
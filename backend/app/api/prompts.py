@@ -1,47 +1,41 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Dict
-import os
+
+from app.api.deps import get_prompt_registry
+from app.core.prompt_registry import PromptRegistry
 
 router = APIRouter()
 
 class PromptsResponse(BaseModel):
     core_prompt: str
     additional_prompt: str
+    version: str
+    source: str
+    read_only: bool
 
 class PromptsUpdateRequest(BaseModel):
     additional_prompt: str
 
 @router.get("", response_model=PromptsResponse)
-async def get_prompts():
+async def get_prompts(prompts: PromptRegistry = Depends(get_prompt_registry)):
     """プロンプト設定を取得"""
-    try:
-        # core_prompt.txtを読み込み
-        with open("core_prompt.txt", "r", encoding="utf-8") as f:
-            core_prompt = f.read()
-    except FileNotFoundError:
-        core_prompt = "コアプロンプトが見つかりません"
-    
-    try:
-        # additional_prompt.txtを読み込み
-        with open("additional_prompt.txt", "r", encoding="utf-8") as f:
-            additional_prompt = f.read()
-    except FileNotFoundError:
-        additional_prompt = ""
-    
+    revision = prompts.current
     return PromptsResponse(
-        core_prompt=core_prompt,
-        additional_prompt=additional_prompt
+        core_prompt=revision.core_prompt,
+        additional_prompt=revision.additional_prompt,
+        version=revision.version,
+        source=revision.source,
+        read_only=prompts.read_only
     )
 
 @router.put("", response_model=Dict[str, str])
-async def update_prompts(request: PromptsUpdateRequest):
-    """追加プロンプトを更新"""
+async def update_prompts(request: PromptsUpdateRequest, prompts: PromptRegistry = Depends(get_prompt_registry)):
+    """追加プロンプトを更新（古いプロンプトによる分析結果のキャッシュも無効化される）"""
     try:
-        # additional_prompt.txtを更新
-        with open("additional_prompt.txt", "w", encoding="utf-8") as f:
-            f.write(request.additional_prompt)
-        
-        return {"message": "プロンプトが更新されました"}
+        revision = prompts.update_additional(request.additional_prompt)
+        return {"message": "プロンプトが更新されました", "version": revision.version}
+    except PermissionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"プロンプト更新エラー: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"プロンプト更新エラー: {str(e)}")
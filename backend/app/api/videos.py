@@ -1,55 +1,163 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import os
 
-from app.models.comment import VideoInfo
-from app.models.response import CommentsResponse, ErrorResponse
+from app.api.deps import get_youtube_service, get_judge_jobs, get_comment_store, service_unavailable
+from app.core.upstream import UpstreamUnavailable
+from app.core.wire import WireResponse, list_response, rows_response
+from app.models.comment import BulkVideoRequest, BulkVideoResponse, Comment, VideoInfo
+from app.models.job import JudgeJob, JudgeJobRequest
+from app.models.response import CommentsResponse, CommentThread, ThreadsResponse, ErrorResponse, VideoAggregatesResponse
 from app.services.youtube_service import YouTubeService
+from app.services.judge_jobs import JudgeJobManager
+from app.services.comment_store import CommentStore, is_local_token
+from app.services.comment_sync import sync_inline, sync_remaining
+from app.services.dedup import annotate_batch, annotate_comments
 
 router = APIRouter()
 
 class VideoExtractRequest(BaseModel):
     url: str
 
-def get_youtube_service():
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="YouTube API キーが設定されていません")
-    return YouTubeService(api_key)
-
 @router.post("/extract", response_model=VideoInfo)
 async def extract_video_info(
     request: VideoExtractRequest,
-    youtube_service: YouTubeService = Depends(get_youtube_service)
+    youtube_service: YouTubeService = Depends(get_youtube_service),
+    comment_store: CommentStore = Depends(get_comment_store)
 ):
     """YouTube URLから動画情報を抽出"""
     try:
         video_id = youtube_service.extract_video_id(request.url)
-        video_info = youtube_service.get_video_info(video_id)
+        video_info = await run_in_threadpool(youtube_service.get_video_info, video_id)
+        await run_in_threadpool(comment_store.save_video, video_info)
         return video_info
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
+
+@router.post("/extract/bulk", response_model=BulkVideoResponse)
+async def extract_videos_bulk(
+    request: BulkVideoRequest,
+    youtube_service: YouTubeService = Depends(get_youtube_service),
+    comment_store: CommentStore = Depends(get_comment_store)
+):
+    """複数のURL・動画ID（チャンネル・再生リストURLも可）から動画情報をまとめて取得"""
+    try:
+        items = await run_in_threadpool(youtube_service.get_videos_bulk, request.urls)
+        await run_in_threadpool(comment_store.save_videos, [item.video for item in items if item.video is not None])
+        return WireResponse(BulkVideoResponse(items=items))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
 
 @router.get("/{video_id}/comments", response_model=CommentsResponse)
 async def get_video_comments(
     video_id: str,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
     page_token: str = None,
     max_results: int = 100,
-    youtube_service: YouTubeService = Depends(get_youtube_service)
+    sync: bool = False,
+    dedup: bool = False,
+    fields: str = None,
+    output_format: str = Query(None, alias="format"),
+    youtube_service: YouTubeService = Depends(get_youtube_service),
+    comment_store: CommentStore = Depends(get_comment_store)
 ):
-    """動画のコメントを取得"""
+    """動画のコメントを取得（sync=true で差分同期し、ローカルストアから返す。dedup=true で近似重複にクラスタIDを付ける）
+
+    fields=id,text,... で返す項目を絞り、format=ndjson で1行1件のNDJSONとして返す。
+    """
     try:
-        comments, next_page_token = youtube_service.get_comments(
-            video_id, page_token, max_results
+        # ローカルストアから返すのは sync=true の先頭ページと、ローカルストアのページトークンの続き
+        # （YouTube のページトークンは sync=true でも YouTube からの続きとして扱う）
+        if is_local_token(page_token) or (sync and not page_token):
+            if not page_token:
+                # 先頭ページの要求時だけ、前回以降の新しいコメントを取り込む
+                # （応答前に取得するのは先頭の数ページまでで、残りは応答後にバックグラウンドで取得する）
+                synced = await run_in_threadpool(sync_inline, youtube_service, comment_store, video_id)
+                if synced["pending"]:
+                    background_tasks.add_task(sync_remaining, youtube_service, comment_store, video_id)
+            comments, next_page_token = await run_in_threadpool(
+                comment_store.list_comments, video_id, page_token, max_results
+            )
+            if dedup:
+                comments = await run_in_threadpool(annotate_comments, comments)
+            response = CommentsResponse(
+                comments=comments,
+                next_page_token=next_page_token,
+                total_count=await run_in_threadpool(comment_store.count_comments, video_id)
+            )
+            return list_response(http_request, response, Comment, "comments", fields, output_format)
+        
+        # YouTube から取得したコメントはモデルを作らずに列指向の一覧から直接書き出す
+        batch, next_page_token = await run_in_threadpool(
+            youtube_service.get_comments_batch, video_id, page_token, max_results
         )
-        return CommentsResponse(
-            comments=comments,
-            next_page_token=next_page_token,
-            total_count=len(comments)
+        if dedup:
+            batch = await run_in_threadpool(annotate_batch, batch)
+        return rows_response(
+            http_request, batch.rows, Comment,
+            {"next_page_token": next_page_token, "total_count": len(batch)}, "comments", fields, output_format
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
+
+@router.get("/{video_id}/threads", response_model=ThreadsResponse)
+async def get_video_threads(
+    video_id: str,
+    http_request: Request,
+    page_token: str = None,
+    max_results: int = 100,
+    inline_replies: bool = True,
+    output_format: str = Query(None, alias="format"),
+    youtube_service: YouTubeService = Depends(get_youtube_service)
+):
+    """動画のコメントを返信込みのスレッド単位で取得（format=ndjson で1行1スレッド）"""
+    try:
+        threads, next_page_token = await run_in_threadpool(
+            youtube_service.get_comment_threads, video_id, page_token, max_results, inline_replies
+        )
+        response = ThreadsResponse(threads=threads, next_page_token=next_page_token)
+        return list_response(http_request, response, CommentThread, "threads", output_format=output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"予期しないエラー: {str(e)}")
+
+@router.post("/{video_id}/judge", response_model=JudgeJob, status_code=202)
+async def judge_video(
+    video_id: str,
+    request: JudgeJobRequest = JudgeJobRequest(),
+    judge_jobs: JudgeJobManager = Depends(get_judge_jobs)
+):
+    """動画の全コメントを判定するジョブを開始（進捗は /api/jobs/{job_id} で取得）"""
+    if request.max_comments is not None and request.max_comments <= 0:
+        raise HTTPException(status_code=400, detail="max_comments は1以上を指定してください")
+    return judge_jobs.start(video_id, request.include_replies, request.max_comments)
+
+@router.get("/{video_id}/aggregates", response_model=VideoAggregatesResponse)
+async def get_video_aggregates(
+    video_id: str,
+    comment_store: CommentStore = Depends(get_comment_store)
+):
+    """動画の判定結果の集計（セーフ/アウト・カテゴリー・反論レベル・論理的誤謬・アウトの多い投稿者・時間帯ごとの件数）
+
+    ローカルストアに保存されたコメントの分析結果を対象に、結果の保存時に更新した件数を返す。
+    """
+    aggregates = comment_store.get_video_aggregates(video_id)
+    if aggregates is None:
+        raise HTTPException(status_code=404, detail="動画の集計は無効です")
+    return WireResponse(aggregates)
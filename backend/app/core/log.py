@@ -0,0 +1,20 @@
+import json
+import os
+import sys
+import time
+from typing import Any
+
+# 構造化ログ
+# LOG_FORMAT=json（既定）では1行1イベントのJSON、text では「event key=value ...」形式で標準出力へ書く。
+# ログ収集基盤側でイベント名・ルート・所要時間などを項目として検索できるようにする。
+
+_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+
+def log_event(event: str, level: str = "info", **fields: Any) -> None:
+    """イベント名と項目を1行で出力（level は info / warning / error）"""
+    if _FORMAT == "text":
+        line = event + "".join(f" {key}={value}" for key, value in {"level": level, **fields}.items())
+    else:
+        line = json.dumps({"ts": round(time.time(), 3), "level": level, "event": event, **fields}, ensure_ascii=False, default=str)
+    print(line, file=sys.stdout, flush=True)
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import string
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from app.core.log import log_event
+
+# 分析プロンプトのレイアウト（静的部分を先頭、コメントごとの部分を末尾に置く）を変えたら更新する
+PROMPT_LAYOUT_VERSION = "2"
+
+# 静的部分の中でプレースホルダーの代わりに置く参照文
+COMMENT_REFERENCE = "（末尾の【分析対象】に記載）"
+TARGET_HEADER = "【分析対象】"
+ADDITIONAL_HEADER = "【追加指示】"
+
+DEFAULT_CORE_PROMPT = """あなたは「コメント審判」として、YouTube動画のコメントを分析するAIアシスタントです。
+
+与えられたコメントを以下の観点から分析してください：
+
+1. カテゴリ分類（19種類）
+2. グラハムの反論ヒエラルキー（該当する場合）
+3. 論理的誤謬（該当する場合）
+
+必ず指定されたJSON形式で回答してください。"""
+
+
+class PromptRevision:
+    """読み込んだプロンプトの1リビジョン（変更不可）
+
+    コアプロンプトのプレースホルダー部分を末尾へ移し、追加指示を含む静的な先頭部分を
+    事前に組み立てておく。全リクエストで先頭部分が一致するため、プロバイダー側の
+    プロンプトプレフィックスキャッシュが効く。
+    """
+
+    def __init__(self, core_prompt: str, additional_prompt: str, source: str):
+        self.core_prompt = core_prompt
+        self.additional_prompt = additional_prompt
+        self.source = source
+        self.version = self._compute_version(core_prompt, additional_prompt)
+        self.static_prefix = self._compile_static_prefix(core_prompt, additional_prompt)
+
+    @staticmethod
+    def _compute_version(core_prompt: str, additional_prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (PROMPT_LAYOUT_VERSION, core_prompt, additional_prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def _compile_static_prefix(core_prompt: str, additional_prompt: str) -> str:
+        """プレースホルダーを参照文に置き換えた静的部分を組み立てる"""
+        parts = []
+        try:
+            for literal, field, _, _ in string.Formatter().parse(core_prompt):
+                parts.append(literal)
+                if field == "comment_text":
+                    parts.append(COMMENT_REFERENCE)
+                elif field is not None and field != "context_section":
+                    parts.append("{" + field + "}")
+            prefix = "".join(parts)
+        except ValueError:
+            # 書式として解釈できないプロンプトはそのまま使う
+            prefix = core_prompt
+
+        if additional_prompt.strip():
+            prefix += f"\n\n{ADDITIONAL_HEADER}\n{additional_prompt}"
+        return prefix
+
+    def render_analysis(self, context_section: str, comment_text: str) -> str:
+        """1件分析用のプロンプト（静的部分＋コメントごとの末尾部分）"""
+        return f"{self.static_prefix}\n\n{TARGET_HEADER}\n{context_section}分析対象のコメント: \"{comment_text}\""
+
+    def render_batch(self, items_section: str) -> str:
+        """複数コメント分析用のプロンプト（静的部分は1件分析と共通）"""
+        return f"{self.static_prefix}\n\n{TARGET_HEADER}\n{items_section}"
+
+
+class PromptRegistry:
+    """プロンプトを一度だけ読み込み、ファイルの変更を検知して再読み込みするレジストリ
+
+    CORE_PROMPT / ADDITIONAL_PROMPT 環境変数が設定されていればファイルより優先する。
+    ファイルの更新確認は check_interval 秒に1回の stat のみで、ホットパスでは
+    読み込み済みのリビジョンを返すだけになる。
+    """
+
+    def __init__(self, search_dirs: Optional[List[str]] = None, check_interval: float = 2.0):
+        self.search_dirs = search_dirs or [".", ".."]
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[PromptRevision], None]] = []
+        self._mtimes: Tuple = ()
+        self._checked_at = 0.0
+        self._revision = self._load()
+
+    @classmethod
+    def from_env(cls) -> "PromptRegistry":
+        prompt_dir = os.getenv("PROMPT_DIR")
+        return cls(
+            search_dirs=[prompt_dir] if prompt_dir else None,
+            check_interval=float(os.getenv("PROMPT_CHECK_INTERVAL_SECONDS", "2"))
+        )
+
+    @property
+    def read_only(self) -> bool:
+        """本番環境（RENDER）や環境変数で指定されている場合は更新不可"""
+        return bool(os.getenv("RENDER") or os.getenv("ADDITIONAL_PROMPT"))
+
+    @property
+    def current(self) -> PromptRevision:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            if self._file_mtimes() != self._mtimes:
+                self.reload()
+        return self._revision
+
+    def add_listener(self, listener: Callable[[PromptRevision], None]) -> None:
+        """リビジョンが変わったときに呼ばれる処理を登録"""
+        self._listeners.append(listener)
+
+    def reload(self) -> bool:
+        """プロンプトを読み直し、内容が変わっていればリスナーへ通知"""
+        with self._lock:
+            revision = self._load()
+            if revision.version == self._revision.version:
+                return False
+            self._revision = revision
+
+        log_event("prompt_revision_changed", version=revision.version, source=revision.source)
+        for listener in self._listeners:
+            listener(revision)
+        return True
+
+    def update_additional(self, additional_prompt: str) -> PromptRevision:
+        """追加プロンプトをファイルへ書き込み、即座に反映"""
+        if self.read_only:
+            raise PermissionError("本番環境ではプロンプトの更新はできません。環境変数で設定してください。")
+        path = self._find("additional_prompt.txt") or os.path.join(self.search_dirs[0], "additional_prompt.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(additional_prompt)
+        self.reload()
+        return self._revision
+
+    def _find(self, filename: str) -> Optional[str]:
+        for directory in self.search_dirs:
+            path = os.path.join(directory, filename)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _file_mtimes(self) -> Tuple:
+        mtimes = []
+        for filename in ("core_prompt.txt", "additional_prompt.txt"):
+            path = self._find(filename)
+            mtimes.append((path, os.stat(path).st_mtime_ns if path else None))
+        return tuple(mtimes)
+
+    def _read(self, env_name: str, filename: str, default: str) -> Tuple[str, str]:
+        value = os.getenv(env_name)
+        if value:
+            return value, f"env:{env_name}"
+        path = self._find(filename)
+        if path is None:
+            return default, "default"
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read(), path
+
+    def _load(self) -> PromptRevision:
+        self._mtimes = self._file_mtimes()
+        core_prompt, core_source = self._read("CORE_PROMPT", "core_prompt.txt", DEFAULT_CORE_PROMPT)
+        additional_prompt, additional_source = self._read("ADDITIONAL_PROMPT", "additional_prompt.txt", "")
+        return PromptRevision(core_prompt, additional_prompt, f"{core_source}, {additional_source}")
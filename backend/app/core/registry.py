@@ -0,0 +1,186 @@
+import os
+import threading
+from typing import List, Optional
+
+from app.core.log import log_event
+from app.core.metrics import Counter, Gauge
+from app.core.prompt_registry import PromptRegistry
+from app.core.upstream import governor_stats
+from app.services.youtube_service import YouTubeService
+from app.services.analysis_service import AnalysisService
+from app.services.judge_jobs import JudgeJobManager
+from app.services.comment_store import CommentStore
+
+
+class ServiceRegistry:
+    """アプリケーションの寿命にわたって共有するサービスを保持"""
+
+    def __init__(self):
+        self._youtube_service: Optional[YouTubeService] = None
+        self._analysis_service: Optional[AnalysisService] = None
+        self._judge_jobs: Optional[JudgeJobManager] = None
+        self._comment_store: Optional[CommentStore] = None
+        self._prompt_registry: Optional[PromptRegistry] = None
+        self._lock = threading.RLock()
+
+    @property
+    def youtube_service(self) -> YouTubeService:
+        if self._youtube_service is None:
+            with self._lock:
+                if self._youtube_service is None:
+                    api_key = os.getenv("YOUTUBE_API_KEY")
+                    if not api_key:
+                        raise LookupError("YouTube API キーが設定されていません")
+                    self._youtube_service = YouTubeService(api_key)
+        return self._youtube_service
+
+    @property
+    def analysis_service(self) -> AnalysisService:
+        if self._analysis_service is None:
+            with self._lock:
+                if self._analysis_service is None:
+                    api_key = os.getenv("OPENAI_API_KEY")
+                    if not api_key:
+                        raise LookupError("OpenAI API キーが設定されていません")
+                    service = AnalysisService(api_key, prompts=self.prompt_registry)
+                    # comment_id付きの分析結果をローカルストアへ保存
+                    service.result_listeners.append(
+                        lambda request, result, version: self.comment_store.save_analysis(request.comment_id, version, result)
+                    )
+                    self._analysis_service = service
+        return self._analysis_service
+
+    @property
+    def prompt_registry(self) -> PromptRegistry:
+        if self._prompt_registry is None:
+            with self._lock:
+                if self._prompt_registry is None:
+                    self._prompt_registry = PromptRegistry.from_env()
+        return self._prompt_registry
+
+    @property
+    def comment_store(self) -> CommentStore:
+        if self._comment_store is None:
+            with self._lock:
+                if self._comment_store is None:
+                    self._comment_store = CommentStore.from_env()
+        return self._comment_store
+
+    @property
+    def judge_jobs(self) -> JudgeJobManager:
+        if self._judge_jobs is None:
+            with self._lock:
+                if self._judge_jobs is None:
+                    self._judge_jobs = JudgeJobManager.from_env(
+                        lambda: self.youtube_service,
+                        lambda: self.analysis_service,
+                        self.comment_store
+                    )
+        return self._judge_jobs
+
+    def startup(self) -> None:
+        """APIキーが設定されているサービスを起動時に構築し、中断された判定ジョブを再開"""
+        ready = True
+        for name in ("youtube_service", "analysis_service"):
+            try:
+                getattr(self, name)
+            except LookupError as e:
+                ready = False
+                log_event("service_skipped", level="warning", service=name, detail=str(e))
+
+        if ready:
+            resumed = self.judge_jobs.resume()
+            if resumed:
+                log_event("judge_jobs_resumed", jobs=len(resumed))
+
+    def collect_metrics(self) -> List[Counter]:
+        """構築済みのサービスが集計している値をスクレイプ時にメトリクスへ変換（未構築のサービスは構築しない）"""
+        metrics: List[Counter] = []
+        analysis = self._analysis_service
+        if analysis is not None:
+            if analysis.cache is not None:
+                stats = analysis.cache.stats()
+                lookups = Counter("analysis_cache_lookups_total", "Analysis cache lookups by result", ("result",))
+                lookups.set_total(stats["hits"] - stats["disk_hits"], result="hit")
+                lookups.set_total(stats["disk_hits"], result="disk_hit")
+                lookups.set_total(stats["misses"], result="miss")
+                entries = Gauge("analysis_cache_entries", "Entries in the in-memory analysis cache")
+                entries.set(stats["entries"])
+                metrics += [lookups, entries]
+            parses = Counter("llm_response_parse_total", "LLM responses by parse outcome", ("result",))
+            for result, count in analysis.parse_stats.items():
+                parses.set_total(count, result=result)
+            coalescing = analysis._inflight.stats()
+            inflight = Gauge("analysis_in_flight", "Distinct LLM analyses currently running")
+            inflight.set(coalescing["in_flight"])
+            coalesced = Counter("analysis_coalesced_total", "Analyses that joined an identical in-flight analysis")
+            coalesced.set_total(coalescing["coalesced"])
+            metrics += [parses, inflight, coalesced]
+            sessions = Gauge("protest_sessions_active", "Protest conversations held server-side")
+            sessions.set(analysis.protest_sessions.stats()["active"])
+            metrics.append(sessions)
+            routes = Counter("llm_routes_total", "LLM requests routed to each model tier", ("task", "tier"))
+            for (task, tier), count in analysis.router.route_counts().items():
+                routes.set_total(count, task=task, tier=tier)
+            router_stats = analysis.router.stats()
+            fallbacks = Counter("llm_fallbacks_total", "LLM calls retried on a fallback model")
+            fallbacks.set_total(router_stats["fallbacks"])
+            hedges = Counter("llm_hedged_requests_total", "Hedged LLM calls by whether the hedge answered first", ("result",))
+            hedges.set_total(router_stats["hedge_wins"], result="won")
+            hedges.set_total(router_stats["hedged"] - router_stats["hedge_wins"], result="lost")
+            metrics += [routes, fallbacks, hedges]
+            if analysis.pre_classifier is not None:
+                decisions = Counter("pre_classifier_decisions_total", "Comments judged locally or escalated to the LLM", ("result",))
+                stats = analysis.pre_classifier.stats()
+                decisions.set_total(stats["local"], result="local")
+                decisions.set_total(stats["escalated"], result="escalated")
+                metrics.append(decisions)
+
+        youtube = self._youtube_service
+        if youtube is not None:
+            stats = youtube.cache.stats()
+            lookups = Counter("youtube_cache_lookups_total", "YouTube response cache lookups by result", ("result",))
+            lookups.set_total(stats["hits"], result="hit")
+            lookups.set_total(stats["misses"], result="miss")
+            lookups.set_total(stats["revalidated"], result="revalidated")
+            quota = Gauge("youtube_quota_used_units", "YouTube API quota units used today")
+            quota.set(youtube.quota.used(youtube.key_id))
+            prefetch = youtube.prefetch_snapshot()
+            prefetches = Counter("youtube_prefetch_total", "Speculative YouTube fetches by result", ("result",))
+            prefetches.set_total(prefetch["buffer"]["hits"], result="used")
+            prefetches.set_total(prefetch["buffer"]["expired"] + prefetch["buffer"]["evicted"], result="wasted")
+            prefetches.set_total(prefetch["failed"], result="failed")
+            prefetches.set_total(prefetch["skipped_quota"], result="skipped_quota")
+            prefetches.set_total(prefetch["skipped_busy"], result="skipped_busy")
+            metrics += [lookups, quota, prefetches]
+
+        pending = Gauge("upstream_pending", "Upstream calls admitted and not yet finished", ("upstream",))
+        shed = Counter("upstream_shed_total", "Upstream calls rejected because too many were pending", ("upstream",))
+        circuit = Gauge("upstream_circuit_open", "1 while the upstream circuit breaker is open or half open", ("upstream",))
+        for name, stats in governor_stats().items():
+            pending.set(stats["pending"], upstream=name)
+            shed.set_total(stats["shed"], upstream=name)
+            circuit.set(0 if stats["circuit"] == "closed" else 1, upstream=name)
+        metrics += [pending, shed, circuit]
+
+        if self._judge_jobs is not None:
+            depth = Gauge("judge_job_queue_depth", "Comments waiting for analysis per running judge job", ("job_id",))
+            for job_id, size in self._judge_jobs.queue_depths().items():
+                depth.set(size, job_id=job_id)
+            metrics.append(depth)
+        return metrics
+
+    async def shutdown(self) -> None:
+        """共有している接続を閉じる"""
+        if self._judge_jobs is not None:
+            await self._judge_jobs.shutdown()
+            self._judge_jobs = None
+        if self._youtube_service is not None:
+            self._youtube_service.close()
+            self._youtube_service = None
+        if self._analysis_service is not None:
+            await self._analysis_service.close()
+            self._analysis_service = None
+        if self._comment_store is not None:
+            self._comment_store.close()
+            self._comment_store = None
@@ -0,0 +1,20 @@
+import json
+from typing import Any, Optional
+
+
+def format_sse(data: Any, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Server-Sent Events の1イベント分の文字列を生成"""
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, default=str)
+    message = ""
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    if event is not None:
+        message += f"event: {event}\n"
+    for line in payload.splitlines() or [""]:
+        message += f"data: {line}\n"
+    return message + "\n"
+
+
+def format_sse_comment(text: str = "keep-alive") -> str:
+    """接続維持用のコメント行を生成"""
+    return f": {text}\n\n"
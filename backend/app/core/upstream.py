@@ -0,0 +1,292 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.log import log_event
+from app.core.metrics import UPSTREAM_REQUEST_DURATION, UPSTREAM_RETRIES
+
+# 上流API（OpenAI・YouTube）の呼び出し制御
+# APIキーごとのトークンバケットで送信レートを抑え、429/5xx はRetry-Afterを尊重した
+# ジッター付き指数バックオフで再試行する。失敗が続いたらサーキットブレーカーを開いて
+# 即座に失敗させ、待ち行列が深すぎる場合は新しい呼び出しを受け付けずに503で返す。
+
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """上流APIが一時的に利用できない（再試行までの目安秒数を持つ）"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット（予約方式：待つべき秒数を返す）"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def penalize(self, seconds: float) -> None:
+        """429を受けたときにバケットを空にして、指定秒数は新しい呼び出しを待たせる"""
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+            self._updated = time.monotonic()
+
+
+class CircuitBreaker:
+    """連続失敗で開き、一定時間後に1件だけ試行（半開）して回復を確認する"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "closed":
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if self.state == "open" and elapsed >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            raise UpstreamUnavailable("上流APIが一時的に利用できません", max(1.0, self.reset_timeout - elapsed))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self.state = "closed"
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+def classify_error(error: BaseException) -> Tuple[bool, Optional[float]]:
+    """(再試行できるか, Retry-After秒) を返す（OpenAI・googleapiclient の例外に対応）"""
+    status = getattr(error, "status_code", None)
+    headers: Any = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        headers = getattr(response, "headers", None)
+    resp = getattr(error, "resp", None)
+    if status is None and resp is not None:
+        # googleapiclient.errors.HttpError
+        status = getattr(resp, "status", None)
+        headers = resp
+        if status == 403 and b"rateLimitExceeded" in (getattr(error, "content", b"") or b""):
+            status = 429
+
+    retry_after = None
+    if headers is not None:
+        try:
+            value = headers.get("retry-after") or headers.get("Retry-After")
+            retry_after = float(value) if value is not None else None
+        except (TypeError, ValueError, AttributeError):
+            retry_after = None
+
+    if status is not None:
+        return int(status) in RETRYABLE_STATUSES, retry_after
+    # ステータスのない接続エラー（APIConnectionError など）は再試行する
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "ServerNotFoundError"), retry_after
+
+
+def _outcome(error: BaseException) -> str:
+    """メトリクス用の失敗の種類（HTTPステータスがあればそれ、なければ例外名）"""
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "resp", None) is not None:
+        status = getattr(error.resp, "status", None)
+    return str(status) if status is not None else type(error).__name__
+
+
+class UpstreamGovernor:
+    """1つの上流API・APIキーに対する呼び出しの流量制御"""
+
+    def __init__(self, name: str, rate: float, burst: float, max_pending: int, max_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 20.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "shed": 0, "rejected_open": 0}
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["shed"] += 1
+                # 待ち行列を送信レートで捌き切るまでの時間を目安として返す
+                raise UpstreamUnavailable(f"{self.name} へのリクエストが混み合っています", max(1.0, self._pending / self.bucket.rate))
+            self._pending += 1
+            self._stats["calls"] += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _before_attempt(self) -> float:
+        try:
+            self.breaker.before_call()
+        except UpstreamUnavailable:
+            with self._lock:
+                self._stats["rejected_open"] += 1
+            raise
+        return self.bucket.reserve()
+
+    def _after_failure(self, error: BaseException, attempt: int) -> Optional[float]:
+        """失敗を記録し、再試行するなら待ち時間を返す"""
+        retryable, retry_after = classify_error(error)
+        if not retryable and not isinstance(error, TimeoutError):
+            # 400番台など上流が応答できている失敗はブレーカーの対象外
+            self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        with self._lock:
+            self._stats["failures"] += 1
+        if not retryable or attempt >= self.max_retries:
+            return None
+        if retry_after is not None:
+            self.bucket.penalize(retry_after)
+            delay = retry_after
+        else:
+            # フルジッター付き指数バックオフ
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if delay > self.max_delay:
+            return None
+        with self._lock:
+            self._stats["retries"] += 1
+        UPSTREAM_RETRIES.inc(upstream=self.name)
+        log_event("upstream_retry", upstream=self.name, attempt=attempt + 1, delay=round(delay, 3), error=type(error).__name__)
+        return delay
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], target: str = "") -> Any:
+        """非同期呼び出しを制御付きで実行（target はメトリクスのラベル：モデル名・エンドポイント名）"""
+        self._admit()
+        try:
+            attempt = 0
+            while True:
+                wait = self._before_attempt()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                started = time.perf_counter()
+                try:
+                    result = await fn()
+                except Exception as e:
+                    UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - started, upstream=self.name, target=target, outcome=_outcome(e))
+                    delay = self._after_failure(e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - started, upstream=self.name, target=target, outcome="ok")
+                self.breaker.record_success()
+                return result
+        finally:
+            self._release()
+
+    def call_sync(self, fn: Callable[[], Any], target: str = "") -> Any:
+        """スレッドから呼ぶ同期呼び出しを制御付きで実行"""
+        self._admit()
+        try:
+            attempt = 0
+            while True:
+                wait = self._before_attempt()
+                if wait > 0:
+                    time.sleep(wait)
+                started = time.perf_counter()
+                try:
+                    result = fn()
+                except Exception as e:
+                    UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - started, upstream=self.name, target=target, outcome=_outcome(e))
+                    delay = self._after_failure(e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - started, upstream=self.name, target=target, outcome="ok")
+                self.breaker.record_success()
+                return result
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "rate_per_second": self.bucket.rate,
+                "circuit": self.breaker.state
+            }
+
+
+_governors: Dict[Tuple[str, str], UpstreamGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(name: str, key_id: str) -> UpstreamGovernor:
+    """上流API・APIキーごとに共有する制御オブジェクトを返す（設定は環境変数から読む）
+
+    環境変数は {NAME}_RATE_LIMIT_RPS / {NAME}_RATE_LIMIT_BURST / {NAME}_MAX_PENDING と、
+    共通の UPSTREAM_MAX_RETRIES / UPSTREAM_BACKOFF_BASE_SECONDS / UPSTREAM_BACKOFF_MAX_SECONDS /
+    UPSTREAM_CIRCUIT_FAILURES / UPSTREAM_CIRCUIT_RESET_SECONDS。
+    """
+    with _governors_lock:
+        governor = _governors.get((name, key_id))
+        if governor is None:
+            prefix = name.upper()
+            rate = float(os.getenv(f"{prefix}_RATE_LIMIT_RPS", "20"))
+            governor = UpstreamGovernor(
+                name=name,
+                rate=rate,
+                burst=float(os.getenv(f"{prefix}_RATE_LIMIT_BURST", str(rate * 2))),
+                max_pending=int(os.getenv(f"{prefix}_MAX_PENDING", "200")),
+                max_retries=int(os.getenv("UPSTREAM_MAX_RETRIES", "3")),
+                base_delay=float(os.getenv("UPSTREAM_BACKOFF_BASE_SECONDS", "0.5")),
+                max_delay=float(os.getenv("UPSTREAM_BACKOFF_MAX_SECONDS", "20")),
+                failure_threshold=int(os.getenv("UPSTREAM_CIRCUIT_FAILURES", "5")),
+                reset_timeout=float(os.getenv("UPSTREAM_CIRCUIT_RESET_SECONDS", "30"))
+            )
+            _governors[(name, key_id)] = governor
+        return governor
+
+
+def governor_stats() -> Dict[str, Dict[str, Any]]:
+    with _governors_lock:
+        governors = dict(_governors)
+    return {f"{name}:{key_id}": governor.stats() for (name, key_id), governor in governors.items()}
@@ -0,0 +1,238 @@
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Type, Union
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # 未インストールなら pydantic の JSON シリアライザーを使う
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # 未インストールなら gzip のみ
+    brotli = None
+
+# 一覧系レスポンスの高速なエンコードと圧縮
+# FastAPI 既定の jsonable_encoder を通さずにモデルを直接JSONにし、fields= で返す項目を絞り、
+# format=ndjson（または Accept: application/x-ndjson）では1行1件のNDJSONで逐次返す。
+# 圧縮は Accept-Encoding に応じて brotli（インストール時）か gzip を選ぶ。
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# NDJSON で1回に送る行数（1行ごとに送ると圧縮のフラッシュが増えて縮まない）
+_NDJSON_LINES_PER_CHUNK = 20
+_ORJSON_OPTIONS = orjson.OPT_UTC_Z if orjson is not None else 0
+
+
+def _plain(content: Any, include: Optional[Any]) -> Any:
+    if isinstance(content, BaseModel):
+        return content.model_dump(include=include)
+    if isinstance(content, (list, tuple)):
+        return [_plain(item, include) for item in content]
+    if isinstance(content, dict):
+        return {key: _plain(value, include) for key, value in content.items()}
+    return content
+
+
+def encode(content: Any, include: Optional[Any] = None) -> bytes:
+    """モデル・リスト・辞書をJSONのバイト列にする（include はモデル、またはリストの各要素に適用）"""
+    if orjson is not None:
+        return orjson.dumps(_plain(content, include), option=_ORJSON_OPTIONS)
+    return to_json(content if include is None else _plain(content, include))
+
+
+def encode_plain(content: Any) -> bytes:
+    """辞書・リスト・文字列・数値だけからなる値をそのままJSONにする（モデルを含まないことが分かっている場合）"""
+    if orjson is not None:
+        return orjson.dumps(content, option=_ORJSON_OPTIONS)
+    return to_json(content)
+
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Optional[Set[str]]:
+    """fields=id,text,... を検証して返す項目名の集合にする（未指定なら None）"""
+    if not fields:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(model.model_fields)
+    if unknown:
+        raise ValueError(f"不明なフィールドです: {', '.join(sorted(unknown))}（指定できるもの: {', '.join(model.model_fields)}）")
+    return names or None
+
+
+class WireResponse(Response):
+    """encode() でシリアライズするJSONレスポンス"""
+
+    media_type = "application/json"
+
+    def __init__(self, content: Any, status_code: int = 200, headers: Optional[dict] = None, include: Optional[Any] = None):
+        self.include = include
+        super().__init__(content, status_code=status_code, headers=headers)
+
+    def render(self, content: Any) -> bytes:
+        return encode(content, self.include)
+
+
+def wants_ndjson(request: Request, output_format: Optional[str]) -> bool:
+    if output_format:
+        if output_format not in ("json", "ndjson"):
+            raise ValueError("format には json または ndjson を指定してください")
+        return output_format == "ndjson"
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(items: Iterable[Any], trailer: Optional[dict] = None, include: Optional[Set[str]] = None, plain: bool = False) -> StreamingResponse:
+    """1行1件で返し、ページ情報（次ページのトークンなど）は最後の行に置く（plain は各行がモデルを含まない場合）"""
+    async def lines():
+        chunk: List[bytes] = []
+        for item in items:
+            chunk.append(encode_plain(item) if plain else encode(item, include))
+            if len(chunk) >= _NDJSON_LINES_PER_CHUNK:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if trailer is not None:
+            chunk.append(encode(trailer))
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+def list_response(request: Request, content: Union[BaseModel, list], item_model: Type[BaseModel], list_field: Optional[str] = None,
+                  fields: Optional[str] = None, output_format: Optional[str] = None) -> Response:
+    """一覧のレスポンスを fields= の射影・NDJSON の指定に従って返す（list_field は一覧を持つ項目名）"""
+    item_fields = parse_fields(fields, item_model)
+    items = getattr(content, list_field) if list_field else content
+    if wants_ndjson(request, output_format):
+        trailer = content.model_dump(exclude={list_field}) if list_field else None
+        return ndjson_response(items, trailer, item_fields)
+    if item_fields is None or not list_field:
+        return WireResponse(content, include=item_fields)
+    include = {name: True for name in type(content).model_fields if name != list_field}
+    include[list_field] = {"__all__": item_fields}
+    return WireResponse(content, include=include)
+
+
+def rows_response(request: Request, rows: Callable[[Optional[Set[str]]], Iterable[dict]], item_model: Type[BaseModel],
+                  envelope: Optional[Dict[str, Any]] = None, list_field: Optional[str] = None,
+                  fields: Optional[str] = None, output_format: Optional[str] = None) -> Response:
+    """列指向の一覧（rows(fields) が1件ごとの辞書を返す）をモデルを経由せずに list_response と同じ形で返す"""
+    item_fields = parse_fields(fields, item_model)
+    if wants_ndjson(request, output_format):
+        return ndjson_response(rows(item_fields), envelope if list_field else None, plain=True)
+    items = list(rows(item_fields))
+    body = {list_field: items, **(envelope or {})} if list_field else items
+    return Response(encode_plain(body), media_type="application/json")
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding の q 値から br / gzip を選ぶ（同じ q 値なら br を優先）"""
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip()] = quality
+    candidates = [
+        (weights.get(name, weights.get("*", 0.0)), -index, name)
+        for index, name in enumerate(supported)
+    ]
+    quality, _, name = max(candidates)
+    return name if quality > 0 else None
+
+
+class CompressionMiddleware:
+    """レスポンスを brotli / gzip で圧縮するASGIミドルウェア（SSE・小さい応答・圧縮済みの応答はそのまま）"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            compressor = state["compressor"]
+            if compressor is None:
+                start = state["start"]
+                headers = MutableHeaders(raw=list(start["headers"]))
+                if ("content-encoding" in headers
+                        or headers.get("content-type", "").startswith("text/event-stream")
+                        or (not more_body and len(body) < self.minimum_size)):
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = state["compressor"] = _Brotli(self.brotli_quality) if encoding == "br" else _Gzip(self.gzip_level)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    data = compressor.compress(body) + compressor.flush()
+                else:
+                    data = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(data))
+                await send({**start, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            data = compressor.compress(body) + (compressor.flush() if more_body else compressor.finish())
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
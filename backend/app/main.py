@@ -1,16 +1,35 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 
-from app.api import videos, comments, prompts
+from app.api import videos, comments, prompts, admin, jobs
+from app.core.metrics import REGISTRY, MetricsMiddleware
+from app.core.registry import ServiceRegistry
+from app.core.wire import CompressionMiddleware
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """サービスを起動時に一度だけ構築し、終了時に接続を閉じる"""
+    services = ServiceRegistry()
+    services.startup()
+    app.state.services = services
+    REGISTRY.add_collector(services.collect_metrics)
+    try:
+        yield
+    finally:
+        REGISTRY.remove_collector(services.collect_metrics)
+        await services.shutdown()
+
 app = FastAPI(
     title="コメント審判 API",
     description="YouTube動画のコメント分析API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -21,14 +40,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")),
+    gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+)
+
+app.add_middleware(MetricsMiddleware, log_requests=os.getenv("LOG_REQUESTS", "true").lower() in ("1", "true", "yes"))
+
 app.include_router(videos.router, prefix="/api/videos", tags=["videos"])
 app.include_router(comments.router, prefix="/api/comments", tags=["comments"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
 app.include_router(prompts.router, prefix="/api/prompts", tags=["prompts"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "service": "comment-umpire-api"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus テキスト形式のメトリクス"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
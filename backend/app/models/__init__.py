@@ -1,4 +1,4 @@
 from .comment import Comment, VideoInfo, AnalysisRequest, AnalysisResult
-from .response import CommentsResponse, ErrorResponse
+from .response import CommentsResponse, CommentThread, ThreadsResponse, ErrorResponse
 
-__all__ = ["Comment", "VideoInfo", "AnalysisRequest", "AnalysisResult", "CommentsResponse", "ErrorResponse"]
\ No newline at end of file
+__all__ = ["Comment", "VideoInfo", "AnalysisRequest", "AnalysisResult", "CommentsResponse", "CommentThread", "ThreadsResponse", "ErrorResponse"]
\ No newline at end of file
@@ -10,6 +10,7 @@ class Comment(BaseModel):
     like_count: int
     reply_count: int
     parent_id: Optional[str] = None
+    cluster_id: Optional[str] = None  # 近似重複のコメントに共通のID
 
 class VideoInfo(BaseModel):
     video_id: str
@@ -18,9 +19,23 @@ class VideoInfo(BaseModel):
     thumbnail_url: str
     published_at: datetime
 
+class BulkVideoRequest(BaseModel):
+    urls: List[str]  # 動画URL・動画ID・チャンネルURL・再生リストURL
+
+class BulkVideoItem(BaseModel):
+    index: int  # 入力の位置（チャンネル・再生リストは展開した動画ごとに同じ位置）
+    source: str
+    video_id: Optional[str] = None
+    video: Optional[VideoInfo] = None
+    error: Optional[str] = None
+
+class BulkVideoResponse(BaseModel):
+    items: List[BulkVideoItem]
+
 class AnalysisRequest(BaseModel):
     comment_text: str
     context_comments: Optional[List[Comment]] = None
+    comment_id: Optional[str] = None  # 指定するとローカルストアに結果を保存
 
 class AnalysisResult(BaseModel):
     category: List[str]
@@ -45,4 +60,29 @@ class ProtestRequest(BaseModel):
 class ProtestResponse(BaseModel):
     umpire_response: str
     judgment_changed: bool
-    new_result: Optional[AnalysisResult] = None
\ No newline at end of file
+    new_result: Optional[AnalysisResult] = None
+
+class ProtestSessionRequest(BaseModel):
+    comment_text: str
+    original_result: AnalysisResult
+
+class ProtestTurnRequest(BaseModel):
+    protest_message: str
+
+class ProtestSessionInfo(BaseModel):
+    session_id: str
+    current_result: AnalysisResult
+    conversation_history: List[ConversationMessage]
+    expires_in_seconds: float
+
+class BatchAnalysisRequest(BaseModel):
+    requests: List[AnalysisRequest]
+
+class BatchAnalysisItem(BaseModel):
+    index: int
+    result: Optional[AnalysisResult] = None
+    error: Optional[str] = None
+    cluster_id: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[BatchAnalysisItem]
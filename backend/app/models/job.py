@@ -0,0 +1,38 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional, List
+
+from .comment import AnalysisResult
+
+class JudgeJobRequest(BaseModel):
+    include_replies: bool = True
+    max_comments: Optional[int] = None
+
+class JudgeJob(BaseModel):
+    job_id: str
+    video_id: str
+    status: str  # 'pending' | 'running' | 'completed' | 'failed' | 'cancelled'
+    include_replies: bool
+    max_comments: Optional[int] = None
+    pages_done: int
+    comments_seen: int
+    analyzed: int
+    failed: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class JudgeJobResult(BaseModel):
+    seq: int
+    comment_id: str
+    parent_id: Optional[str] = None
+    author: str
+    text: str
+    published_at: datetime
+    result: Optional[AnalysisResult] = None
+    error: Optional[str] = None
+    cluster_id: Optional[str] = None
+
+class JudgeJobResultsResponse(BaseModel):
+    results: List[JudgeJobResult]
+    next_after: Optional[int] = None
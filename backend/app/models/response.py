@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from .comment import Comment
 
 class CommentsResponse(BaseModel):
@@ -7,6 +7,38 @@ class CommentsResponse(BaseModel):
     next_page_token: Optional[str] = None
     total_count: Optional[int] = None
 
+class CommentThread(BaseModel):
+    comment: Comment
+    replies: List[Comment]
+
+class ThreadsResponse(BaseModel):
+    threads: List[CommentThread]
+    next_page_token: Optional[str] = None
+
 class ErrorResponse(BaseModel):
     error: str
-    detail: Optional[str] = None
\ No newline at end of file
+    detail: Optional[str] = None
+
+class OffenderCount(BaseModel):
+    author: str
+    out: int
+
+class TimeBucketCount(BaseModel):
+    start: str  # 投稿日時（UTC）の先頭部分：日単位なら YYYY-MM-DD、時間単位なら YYYY-MM-DDTHH
+    analyzed: int
+    out: int
+
+class VideoAggregatesResponse(BaseModel):
+    video_id: str
+    bucket: str
+    analyzed: int
+    safe: int
+    out: int
+    out_ratio: float
+    counter: int
+    categories: Dict[str, int]
+    graham_hierarchy: Dict[str, int]
+    logical_fallacies: Dict[str, int]
+    validity: Dict[str, int]
+    top_offenders: List[OffenderCount]
+    time_buckets: List[TimeBucketCount]
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.models.comment import AnalysisRequest, AnalysisResult
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用にコメント本文を正規化（全角半角・空白の揺れを吸収）"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def make_cache_key(request: AnalysisRequest, prompt_version: str, model: str, temperature: float) -> str:
+    """分析結果を左右する入力すべてからキャッシュキーを生成"""
+    context = [normalize_text(c.text) for c in request.context_comments or []]
+    payload = json.dumps(
+        [normalize_text(request.comment_text), context, prompt_version, model, temperature],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """メモリ上のLRU層と任意のSQLite層からなる分析結果キャッシュ"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, AnalysisResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["AnalysisCache"]:
+        """環境変数から設定を読み込む（サイズ0で無効化）"""
+        max_entries = int(os.getenv("ANALYSIS_CACHE_SIZE", "1024"))
+        if max_entries <= 0:
+            return None
+        return cls(
+            max_entries=max_entries,
+            ttl_seconds=float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400")),
+            db_path=os.getenv("ANALYSIS_CACHE_DB") or None
+        )
+
+    def get(self, key: str) -> Optional[AnalysisResult]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result.model_copy(deep=True)
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, expires_at FROM analysis_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    result = AnalysisResult.model_validate_json(row[0])
+                    self._store(key, row[1], result)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return result.model_copy(deep=True)
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, result: AnalysisResult) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, expires_at, result.model_copy(deep=True))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, result, expires_at) VALUES (?, ?, ?)",
+                    (key, result.model_dump_json(), expires_at)
+                )
+                self._db.commit()
+
+    def _store(self, key: str, expires_at: float, result: AnalysisResult) -> None:
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """全エントリを破棄（プロンプト変更時に使用）"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM analysis_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "disk_enabled": self._db is not None
+            }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
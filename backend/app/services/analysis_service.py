@@ -1,115 +1,587 @@
-import json
+import asyncio
 import os
-from typing import List, Tuple
-from openai import OpenAI
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 
-from app.models.comment import Comment, AnalysisRequest, AnalysisResult
+from app.core.metrics import ANALYSIS_STAGE_DURATION, LLM_TOKENS, timed
+from app.core.singleflight import AsyncSingleFlight
+from app.core.prompt_registry import PromptRegistry, PromptRevision
+from app.core.log import log_event
+from app.core.upstream import UpstreamGovernor, UpstreamUnavailable, get_governor
+from app.models.comment import Comment, AnalysisRequest, AnalysisResult, BatchAnalysisItem, ConversationMessage, ProtestRequest, ProtestResponse
+from app.services.analysis_cache import AnalysisCache, make_cache_key
+from app.services.context_budget import ContextBudget, HistorySelection, count_tokens, truncate_tokens
+from app.services.dedup import cluster_texts
+from app.services.json_stream import IncrementalJSONParser
+from app.services.llm_client import create_llm_client, create_provider_client
+from app.services.model_router import DEFAULT_PROVIDER, ModelRouter, Route, split_model
+from app.services.youtube_cache import api_key_fingerprint
+from app.services.pre_classifier import PreClassifier
+from app.services.protest_sessions import ProtestSession, ProtestSessionStore
+from app.services.structured_output import (
+    ANALYSIS_OPTIONAL, ANALYSIS_PROPERTIES, ANALYSIS_RESPONSE_FORMAT, BATCH_RESPONSE_FORMAT,
+    PROTEST_OPTIONAL, PROTEST_PROPERTIES, PROTEST_RESPONSE_FORMAT,
+    field_request, fill_defaults, protest_required, repair_json, validate_analysis, validate_protest
+)
+
+ANALYSIS_TEMPERATURE = 0.3
+ANALYSIS_SYSTEM_PROMPT = "あなたはYouTubeコメントを分析する専門家です。指定された形式でJSON応答を返してください。"
+BATCH_ITEMS_MARKER = "【分析対象コメント一覧】"
+BATCH_OUTPUT_FORMAT = (
+    "【出力形式（複数コメント）】\n"
+    f"{BATCH_ITEMS_MARKER}の各コメントについて上記形式のJSONオブジェクトを作成し、一覧の番号を\"index\"として加えてください。\n"
+    "文脈情報は各コメント直下に記載されたもののみを考慮してください。\n"
+    "次の形式で、すべてのコメントの結果をまとめて返してください：\n"
+    "{\"results\": [{\"index\": 0, \"category\": [...], ...}, {\"index\": 1, ...}]}"
+)
+PROTEST_TEMPERATURE = 0.5
+PROTEST_SYSTEM_PROMPT = "あなたは経験豊富なプロ野球の主審です。判定には絶対的な自信を持ち、論理的で公正な判断を下します。"
 
 class AnalysisService:
-    def __init__(self, openai_api_key: str):
-        print(f"Initializing AnalysisService with API key: {openai_api_key[:10]}...")
-        self.client = OpenAI(api_key=openai_api_key)
-        self.core_prompt, self.additional_prompt = self.load_prompts()
-        print(f"Loaded prompts: core={len(self.core_prompt)} chars, additional={len(self.additional_prompt)} chars")
-    
-    def load_prompts(self) -> Tuple[str, str]:
-        """プロンプトファイルを読み込み"""
-        try:
-            with open("core_prompt.txt", "r", encoding="utf-8") as f:
-                core_prompt = f.read()
-        except FileNotFoundError:
-            core_prompt = "コアプロンプトが見つかりません"
+    def __init__(self, openai_api_key: str, client=None, max_concurrency: Optional[int] = None, request_timeout: Optional[float] = None, cache: Optional[AnalysisCache] = None, prompts: Optional[PromptRegistry] = None, pre_classifier: Optional[PreClassifier] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "32"))
+        self.request_timeout = request_timeout or float(os.getenv("ANALYSIS_TIMEOUT_SECONDS", "60"))
+        self.client = client or create_llm_client(openai_api_key, timeout=self.request_timeout)
+        # 同時に実行中のLLM呼び出し数を制限する
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # APIキーごとの送信レート制限・再試行・サーキットブレーカー
+        self.governor = get_governor("openai", api_key_fingerprint(openai_api_key or ""))
+        # リクエストごとのモデル選択・代替モデル・ヘッジ（代替プロバイダーのクライアントは初回使用時に生成）
+        self.router = ModelRouter.from_env()
+        self._providers: Dict[str, Tuple[object, UpstreamGovernor]] = {DEFAULT_PROVIDER: (self.client, self.governor)}
+        self.cache = cache if cache is not None else AnalysisCache.from_env()
+        # 同じ入力（本文・文脈・プロンプト）の分析が同時に来たらLLM呼び出しを1回にまとめる
+        self._inflight = AsyncSingleFlight()
+        # 明らかに無害なコメントはLLMを呼ばずにローカルで判定する
+        self.pre_classifier = pre_classifier if pre_classifier is not None else PreClassifier.from_env()
+        # 1回のLLM呼び出しにまとめるコメント数と、1リクエストで受け付ける最大件数
+        self.batch_chunk_size = max(1, int(os.getenv("ANALYSIS_BATCH_CHUNK_SIZE", "10")))
+        self.batch_max_items = int(os.getenv("ANALYSIS_BATCH_MAX_ITEMS", "200"))
+        # 返信の文脈と抗議の会話履歴をトークン予算内に収める
+        self.context_budget = ContextBudget.from_env()
+        # サーバー側で保持する抗議の会話（クライアントは新しい抗議だけを送る）
+        self.protest_sessions = ProtestSessionStore.from_env()
+        # 近似重複のコメントは代表1件だけを分析して結果を共有する
+        self.dedup_enabled = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+        # スキーマ付きのJSON出力を要求し、不足項目の再要求は repair_max_retries 回まで
+        self.structured_output = os.getenv("STRUCTURED_OUTPUT_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.repair_max_retries = int(os.getenv("ANALYSIS_REPAIR_MAX_RETRIES", "1"))
+        self.parse_stats = {"parsed": 0, "repaired": 0, "reasked": 0, "failed": 0}
+        # comment_id付きの分析が完了したときに呼ばれるリスナー（結果の保存など）
+        self.result_listeners: List[Callable[[AnalysisRequest, AnalysisResult, str], None]] = []
+        self.prompts = prompts or PromptRegistry.from_env()
+        # プロンプトが変わったら古いプロンプトによる分析結果を破棄
+        self.prompts.add_listener(self._on_prompt_revision)
+        revision = self.prompts.current
+        log_event("prompts_loaded", core_chars=len(revision.core_prompt), additional_chars=len(revision.additional_prompt), version=revision.version)
+    
+    @property
+    def prompt_version(self) -> str:
+        return self.prompts.current.version
+    
+    def _on_prompt_revision(self, revision: PromptRevision) -> None:
+        if self.cache is not None:
+            self.cache.clear()
+    
+    def reload_prompts(self) -> bool:
+        """プロンプトを再読み込み（変更があればリスナー経由で分析キャッシュを破棄）"""
+        return self.prompts.reload()
+    
+    def _format_kwargs(self, response_format: Optional[dict]) -> dict:
+        if self.structured_output and response_format is not None:
+            return {"response_format": response_format}
+        return {}
+    
+    def _provider(self, provider: str) -> Tuple[object, UpstreamGovernor]:
+        """プロバイダーごとのクライアントと流量制御"""
+        if provider not in self._providers:
+            client, api_key = create_provider_client(provider, timeout=self.request_timeout)
+            self._providers[provider] = (client, get_governor(provider, api_key_fingerprint(api_key)))
+        return self._providers[provider]
+    
+    async def _complete_once(self, spec: str, messages: List[dict], temperature: float, response_format: Optional[dict]) -> str:
+        """1つのモデルを同時実行数・送信レート・タイムアウトを制御して呼び出す（一時的なエラーは再試行）"""
+        provider, model = split_model(spec)
+        client, governor = self._provider(provider)
+        
+        async def attempt():
+            async with self._semaphore:
+                return await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        **self._format_kwargs(response_format)
+                    ),
+                    timeout=self.request_timeout
+                )
         
+        started = time.perf_counter()
+        response = await governor.call(attempt, target=model)
+        self.router.record_call(spec, time.perf_counter() - started)
+        self._record_usage(model, getattr(response, "usage", None))
+        return response.choices[0].message.content
+    
+    async def _complete_hedged(self, spec: str, messages: List[dict], temperature: float, response_format: Optional[dict]) -> str:
+        """応答が直近の応答時間の上位パーセンタイルより遅ければ同じ呼び出しをもう1回送り、先に返った方を使う"""
+        tasks = {asyncio.ensure_future(self._complete_once(spec, messages, temperature, response_format))}
+        first = next(iter(tasks))
+        try:
+            delay = self.router.hedge_delay(spec)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.router.acquire_hedge():
+                    tasks.add(asyncio.ensure_future(self._complete_once(spec, messages, temperature, response_format)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.router.record_hedge_win()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def complete(self, model: str, messages: List[dict], temperature: float, response_format: Optional[dict] = None) -> str:
+        """LLMを非同期に呼び出す（失敗・タイムアウト時は代替モデルを順に試す）"""
+        candidates = self.router.candidates(model)
+        for i, spec in enumerate(candidates):
+            try:
+                return await self._complete_hedged(spec, messages, temperature, response_format)
+            except Exception as e:
+                if i + 1 == len(candidates):
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise ValueError(f"LLMの応答が{self.request_timeout:.0f}秒以内に返りませんでした")
+                    raise
+                self.router.record_fallback()
+                log_event("llm_fallback", model=spec, fallback=candidates[i + 1], error=type(e).__name__)
+        raise RuntimeError("unreachable")
+    
+    @staticmethod
+    def _record_usage(model: str, usage) -> None:
+        if usage is not None:
+            LLM_TOKENS.observe(usage.prompt_tokens or 0, model=model, kind="prompt")
+            LLM_TOKENS.observe(usage.completion_tokens or 0, model=model, kind="completion")
+    
+    async def _stream_once(self, spec: str, messages: List[dict], temperature: float, response_format: Optional[dict]) -> AsyncIterator[str]:
+        provider, model = split_model(spec)
+        client, governor = self._provider(provider)
+        async with self._semaphore:
+            # 再試行するのはストリームの開始まで（出力を返し始めた後は再試行しない）
+            stream = await governor.call(lambda: asyncio.wait_for(
+                client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                    # トークン数を記録するため、最後のチャンクで使用量を受け取る
+                    stream_options={"include_usage": True},
+                    **self._format_kwargs(response_format)
+                ),
+                timeout=self.request_timeout
+            ), target=model)
+            iterator = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=self.request_timeout)
+                except StopAsyncIteration:
+                    break
+                if getattr(chunk, "usage", None) is not None:
+                    self._record_usage(model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    
+    async def complete_stream(self, model: str, messages: List[dict], temperature: float, response_format: Optional[dict] = None) -> AsyncIterator[str]:
+        """LLMの出力をトークン単位で逐次受け取る（チャンク間の待ち時間にタイムアウトを適用し、出力前の失敗は代替モデルへ）"""
+        candidates = self.router.candidates(model)
+        for i, spec in enumerate(candidates):
+            started = False
+            try:
+                async for text in self._stream_once(spec, messages, temperature, response_format):
+                    started = True
+                    yield text
+                return
+            except Exception as e:
+                if started or i + 1 == len(candidates):
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise ValueError(f"LLMの応答が{self.request_timeout:.0f}秒以内に返りませんでした")
+                    raise
+                self.router.record_fallback()
+                log_event("llm_fallback", model=spec, fallback=candidates[i + 1], error=type(e).__name__)
+    
+    @timed(ANALYSIS_STAGE_DURATION, stage="parse")
+    def _parse_content(self, content: str) -> dict:
+        """応答からJSONを取り出す（必要なら修復）"""
+        data, repaired = repair_json(content)
+        self.parse_stats["repaired" if repaired else "parsed"] += 1
+        return data
+    
+    async def finish_structured(self, model: str, messages: List[dict], temperature: float, content: str, validate: Callable, properties: dict, optional: dict, required_if: Optional[Callable[[dict], List[str]]] = None) -> dict:
+        """応答を修復・検証し、不足している必須項目だけを上限回数まで再要求する
+
+        required_if は検証済みの項目から、省略可の項目のうち必須になるものを返す（再要求しても得られなければ既定値で補う）。
+        """
         try:
-            with open("additional_prompt.txt", "r", encoding="utf-8") as f:
-                additional_prompt = f.read()
-        except FileNotFoundError:
-            additional_prompt = ""
+            valid, failing = validate(self._parse_content(content))
+        except ValueError:
+            valid, failing = {}, list(properties)
         
-        return core_prompt, additional_prompt
+        for _ in range(self.repair_max_retries):
+            conditional = required_if(valid) if required_if else []
+            required = [key for key in failing if key not in valid and (key not in optional or key in conditional)]
+            if not required:
+                break
+            self.parse_stats["reasked"] += 1
+            message, follow_up_format = field_request(required, properties)
+            follow_up = await self.complete(
+                model=model,
+                messages=[*messages, {"role": "assistant", "content": content}, {"role": "user", "content": message}],
+                temperature=temperature,
+                response_format=follow_up_format
+            )
+            try:
+                extra, _ = validate(self._parse_content(follow_up))
+            except ValueError:
+                continue
+            valid.update({key: value for key, value in extra.items() if key in required})
+        
+        remaining = fill_defaults(valid, [key for key in failing if key not in valid], optional)
+        if remaining:
+            self.parse_stats["failed"] += 1
+            raise ValueError(f"応答に必要な項目が含まれていません: {', '.join(remaining)}")
+        return valid
+    
+    async def complete_structured(self, model: str, messages: List[dict], temperature: float, response_format: dict, validate: Callable, properties: dict, optional: dict, required_if: Optional[Callable[[dict], List[str]]] = None) -> dict:
+        """スキーマ付きでLLMを呼び出し、検証済みの項目を返す"""
+        content = await self.complete(model=model, messages=messages, temperature=temperature, response_format=response_format)
+        return await self.finish_structured(model, messages, temperature, content, validate, properties, optional, required_if)
+    
+    async def close(self) -> None:
+        """LLMクライアントの接続を閉じる"""
+        for client, _ in self._providers.values():
+            close = getattr(client, "close", None)
+            if close is not None:
+                await close()
+        if self.cache is not None:
+            self.cache.close()
     
     def build_context_section(self, context_comments: List[Comment]) -> str:
-        """文脈情報セクションを構築"""
+        """文脈情報セクションを構築（親コメントと直近の返信を優先し、古い返信は要約にまとめる）"""
         if not context_comments:
             return ""
         
+        selection = self.context_budget.select_context(context_comments)
         context_section = "【文脈情報】\n"
-        
-        for i, comment in enumerate(context_comments):
-            if i == 0:
-                context_section += f"親コメント: \"{comment.text}\" (投稿者: {comment.author})\n"
-            else:
-                context_section += f"前の返信{i}: \"{comment.text}\" (投稿者: {comment.author})\n"
+        context_section += f"親コメント: \"{selection.parent.text}\" (投稿者: {selection.parent.author})\n"
+        if selection.summary:
+            context_section += f"{selection.summary}\n"
+        for i, comment in selection.replies:
+            context_section += f"前の返信{i}: \"{comment.text}\" (投稿者: {comment.author})\n"
         
         context_section += "\n上記の文脈を考慮して、以下のコメントを分析してください。\n"
         return context_section
     
-    async def analyze_comment(self, request: AnalysisRequest) -> AnalysisResult:
-        """コメントを分析"""
-        context_section = ""
-        if request.context_comments:
-            context_section = self.build_context_section(request.context_comments)
-        
-        prompt = self.core_prompt.format(
-            context_section=context_section,
-            comment_text=request.comment_text
+    @staticmethod
+    def parse_analysis_result(result_data: dict) -> AnalysisResult:
+        """最新のプロンプトのJSON形式から分析結果を組み立てる"""
+        return AnalysisResult(
+            category=result_data.get("category", []),
+            is_counter=result_data.get("isCounter", False),
+            graham_hierarchy=result_data.get("grahamHierarchy"),
+            logical_fallacy=result_data.get("logicalFallacy"),
+            validity_assessment=result_data.get("validityAssessment", "判断困難"),
+            safe_or_out=result_data.get("safeOrOut", "safe"),
+            explanation=result_data.get("explanation", ""),
+            validity_reason=result_data.get("validityReason", "")
         )
+    
+    def _notify_result(self, requests: List[AnalysisRequest], results: List[AnalysisResult], version: str) -> None:
+        for request, result in zip(requests, results):
+            for listener in self.result_listeners:
+                try:
+                    listener(request, result, version)
+                except Exception as e:
+                    log_event("result_listener_failed", level="error", error=type(e).__name__, detail=str(e))
+    
+    async def notify_results(self, requests: List[AnalysisRequest], results: List[AnalysisResult], version: Optional[str] = None) -> None:
+        """comment_id付きの分析結果をリスナーへ渡す（保存処理はスレッドで実行）"""
+        pairs = [(request, result) for request, result in zip(requests, results) if request.comment_id and result is not None]
+        if pairs and self.result_listeners:
+            await asyncio.to_thread(self._notify_result, [p[0] for p in pairs], [p[1] for p in pairs], version or self.prompt_version)
+    
+    def classify_locally(self, request: AnalysisRequest) -> Optional[AnalysisResult]:
+        """ローカル分類器で確信度高く判定できる場合のみ結果を返す"""
+        if self.pre_classifier is None:
+            return None
+        return self.pre_classifier.classify(request)
+    
+    def route_analysis(self, request: AnalysisRequest) -> Route:
+        """分析に使うモデルを選ぶ（ローカル分類器の確信度も判断材料にする）"""
+        confidence = self.pre_classifier.confidence(request) if self.pre_classifier is not None else None
+        return self.router.route_analysis(request, confidence)
+    
+    async def analyze_comment(self, request: AnalysisRequest) -> AnalysisResult:
+        """コメントを分析（ローカル判定・キャッシュで済むものはLLMを呼ばない）"""
+        local = self.classify_locally(request)
+        if local is not None:
+            await self.notify_results([request], [local], self.pre_classifier.version)
+            return local
         
-        if self.additional_prompt.strip():
-            prompt += f"\n\n【追加指示】\n{self.additional_prompt}"
+        result = await self._analyze_cached(request)
+        await self.notify_results([request], [result])
+        return result
+    
+    async def _analyze_cached(self, request: AnalysisRequest, route: Optional[Route] = None) -> AnalysisResult:
+        route = route or self.route_analysis(request)
+        key = make_cache_key(request, self.prompt_version, route.model, ANALYSIS_TEMPERATURE)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        return await self._inflight.do(key, lambda: self._analyze_and_store(request, key, route.model))
+    
+    async def _analyze_and_store(self, request: AnalysisRequest, key: str, model: str) -> AnalysisResult:
+        result = await self._analyze_uncached(request, model)
+        if self.cache is not None:
+            self.cache.set(key, result)
+        return result
+    
+    @timed(ANALYSIS_STAGE_DURATION, stage="prompt")
+    def build_analysis_prompt(self, request: AnalysisRequest) -> str:
+        """1件のコメント分析用プロンプトを構築"""
+        context_section = self.build_context_section(request.context_comments)
+        return self.prompts.current.render_analysis(context_section, request.comment_text)
+    
+    async def _analyze_uncached(self, request: AnalysisRequest, model: str) -> AnalysisResult:
+        """LLMを呼び出してコメントを分析"""
+        prompt = self.build_analysis_prompt(request)
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            data = await self.complete_structured(
+                model=model,
                 messages=[
-                    {"role": "system", "content": "あなたはYouTubeコメントを分析する専門家です。指定された形式でJSON応答を返してください。"},
+                    {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.3
+                temperature=ANALYSIS_TEMPERATURE,
+                response_format=ANALYSIS_RESPONSE_FORMAT,
+                validate=validate_analysis,
+                properties=ANALYSIS_PROPERTIES,
+                optional=ANALYSIS_OPTIONAL
             )
+            return self.parse_analysis_result(data)
+        
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            log_event("analysis_error", level="error", model=model, error=type(e).__name__, detail=str(e))
+            raise ValueError(f"分析エラー: {str(e)}")
+    
+    async def analyze_comment_stream(self, request: AnalysisRequest) -> AsyncIterator[Tuple[str, object]]:
+        """判定理由を生成されたそばから ("delta", テキスト) で返し、最後に ("result", AnalysisResult) を返す"""
+        local = self.classify_locally(request)
+        if local is not None:
+            await self.notify_results([request], [local], self.pre_classifier.version)
+            yield "delta", local.explanation
+            yield "result", local
+            return
+        
+        model = self.route_analysis(request).model
+        key = make_cache_key(request, self.prompt_version, model, ANALYSIS_TEMPERATURE)
+        # キャッシュ済み、または同じ分析が実行中ならその結果をまとめて返す
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is None:
+            cached = await self._inflight.join(key)
+        if cached is not None:
+            await self.notify_results([request], [cached])
+            yield "delta", cached.explanation
+            yield "result", cached
+            return
+        
+        pending: List[str] = []
+        received: List[str] = []
+        parser = IncrementalJSONParser(stream_key="explanation", on_text=pending.append)
+        messages = [
+            {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+            {"role": "user", "content": self.build_analysis_prompt(request)}
+        ]
+        try:
+            async for text in self.complete_stream(
+                model=model,
+                messages=messages,
+                temperature=ANALYSIS_TEMPERATURE,
+                response_format=ANALYSIS_RESPONSE_FORMAT
+            ):
+                received.append(text)
+                parser.feed(text)
+                if pending:
+                    yield "delta", "".join(pending)
+                    pending.clear()
             
-            content = response.choices[0].message.content
+            # 途中で切れた応答や不足項目はストリーム終了後に修復・再要求する
+            data = await self.finish_structured(
+                model, messages, ANALYSIS_TEMPERATURE, "".join(received),
+                validate_analysis, ANALYSIS_PROPERTIES, ANALYSIS_OPTIONAL
+            )
+            result = self.parse_analysis_result(data)
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            log_event("analysis_error", level="error", model=model, stream=True, error=type(e).__name__, detail=str(e))
+            raise ValueError(f"分析エラー: {str(e)}")
+        
+        if self.cache is not None:
+            self.cache.set(key, result)
+        await self.notify_results([request], [result])
+        yield "result", result
+    
+    @timed(ANALYSIS_STAGE_DURATION, stage="prompt")
+    def build_batch_prompt(self, requests: List[AnalysisRequest]) -> str:
+        """複数コメントを番号付きで1つのプロンプトにまとめる（出力形式の指示までを共通部分とする）"""
+        items = f"{BATCH_OUTPUT_FORMAT}\n\n{BATCH_ITEMS_MARKER}\n"
+        for i, request in enumerate(requests):
+            items += f"[{i}] \"{request.comment_text}\"\n"
+            if request.context_comments:
+                context_section = self.build_context_section(request.context_comments)
+                items += "".join(f"    {line}\n" for line in context_section.splitlines() if line.strip())
+        
+        return self.prompts.current.render_batch(items)
+    
+    async def analyze_batch(self, requests: List[AnalysisRequest]) -> List[BatchAnalysisItem]:
+        """複数コメントをまとめて分析（近似重複・キャッシュ済みは除外し、残りをチャンク単位で並行処理）"""
+        if len(requests) > self.batch_max_items:
+            raise ValueError(f"一度に分析できるコメントは{self.batch_max_items}件までです")
+        
+        representatives = list(range(len(requests)))
+        cluster_ids: List[Optional[str]] = [None] * len(requests)
+        if self.dedup_enabled and len(requests) > 1:
+            # 文脈付きのコメント（返信）は文脈によって判定が変わるため重複判定の対象外
+            representatives, cluster_ids = cluster_texts(
+                [None if request.context_comments else request.comment_text for request in requests]
+            )
+        
+        items: List[Optional[BatchAnalysisItem]] = [None] * len(requests)
+        # 選ばれたモデルごとにまとめ、同じモデルのコメントだけを1チャンクにする
+        pending: Dict[str, List[Tuple[int, AnalysisRequest, str]]] = {}
+        joining: List[Tuple[int, AnalysisRequest, Route]] = []
+        local_indexes: List[int] = []
+        
+        for index, request in enumerate(requests):
+            if representatives[index] != index:
+                continue
+            local = self.classify_locally(request)
+            if local is not None:
+                items[index] = BatchAnalysisItem(index=index, result=local)
+                local_indexes.append(index)
+                continue
             
-            # JSONの抽出
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            if json_start != -1 and json_end != -1:
-                json_str = content[json_start:json_end]
-                result_data = json.loads(json_str)
-                
-                # 最新のプロンプトのJSON形式に対応
-                return AnalysisResult(
-                    category=result_data.get("category", []),
-                    is_counter=result_data.get("isCounter", False),
-                    graham_hierarchy=result_data.get("grahamHierarchy"),
-                    logical_fallacy=result_data.get("logicalFallacy"),
-                    validity_assessment=result_data.get("validityAssessment", "判断困難"),
-                    safe_or_out=result_data.get("safeOrOut", "safe"),
-                    explanation=result_data.get("explanation", ""),
-                    validity_reason=result_data.get("validityReason", "")
-                )
-            else:
-                raise ValueError("有効なJSON応答が得られませんでした")
+            route = self.route_analysis(request)
+            key = make_cache_key(request, self.prompt_version, route.model, ANALYSIS_TEMPERATURE)
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                items[index] = BatchAnalysisItem(index=index, result=cached)
+                continue
+            if key in self._inflight:
+                # 別のリクエストで同じ分析が実行中ならその結果を待つ
+                joining.append((index, request, route))
+                continue
+            pending.setdefault(route.model, []).append((index, request, key))
+        
+        chunks = [
+            (model, entries[i:i + self.batch_chunk_size])
+            for model, entries in pending.items()
+            for i in range(0, len(entries), self.batch_chunk_size)
+        ]
+        outcomes = await asyncio.gather(
+            *(self._analyze_chunk(model, chunk, items) for model, chunk in chunks),
+            *(self._join_analysis(index, request, route, items) for index, request, route in joining),
+            return_exceptions=True
+        )
+        for outcome in outcomes:
+            # 上流が使えなければ全体を失敗させる（完了したチャンクはキャッシュ済みなので再試行は安い）
+            if isinstance(outcome, BaseException):
+                raise outcome
         
+        # 代表の結果を同じクラスタのコメントへ展開
+        local_set = set(local_indexes)
+        for index, representative in enumerate(representatives):
+            source = items[representative]
+            items[index] = BatchAnalysisItem(index=index, result=source.result, error=source.error, cluster_id=cluster_ids[index])
+            if representative != index and representative in local_set:
+                local_indexes.append(index)
+        
+        if local_indexes:
+            await self.notify_results([requests[i] for i in local_indexes], [items[i].result for i in local_indexes], self.pre_classifier.version)
+        local_set = set(local_indexes)
+        remote = [i for i in range(len(requests)) if i not in local_set]
+        await self.notify_results([requests[i] for i in remote], [items[i].result for i in remote])
+        return items
+    
+    async def _join_analysis(self, index: int, request: AnalysisRequest, route: Route, items: List[Optional[BatchAnalysisItem]]) -> None:
+        try:
+            items[index] = BatchAnalysisItem(index=index, result=await self._analyze_cached(request, route))
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
-            print(f"Analysis error details: {type(e).__name__}: {str(e)}")
-            print(f"Prompt used: {prompt[:200]}...")
-            import traceback
-            traceback.print_exc()
-            raise ValueError(f"分析エラー: {str(e)}")
+            items[index] = BatchAnalysisItem(index=index, error=str(e))
     
-    async def handle_protest(self, request) -> dict:
-        """抗議に対する審判の応答を生成"""
-        from app.models.comment import ProtestResponse
+    async def _analyze_chunk(self, model: str, chunk: List[Tuple[int, AnalysisRequest, str]], items: List[Optional[BatchAnalysisItem]]) -> None:
+        """1チャンク分のコメントを1回のLLM呼び出しで分析"""
+        results = {}
+        if len(chunk) > 1:
+            try:
+                content = await self.complete(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                        {"role": "user", "content": self.build_batch_prompt([request for _, request, _ in chunk])}
+                    ],
+                    temperature=ANALYSIS_TEMPERATURE,
+                    response_format=BATCH_RESPONSE_FORMAT
+                )
+                for entry in self._parse_content(content).get("results", []):
+                    if not isinstance(entry, dict) or not isinstance(entry.get("index"), int):
+                        continue
+                    valid, failing = validate_analysis(entry)
+                    # 必須項目が欠けたコメントは個別分析へ回す
+                    if not fill_defaults(valid, failing, ANALYSIS_OPTIONAL):
+                        results[entry["index"]] = self.parse_analysis_result(valid)
+            except UpstreamUnavailable:
+                # 上流が使えないときは個別分析へ回しても失敗するだけなのでそのまま返す
+                raise
+            except Exception as e:
+                # 個別分析へ回すので警告にとどめる
+                log_event("batch_analysis_fallback", level="warning", model=model, items=len(chunk), error=type(e).__name__, detail=str(e))
         
-        # 会話履歴を構築
-        conversation = "これまでの会話:\n"
-        for msg in request.conversation_history:
-            role = "ユーザー" if msg.role == "user" else "審判"
-            conversation += f"{role}: {msg.content}\n"
+        async def fill(position: int) -> None:
+            index, request, key = chunk[position]
+            result = results.get(position)
+            try:
+                if result is None:
+                    # バッチ応答に含まれなかったコメントは個別に分析
+                    result = await self._inflight.do(key, lambda: self._analyze_and_store(request, key, model))
+                elif self.cache is not None:
+                    self.cache.set(key, result)
+                items[index] = BatchAnalysisItem(index=index, result=result)
+            except UpstreamUnavailable:
+                raise
+            except Exception as e:
+                items[index] = BatchAnalysisItem(index=index, error=str(e))
         
-        # 審判としてのプロンプトを作成
-        prompt = f"""あなたはプロ野球の主審です。コメント判定に対する抗議を受けています。
+        outcomes = await asyncio.gather(*(fill(position) for position in range(len(chunk))), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+    
+    @staticmethod
+    def build_protest_head(comment_text: str, original_result: AnalysisResult) -> str:
+        """抗議プロンプトの固定部分（審判としての指示・元のコメント・元の判定）"""
+        return f"""あなたはプロ野球の主審です。コメント判定に対する抗議を受けています。
 実際のプロ野球審判のように、以下の特徴を持って対応してください：
 
 1. プロフェッショナルで毅然とした態度
@@ -119,18 +591,28 @@ class AnalysisService:
 5. 必要に応じて警告を与える
 
 【元のコメント】
-"{request.comment_text}"
+"{comment_text}"
 
 【元の判定結果】
-- カテゴリー: {', '.join(request.original_result.category)}
-- セーフ/アウト: {request.original_result.safe_or_out}
-- 判定理由: {request.original_result.explanation}
-- 妥当性評価: {request.original_result.validity_assessment}
+- カテゴリー: {', '.join(original_result.category)}
+- セーフ/アウト: {original_result.safe_or_out}
+- 判定理由: {original_result.explanation}
+- 妥当性評価: {original_result.validity_assessment}
 
+"""
+    
+    @staticmethod
+    def _history_line(message: ConversationMessage) -> str:
+        role = "ユーザー" if message.role == "user" else "審判"
+        return f"{role}: {message.content}\n"
+    
+    def _protest_prompt(self, head: str, conversation: str, protest_message: str) -> str:
+        protest_message = truncate_tokens(protest_message, self.context_budget.history_tokens)
+        return f"""{head}これまでの会話:
 {conversation}
 
 【ユーザーからの新たな抗議】
-{request.protest_message}
+{protest_message}
 
 【判定変更の基準】
 - 元の判定に明確な誤りがある場合
@@ -146,41 +628,164 @@ class AnalysisService:
     "newSafeOrOut": "safe/out（変更時のみ）",
     "newExplanation": "新しい判定理由（変更時のみ、100-150文字）"
 }}"""
-
+    
+    def _render_history(self, selection: HistorySelection) -> str:
+        # 会話履歴を構築（直近のやり取りを優先し、古いやり取りは要約にまとめる）
+        conversation = f"{selection.summary}\n" if selection.summary else ""
+        return conversation + "".join(self._history_line(msg) for msg in selection.messages)
+    
+    @timed(ANALYSIS_STAGE_DURATION, stage="prompt")
+    def build_protest_prompt(self, request: ProtestRequest) -> str:
+        """抗議に対する審判応答用のプロンプトを構築"""
+        selection = self.context_budget.select_history(request)
+        head = self.build_protest_head(request.comment_text, request.original_result)
+        return self._protest_prompt(head, self._render_history(selection), request.protest_message)
+    
+    @timed(ANALYSIS_STAGE_DURATION, stage="prompt")
+    def build_session_prompt(self, session: ProtestSession, protest_message: str) -> str:
+        """保持している会話から抗議プロンプトを構築（履歴が予算内なら追記済みの会話部分をそのまま使う）"""
+        if session.history_tokens <= self.context_budget.history_tokens:
+            conversation = session.conversation
+        else:
+            conversation = self._render_history(self.context_budget.select_history(session.as_request(protest_message)))
+        return self._protest_prompt(session.head, conversation, protest_message)
+    
+    def _append_turn(self, session: ProtestSession, role: str, content: str) -> None:
+        # 履歴の選択（select_history）と同じく1件ずつ上限までに切り詰めて数える
+        item_tokens = self.context_budget.item_tokens
+        if count_tokens(content) > item_tokens:
+            shown = truncate_tokens(content, item_tokens)
+        else:
+            shown = content
+        session.append(
+            ConversationMessage(role=role, content=content),
+            self._history_line(ConversationMessage(role=role, content=shown)),
+            count_tokens(shown) + 4
+        )
+    
+    @staticmethod
+    def build_protest_response(result_data: dict, original_result: AnalysisResult) -> ProtestResponse:
+        """審判応答のJSONから抗議への応答を組み立てる"""
+        protest_response = ProtestResponse(
+            umpire_response=result_data.get("umpireResponse", ""),
+            judgment_changed=result_data.get("judgmentChanged", False)
+        )
+        
+        # 判定が変更された場合、新しい結果を作成（新しい判定・説明がなければ元の値のまま）
+        if result_data.get("judgmentChanged", False):
+            new_result = original_result.model_copy()
+            new_result.safe_or_out = result_data.get("newSafeOrOut") or original_result.safe_or_out
+            new_result.explanation = result_data.get("newExplanation") or original_result.explanation
+            protest_response.new_result = new_result
+        
+        return protest_response
+    
+    async def handle_protest(self, request: ProtestRequest) -> ProtestResponse:
+        """抗議に対する審判の応答を生成"""
+        return await self._judge_protest(request, self.build_protest_prompt(request))
+    
+    async def _judge_protest(self, request: ProtestRequest, prompt: str) -> ProtestResponse:
+        model = self.router.route_protest(request).model
+        
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+            data = await self.complete_structured(
+                model=model,
                 messages=[
-                    {"role": "system", "content": "あなたは経験豊富なプロ野球の主審です。判定には絶対的な自信を持ち、論理的で公正な判断を下します。"},
+                    {"role": "system", "content": PROTEST_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.5
+                temperature=PROTEST_TEMPERATURE,
+                response_format=PROTEST_RESPONSE_FORMAT,
+                validate=validate_protest,
+                properties=PROTEST_PROPERTIES,
+                optional=PROTEST_OPTIONAL,
+                required_if=protest_required
             )
-            
-            content = response.choices[0].message.content
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            
-            if json_start != -1 and json_end != -1:
-                json_str = content[json_start:json_end]
-                result_data = json.loads(json_str)
-                
-                protest_response = ProtestResponse(
-                    umpire_response=result_data.get("umpireResponse", ""),
-                    judgment_changed=result_data.get("judgmentChanged", False)
-                )
-                
-                # 判定が変更された場合、新しい結果を作成
-                if result_data.get("judgmentChanged", False):
-                    new_result = request.original_result.copy()
-                    new_result.safe_or_out = result_data.get("newSafeOrOut", request.original_result.safe_or_out)
-                    new_result.explanation = result_data.get("newExplanation", request.original_result.explanation)
-                    protest_response.new_result = new_result
-                
-                return protest_response
-            else:
-                raise ValueError("有効なJSON応答が得られませんでした")
+            return self.build_protest_response(data, request.original_result)
                 
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
-            print(f"Protest handling error: {str(e)}")
-            raise ValueError(f"抗議処理エラー: {str(e)}")
\ No newline at end of file
+            log_event("protest_error", level="error", model=model, error=type(e).__name__, detail=str(e))
+            raise ValueError(f"抗議処理エラー: {str(e)}")
+    
+    async def handle_protest_stream(self, request: ProtestRequest) -> AsyncIterator[Tuple[str, object]]:
+        """審判の応答を生成されたそばから ("delta", テキスト) で返し、最後に ("result", ProtestResponse) を返す"""
+        async for event in self._judge_protest_stream(request, self.build_protest_prompt(request)):
+            yield event
+    
+    async def _judge_protest_stream(self, request: ProtestRequest, prompt: str) -> AsyncIterator[Tuple[str, object]]:
+        pending: List[str] = []
+        received: List[str] = []
+        parser = IncrementalJSONParser(stream_key="umpireResponse", on_text=pending.append)
+        messages = [
+            {"role": "system", "content": PROTEST_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        model = self.router.route_protest(request).model
+        try:
+            async for text in self.complete_stream(
+                model=model,
+                messages=messages,
+                temperature=PROTEST_TEMPERATURE,
+                response_format=PROTEST_RESPONSE_FORMAT
+            ):
+                received.append(text)
+                parser.feed(text)
+                if pending:
+                    yield "delta", "".join(pending)
+                    pending.clear()
+            
+            data = await self.finish_structured(
+                model, messages, PROTEST_TEMPERATURE, "".join(received),
+                validate_protest, PROTEST_PROPERTIES, PROTEST_OPTIONAL, protest_required
+            )
+            response = self.build_protest_response(data, request.original_result)
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            log_event("protest_error", level="error", model=model, stream=True, error=type(e).__name__, detail=str(e))
+            raise ValueError(f"抗議処理エラー: {str(e)}")
+        
+        yield "result", response
+    
+    def start_protest_session(self, comment_text: str, original_result: AnalysisResult) -> ProtestSession:
+        """抗議の会話を開始（プロンプトの固定部分はここで1回だけ組み立てる）"""
+        return self.protest_sessions.create(
+            comment_text, original_result, self.build_protest_head(comment_text, original_result)
+        )
+    
+    def _check_turn(self, session: ProtestSession, protest_message: str) -> None:
+        if not protest_message.strip():
+            raise ValueError("抗議の内容を入力してください")
+        if session.protest_round > self.protest_sessions.max_turns:
+            raise ValueError(f"1つの会話で抗議できるのは {self.protest_sessions.max_turns} 回までです")
+    
+    def _record_turn(self, session: ProtestSession, protest_message: str, response: ProtestResponse) -> None:
+        """抗議と審判の応答を会話に追記し、判定が変わったらプロンプトの固定部分を作り直す"""
+        self._append_turn(session, "user", protest_message)
+        self._append_turn(session, "umpire", response.umpire_response)
+        if response.new_result is not None:
+            session.current_result = response.new_result
+            session.head = self.build_protest_head(session.comment_text, response.new_result)
+    
+    async def handle_protest_turn(self, session: ProtestSession, protest_message: str) -> ProtestResponse:
+        """保持している会話に新しい抗議を加えて審判の応答を生成"""
+        async with session.lock:
+            self._check_turn(session, protest_message)
+            response = await self._judge_protest(
+                session.as_request(protest_message), self.build_session_prompt(session, protest_message)
+            )
+            self._record_turn(session, protest_message, response)
+            return response
+    
+    async def handle_protest_turn_stream(self, session: ProtestSession, protest_message: str) -> AsyncIterator[Tuple[str, object]]:
+        """handle_protest_turn のストリーミング版（応答が完成した時点で会話に追記）"""
+        async with session.lock:
+            self._check_turn(session, protest_message)
+            async for kind, payload in self._judge_protest_stream(
+                session.as_request(protest_message), self.build_session_prompt(session, protest_message)
+            ):
+                if kind == "result":
+                    self._record_turn(session, protest_message, payload)
+                yield kind, payload
@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from app.models.comment import Comment
+
+# 大量のコメントを扱う経路向けの列指向のコメント一覧
+# YouTube API の応答は信頼できるデータなので、1件ごとに Comment モデルを検証・構築せず
+# 項目ごとのリストに詰め、JSONへはリストから直接書き出す。
+# 投稿日時は YouTube の文字列（"2024-01-02T03:04:05Z"）のまま持ち、datetime への変換は
+# モデルが必要になったときに列ごとまとめて行う。
+
+# Comment の項目順（JSONの出力順をモデルと同じにする）
+COMMENT_FIELDS = tuple(Comment.model_fields)
+
+
+def _is_plain_utc(value: str) -> bool:
+    # 秒までのUTC（YouTube API の通常の形式）
+    return len(value) == 20 and value[19] == "Z"
+
+
+def wire_timestamp(value: str) -> str:
+    """APIの応答（Comment をJSONにしたとき）と同じ形式の投稿日時"""
+    if _is_plain_utc(value):
+        return value
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def parse_timestamps(values: Sequence[str]) -> List[datetime]:
+    """投稿日時の列をまとめて datetime にする（Z 付きの形式を直接読めない場合は置き換えてから読む）"""
+    try:
+        return list(map(datetime.fromisoformat, values))
+    except ValueError:
+        return [datetime.fromisoformat(value.replace("Z", "+00:00")) for value in values]
+
+
+def stored_timestamp(value: str) -> str:
+    """ローカルストアの形式（format_timestamp と同じUTCのISO形式）"""
+    if _is_plain_utc(value):
+        return value[:19] + "+00:00"
+    return wire_timestamp(value)[:-1] + "+00:00"
+
+
+class CommentBatch:
+    """コメントを項目ごとのリストで保持する一覧（API境界の外では Comment モデルを作らない）"""
+
+    __slots__ = ("ids", "texts", "authors", "published_at", "like_counts", "reply_counts", "parent_ids", "cluster_ids")
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.authors: List[str] = []
+        self.published_at: List[str] = []  # wire_timestamp の形式
+        self.like_counts: List[int] = []
+        self.reply_counts: List[int] = []
+        self.parent_ids: List[Optional[str]] = []
+        self.cluster_ids: List[Optional[str]] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, comment_id: str, snippet: dict, reply_count: int = 0, parent_id: Optional[str] = None) -> None:
+        """YouTube API のコメントの snippet を1件追加"""
+        self.ids.append(comment_id)
+        self.texts.append(snippet['textDisplay'])
+        self.authors.append(snippet['authorDisplayName'])
+        self.published_at.append(wire_timestamp(snippet['publishedAt']))
+        self.like_counts.append(snippet.get('likeCount', 0))
+        self.reply_counts.append(reply_count)
+        self.parent_ids.append(parent_id)
+        self.cluster_ids.append(None)
+
+    @classmethod
+    def from_threads(cls, items: List[dict]) -> "CommentBatch":
+        """commentThreads の items から親コメントの一覧を作る"""
+        batch = cls()
+        for item in items:
+            snippet = item['snippet']
+            top_level = snippet['topLevelComment']
+            batch.append(top_level['id'], top_level['snippet'], reply_count=snippet.get('totalReplyCount', 0))
+        return batch
+
+    def extend_replies(self, items: List[dict], parent_id: str) -> None:
+        """comments（返信）の items を追加"""
+        for item in items:
+            self.append(item['id'], item['snippet'], parent_id=parent_id)
+
+    def select(self, indices: Sequence[int]) -> "CommentBatch":
+        """指定した位置のコメントだけの一覧"""
+        batch = CommentBatch()
+        for name in self.__slots__:
+            column = getattr(self, name)
+            setattr(batch, name, [column[i] for i in indices])
+        return batch
+
+    def _columns(self) -> Tuple[list, ...]:
+        return (self.ids, self.texts, self.authors, self.published_at, self.like_counts,
+                self.reply_counts, self.parent_ids, self.cluster_ids)
+
+    def rows(self, include: Optional[Set[str]] = None) -> Iterator[Dict[str, object]]:
+        """JSONに書き出す1件ごとの辞書（include で項目を絞る）"""
+        names = COMMENT_FIELDS if include is None else tuple(name for name in COMMENT_FIELDS if name in include)
+        columns = [column for name, column in zip(COMMENT_FIELDS, self._columns()) if name in names]
+        return (dict(zip(names, values)) for values in zip(*columns))
+
+    def to_comments(self) -> List[Comment]:
+        """Comment モデルの一覧にする（API由来の値なので検証は省く）"""
+        timestamps = parse_timestamps(self.published_at)
+        return [
+            Comment.model_construct(
+                id=comment_id, text=text, author=author, published_at=published_at, like_count=like_count,
+                reply_count=reply_count, parent_id=parent_id, cluster_id=cluster_id
+            )
+            for comment_id, text, author, published_at, like_count, reply_count, parent_id, cluster_id in zip(
+                self.ids, self.texts, self.authors, timestamps, self.like_counts,
+                self.reply_counts, self.parent_ids, self.cluster_ids
+            )
+        ]
+
+    def stored_timestamps(self) -> List[str]:
+        return [stored_timestamp(value) for value in self.published_at]
@@ -0,0 +1,310 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from itertools import repeat
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.log import log_event
+from app.models.comment import Comment, VideoInfo, AnalysisResult
+from app.services.comment_batch import CommentBatch
+from app.services.video_aggregates import VideoAggregates, result_fields
+
+LOCAL_TOKEN_PREFIX = "local:"
+
+
+def format_timestamp(value: datetime) -> str:
+    """並び替えできるようにUTCのISO形式へそろえる"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def encode_local_token(published_at: str, comment_id: str) -> str:
+    raw = f"{published_at}|{comment_id}".encode("utf-8")
+    return LOCAL_TOKEN_PREFIX + base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_local_token(token: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(token[len(LOCAL_TOKEN_PREFIX):].encode("ascii")).decode("utf-8")
+        published_at, comment_id = raw.split("|", 1)
+        return published_at, comment_id
+    except Exception:
+        raise ValueError("無効なページトークンです")
+
+
+def is_local_token(token: Optional[str]) -> bool:
+    return bool(token) and token.startswith(LOCAL_TOKEN_PREFIX)
+
+
+class CommentStore:
+    """動画・コメント・分析結果をローカルに保存するSQLiteストア"""
+
+    def __init__(self, db_path: str, aggregates: Optional[VideoAggregates] = None):
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.executescript(
+                """
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    channel_name TEXT NOT NULL,
+                    thumbnail_url TEXT NOT NULL,
+                    published_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS comments (
+                    id TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    text TEXT NOT NULL,
+                    author TEXT NOT NULL,
+                    published_at TEXT NOT NULL,
+                    like_count INTEGER NOT NULL,
+                    reply_count INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_comments_top_level
+                    ON comments (video_id, published_at DESC, id DESC) WHERE parent_id IS NULL;
+                CREATE INDEX IF NOT EXISTS idx_comments_parent ON comments (parent_id, published_at);
+                CREATE TABLE IF NOT EXISTS analyses (
+                    comment_id TEXT PRIMARY KEY,
+                    prompt_version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    analyzed_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    video_id TEXT PRIMARY KEY,
+                    newest_published_at TEXT,
+                    backfill_token TEXT,
+                    complete INTEGER NOT NULL DEFAULT 0,
+                    synced_at TEXT NOT NULL
+                );
+                """
+            )
+            self._db.commit()
+
+        # 動画ごとの判定結果の集計（保存済みの分析結果から作り直し、以降は保存のたびに差分で更新）
+        self.aggregates = aggregates
+        if aggregates is not None:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT c.video_id, c.author, c.published_at, a.result FROM analyses a JOIN comments c ON c.id = a.comment_id"
+                )
+                count = aggregates.rebuild(tuple(row) for row in rows)
+            log_event("video_aggregates_rebuilt", results=count)
+
+    @classmethod
+    def from_env(cls) -> "CommentStore":
+        aggregates = None
+        if os.getenv("VIDEO_AGGREGATES_ENABLED", "true").lower() in ("1", "true", "yes"):
+            aggregates = VideoAggregates(bucket=os.getenv("VIDEO_AGGREGATE_BUCKET", "day"))
+        return cls(os.getenv("COMMENT_STORE_DB", "comments.db"), aggregates)
+
+    def save_video(self, video: VideoInfo) -> None:
+        self.save_videos([video])
+
+    def save_videos(self, videos: Iterable[VideoInfo]) -> None:
+        """複数の動画情報を1トランザクションで保存"""
+        now = format_timestamp(datetime.now(timezone.utc))
+        rows = [
+            (video.video_id, video.title, video.channel_name, video.thumbnail_url, format_timestamp(video.published_at), now)
+            for video in videos
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO videos (video_id, title, channel_name, thumbnail_url, published_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+
+    def get_video(self, video_id: str) -> Optional[VideoInfo]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+        if row is None:
+            return None
+        return VideoInfo(
+            video_id=row["video_id"],
+            title=row["title"],
+            channel_name=row["channel_name"],
+            thumbnail_url=row["thumbnail_url"],
+            published_at=datetime.fromisoformat(row["published_at"])
+        )
+
+    def _upsert_comments(self, rows: List[tuple]) -> int:
+        with self._lock:
+            if self.aggregates is not None and rows:
+                # 先に分析だけ保存されていたコメントは、コメントの保存時に集計へ加える
+                ids = [row[0] for row in rows]
+                placeholders = ",".join("?" * len(ids))
+                pending = dict(self._db.execute(
+                    f"SELECT a.comment_id, a.result FROM analyses a WHERE a.comment_id IN ({placeholders}) "
+                    "AND NOT EXISTS (SELECT 1 FROM comments c WHERE c.id = a.comment_id)", ids
+                ).fetchall())
+                for comment_id, video_id, _, _, author, published_at, *_ in rows:
+                    if comment_id in pending:
+                        self.aggregates.replace(video_id, author, published_at, json.loads(pending.pop(comment_id)))
+            self._db.executemany(
+                "INSERT INTO comments (id, video_id, parent_id, text, author, published_at, like_count, reply_count, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET text = excluded.text, like_count = excluded.like_count, "
+                "reply_count = excluded.reply_count, updated_at = excluded.updated_at",
+                rows
+            )
+            self._db.commit()
+        return len(rows)
+
+    def save_comments(self, video_id: str, comments: Iterable[Comment]) -> int:
+        """コメントを保存（既存のものはいいね数・返信数などを更新）"""
+        now = format_timestamp(datetime.now(timezone.utc))
+        rows = [
+            (c.id, video_id, c.parent_id, c.text, c.author, format_timestamp(c.published_at), c.like_count, c.reply_count, now)
+            for c in comments
+        ]
+        return self._upsert_comments(rows)
+
+    def save_batch(self, video_id: str, batch: CommentBatch) -> int:
+        """列指向の一覧をモデルを作らずに保存（save_comments と同じ更新規則）"""
+        now = format_timestamp(datetime.now(timezone.utc))
+        rows = list(zip(
+            batch.ids, repeat(video_id), batch.parent_ids, batch.texts, batch.authors, batch.stored_timestamps(),
+            batch.like_counts, batch.reply_counts, repeat(now)
+        ))
+        return self._upsert_comments(rows)
+
+    def list_comments(self, video_id: str, page_token: Optional[str] = None, limit: int = 100) -> Tuple[List[Comment], Optional[str]]:
+        """保存済みの親コメントを新しい順に返す（インデックスを使ったキーセットページネーション）"""
+        if page_token:
+            published_at, comment_id = decode_local_token(page_token)
+            query = (
+                "SELECT * FROM comments WHERE video_id = ? AND parent_id IS NULL "
+                "AND (published_at, id) < (?, ?) ORDER BY published_at DESC, id DESC LIMIT ?"
+            )
+            params = (video_id, published_at, comment_id, limit + 1)
+        else:
+            query = (
+                "SELECT * FROM comments WHERE video_id = ? AND parent_id IS NULL "
+                "ORDER BY published_at DESC, id DESC LIMIT ?"
+            )
+            params = (video_id, limit + 1)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+
+        next_token = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_token = encode_local_token(rows[-1]["published_at"], rows[-1]["id"])
+        return [self._to_comment(row) for row in rows], next_token
+
+    def list_replies(self, comment_id: str) -> List[Comment]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM comments WHERE parent_id = ? ORDER BY published_at, id", (comment_id,)
+            ).fetchall()
+        return [self._to_comment(row) for row in rows]
+
+    def count_comments(self, video_id: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM comments WHERE video_id = ? AND parent_id IS NULL", (video_id,)
+            ).fetchone()
+        return row[0]
+
+    def save_analysis(self, comment_id: str, prompt_version: str, result: AnalysisResult) -> None:
+        self.save_analyses([(comment_id, prompt_version, result)])
+
+    def save_analyses(self, entries: Iterable[Tuple[str, str, AnalysisResult]]) -> None:
+        now = format_timestamp(datetime.now(timezone.utc))
+        entries = list(entries)
+        rows = [(comment_id, version, result.model_dump_json(), now) for comment_id, version, result in entries]
+        with self._lock:
+            if self.aggregates is not None and rows:
+                self._update_aggregates(entries)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO analyses (comment_id, prompt_version, result, analyzed_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+
+    def _update_aggregates(self, entries: List[Tuple[str, str, AnalysisResult]]) -> None:
+        # 保存済みのコメント（動画が分かるもの）の結果だけを、置き換える前の結果と差し替えて集計する
+        ids = list(dict.fromkeys(comment_id for comment_id, _, _ in entries))
+        placeholders = ",".join("?" * len(ids))
+        known = {
+            row["id"]: row for row in self._db.execute(
+                f"SELECT c.id, c.video_id, c.author, c.published_at, a.result FROM comments c "
+                f"LEFT JOIN analyses a ON a.comment_id = c.id WHERE c.id IN ({placeholders})", ids
+            )
+        }
+        previous = {comment_id: json.loads(row["result"]) for comment_id, row in known.items() if row["result"]}
+        for comment_id, _, result in entries:
+            row = known.get(comment_id)
+            if row is None:
+                continue
+            fields = result_fields(result)
+            self.aggregates.replace(row["video_id"], row["author"], row["published_at"], fields, previous.get(comment_id))
+            previous[comment_id] = fields
+
+    def get_video_aggregates(self, video_id: str) -> Optional[dict]:
+        """動画の判定結果の集計（保持している件数を読むだけで、分析結果は読み直さない）"""
+        if self.aggregates is None:
+            return None
+        return self.aggregates.get(video_id)
+
+    def get_analyses(self, comment_ids: Iterable[str]) -> Dict[str, AnalysisResult]:
+        ids = list(comment_ids)
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT comment_id, result FROM analyses WHERE comment_id IN ({placeholders})", ids
+            ).fetchall()
+        return {row["comment_id"]: AnalysisResult.model_validate_json(row["result"]) for row in rows}
+
+    def list_training_examples(self, exclude_version_prefix: str, limit: int = 50000) -> List[Tuple[str, AnalysisResult]]:
+        """コメント本文と分析結果の組を返す（指定した接頭辞のバージョンの結果は除く）"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT c.text, a.result FROM analyses a JOIN comments c ON c.id = a.comment_id "
+                "WHERE a.prompt_version NOT LIKE ? ORDER BY a.analyzed_at DESC LIMIT ?",
+                (exclude_version_prefix + "%", limit)
+            ).fetchall()
+        return [(row["text"], AnalysisResult.model_validate_json(row["result"])) for row in rows]
+
+    def get_sync_state(self, video_id: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute("SELECT * FROM sync_state WHERE video_id = ?", (video_id,)).fetchone()
+
+    def save_sync_state(self, video_id: str, newest_published_at: Optional[str], backfill_token: Optional[str], complete: bool) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sync_state (video_id, newest_published_at, backfill_token, complete, synced_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (video_id, newest_published_at, backfill_token, int(complete), format_timestamp(datetime.now(timezone.utc)))
+            )
+            self._db.commit()
+
+    @staticmethod
+    def _to_comment(row: sqlite3.Row) -> Comment:
+        return Comment(
+            id=row["id"],
+            text=row["text"],
+            author=row["author"],
+            published_at=datetime.fromisoformat(row["published_at"]),
+            like_count=row["like_count"],
+            reply_count=row["reply_count"],
+            parent_id=row["parent_id"]
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
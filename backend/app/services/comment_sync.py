@@ -0,0 +1,90 @@
+import os
+from typing import Dict, Optional
+
+from app.core.log import log_event
+from app.core.singleflight import SingleFlight
+from app.services.comment_store import CommentStore
+from app.services.youtube_service import YouTubeService
+
+# 同じ動画の同期が同時に走らないようにまとめる
+_sync_flight = SingleFlight()
+
+
+def sync_video_comments(youtube_service: YouTubeService, store: CommentStore, video_id: str, max_pages: Optional[int] = None) -> Dict[str, int]:
+    """動画のコメントをローカルストアへ差分同期
+
+    1. 最新側：前回同期した最新コメントより新しいコメントだけを取得する
+    2. 過去側：初回同期で取り切れなかった古いページを続きから取得する
+    どちらも1回の同期で取得するページ数は max_pages までに制限する。
+    """
+    max_pages = max_pages or int(os.getenv("COMMENT_SYNC_MAX_PAGES", "20"))
+    return _sync_flight.do(video_id, lambda: _sync(youtube_service, store, video_id, max_pages))
+
+
+def sync_inline(youtube_service: YouTubeService, store: CommentStore, video_id: str) -> Dict[str, int]:
+    """リクエストの応答前に行う同期（COMMENT_SYNC_INLINE_PAGES ページまで）
+
+    取り残したページがあれば結果の pending が1になるので、呼び出し側は sync_remaining を
+    バックグラウンドで実行して続きを取得する。
+    """
+    inline_pages = max(1, int(os.getenv("COMMENT_SYNC_INLINE_PAGES", "1")))
+    return sync_video_comments(youtube_service, store, video_id, inline_pages)
+
+
+def sync_remaining(youtube_service: YouTubeService, store: CommentStore, video_id: str) -> None:
+    """応答後にバックグラウンドで残りのページを取得（失敗しても次回の同期で続きから取得する）"""
+    try:
+        result = sync_video_comments(youtube_service, store, video_id)
+        log_event("comment_sync_completed", video_id=video_id, **result)
+    except Exception as e:
+        log_event("comment_sync_failed", level="warning", video_id=video_id, error=type(e).__name__, detail=str(e))
+
+
+def _sync(youtube_service: YouTubeService, store: CommentStore, video_id: str, max_pages: int) -> Dict[str, int]:
+    state = store.get_sync_state(video_id)
+    known_newest = state["newest_published_at"] if state is not None else None
+    backfill_token = state["backfill_token"] if state is not None else None
+    complete = bool(state["complete"]) if state is not None else False
+
+    pages = 0
+    fetched = 0
+    newest = known_newest
+
+    # 最新側：order="time" は新しい順なので、既知の最新より古いコメントに達したら止める
+    page_token = None
+    while pages < max_pages:
+        batch, next_page_token = youtube_service.get_comments_batch(video_id, page_token, 100)
+        pages += 1
+
+        timestamps = batch.stored_timestamps()
+        new_indices = [i for i, published_at in enumerate(timestamps) if known_newest is None or published_at >= known_newest]
+        fetched += store.save_batch(video_id, batch if len(new_indices) == len(batch) else batch.select(new_indices))
+        if timestamps:
+            page_newest = max(timestamps)
+            newest = max(newest, page_newest) if newest else page_newest
+
+        reached_known = len(new_indices) < len(batch)
+        if reached_known or not next_page_token:
+            if known_newest is None:
+                # 初回同期で最後まで取得できた
+                complete = not next_page_token
+                backfill_token = None
+            break
+        page_token = next_page_token
+    else:
+        # ページ上限に達した：取り残したページは次回以降に過去側として取得する
+        # （差分同期で上限に達した場合は既知のコメントとの間の取りこぼしを埋めるため）
+        backfill_token = page_token
+        complete = False
+
+    # 過去側：初回同期の続き
+    while backfill_token and not complete and pages < max_pages:
+        batch, next_page_token = youtube_service.get_comments_batch(video_id, backfill_token, 100)
+        pages += 1
+        fetched += store.save_batch(video_id, batch)
+        backfill_token = next_page_token
+        if not next_page_token:
+            complete = True
+
+    store.save_sync_state(video_id, newest, backfill_token, complete)
+    return {"pages": pages, "fetched": fetched, "complete": int(complete), "pending": int(bool(backfill_token) and not complete)}
@@ -0,0 +1,198 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.models.comment import Comment, ConversationMessage, ProtestRequest
+
+# プロンプトに含める文脈のトークン予算
+# 返信の文脈（親コメント・前の返信）と抗議の会話履歴は、スレッドや抗議が長くなるほど
+# 際限なく伸びる。親コメントと直近の返信・直近の会話を予算内で優先して残し、
+# それより古いものは抜粋の要約にまとめる。抜粋はスレッドごとにキャッシュし、同じスレッドの
+# 後続の返信は既に作った抜粋を使い回して、新しく省略対象になった分だけを追加する。
+
+_ASCII_RUN = re.compile(r"[\x00-\x7f]+")
+# 「前の返信3: "..." (投稿者: ...)」のような1行あたりの定型部分
+_LINE_OVERHEAD = 12
+_ELLIPSIS = "…"
+
+
+def count_tokens(text: str) -> int:
+    """トークン数をローカルで見積もる（英数字は約4文字、日本語などは1文字を1トークンとする）"""
+    tokens = 0
+    ascii_chars = 0
+    for run in _ASCII_RUN.findall(text):
+        ascii_chars += len(run)
+        tokens += math.ceil(len(run) / 4)
+    return tokens + len(text) - ascii_chars
+
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """見積もりトークン数が limit 以内になるよう末尾を切り詰める"""
+    if count_tokens(text) <= limit:
+        return text
+    # 1文字あたり最低0.25トークンのため、limit*4文字より後ろは必ず切り捨てられる
+    low, high = 0, min(len(text), limit * 4)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) + 1 <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + _ELLIPSIS
+
+
+class ContextSelection(NamedTuple):
+    parent: Optional[Comment]
+    summary: Optional[str]  # 省略した古い返信の要約
+    replies: List[Tuple[int, Comment]]  # (元の返信番号, 返信) の直近のもの
+
+
+class HistorySelection(NamedTuple):
+    summary: Optional[str]  # 省略した古いやり取りの要約
+    messages: List[ConversationMessage]
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class ContextBudget:
+    """返信の文脈と抗議の会話履歴をトークン予算内に収める"""
+
+    def __init__(self, context_tokens: int = 1200, history_tokens: int = 1500, item_tokens: int = 300,
+                 summary_tokens: int = 200, cache_size: int = 1024):
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.item_tokens = item_tokens
+        self.summary_tokens = summary_tokens
+        self.cache_size = cache_size
+        # スレッドごとの (要素のキー, 抜粋) の列
+        self._excerpts: "OrderedDict[str, List[Tuple[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"trimmed": 0, "excerpts_reused": 0, "excerpts_built": 0}
+
+    @classmethod
+    def from_env(cls) -> "ContextBudget":
+        return cls(
+            context_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200")),
+            history_tokens=int(os.getenv("PROTEST_HISTORY_TOKEN_BUDGET", "1500")),
+            item_tokens=int(os.getenv("CONTEXT_ITEM_TOKEN_LIMIT", "300")),
+            summary_tokens=int(os.getenv("CONTEXT_SUMMARY_TOKEN_LIMIT", "200")),
+            cache_size=int(os.getenv("CONTEXT_SUMMARY_CACHE_SIZE", "1024"))
+        )
+
+    def _truncate_comment(self, comment: Comment) -> Comment:
+        text = truncate_tokens(comment.text, self.item_tokens)
+        return comment if text is comment.text else comment.model_copy(update={"text": text})
+
+    def _thread_excerpts(self, thread_key: str, keys: List[str], build: Callable[[int], str]) -> List[str]:
+        """スレッドのキャッシュ済み抜粋のうち先頭から一致する分を使い、残りだけを作る"""
+        with self._lock:
+            cached = self._excerpts.get(thread_key) or []
+            if cached:
+                self._excerpts.move_to_end(thread_key)
+        reused = 0
+        while reused < min(len(cached), len(keys)) and cached[reused][0] == keys[reused]:
+            reused += 1
+        entries = cached[:reused] + [(keys[i], build(i)) for i in range(reused, len(keys))]
+        with self._lock:
+            self._stats["excerpts_reused"] += reused
+            self._stats["excerpts_built"] += len(keys) - reused
+            if len(entries) >= len(self._excerpts.get(thread_key) or []):
+                self._excerpts[thread_key] = entries
+                self._excerpts.move_to_end(thread_key)
+            while len(self._excerpts) > self.cache_size:
+                self._excerpts.popitem(last=False)
+        return [line for _, line in entries]
+
+    def _summarize(self, header: str, lines: Sequence[str]) -> str:
+        """直近のものから要約の予算に収まるだけ抜粋し、時系列順に並べる"""
+        remaining = self.summary_tokens - count_tokens(header)
+        picked: List[str] = []
+        for line in reversed(lines):
+            cost = count_tokens(line) + 1
+            if cost > remaining:
+                break
+            picked.append(line)
+            remaining -= cost
+        skipped = len(lines) - len(picked)
+        body = " / ".join(reversed(picked))
+        if skipped:
+            body = f"（さらに古い{skipped}件は省略）" + (" / " + body if body else "")
+        return header + body
+
+    def select_context(self, comments: Optional[List[Comment]]) -> ContextSelection:
+        """親コメントと直近の返信を予算内で残し、古い返信は要約にまとめる"""
+        if not comments:
+            return ContextSelection(None, None, [])
+
+        parent = self._truncate_comment(comments[0])
+        replies = [(i, self._truncate_comment(c)) for i, c in enumerate(comments[1:], start=1)]
+        costs = [count_tokens(c.text) + count_tokens(c.author) + _LINE_OVERHEAD for _, c in replies]
+        remaining = self.context_tokens - count_tokens(parent.text) - count_tokens(parent.author) - _LINE_OVERHEAD
+        if sum(costs) <= remaining:
+            return ContextSelection(parent, None, replies)
+
+        # 収まらない場合は要約の分を確保してから、直近の返信から順に残す
+        remaining -= self.summary_tokens
+        keep = 0
+        for cost in reversed(costs):
+            if cost > remaining:
+                break
+            remaining -= cost
+            keep += 1
+        omitted = comments[1:len(replies) - keep + 1]
+        with self._lock:
+            self._stats["trimmed"] += 1
+
+        lines = self._thread_excerpts(
+            comments[0].id or _digest(comments[0].text),
+            [c.id or _digest(c.text) for c in omitted],
+            lambda i: f"{omitted[i].author}「{truncate_tokens(omitted[i].text, 30)}」"
+        )
+        summary = self._summarize(f"前の返信1〜{len(omitted)}の抜粋: ", lines)
+        return ContextSelection(parent, summary, replies[len(replies) - keep:] if keep else [])
+
+    def select_history(self, request: ProtestRequest) -> HistorySelection:
+        """直近のやり取りを予算内で残し、古いやり取りは要約にまとめる"""
+        history = request.conversation_history
+        messages = [
+            m if count_tokens(m.content) <= self.item_tokens else m.model_copy(update={"content": truncate_tokens(m.content, self.item_tokens)})
+            for m in history
+        ]
+        costs = [count_tokens(m.content) + 4 for m in messages]
+        if sum(costs) <= self.history_tokens:
+            return HistorySelection(None, messages)
+
+        remaining = self.history_tokens - self.summary_tokens
+        keep = 0
+        for cost in reversed(costs):
+            if cost > remaining:
+                break
+            remaining -= cost
+            keep += 1
+        omitted = history[:len(history) - keep]
+        with self._lock:
+            self._stats["trimmed"] += 1
+
+        # 同じコメント・判定への抗議を1つの会話とみなし、省略部分の要約を使い回す
+        lines = self._thread_excerpts(
+            _digest(request.comment_text, request.original_result.explanation),
+            [_digest(m.role, m.content) for m in omitted],
+            lambda i: f"{'ユーザー' if omitted[i].role == 'user' else '審判'}「{truncate_tokens(omitted[i].content, 40)}」"
+        )
+        summary = self._summarize(f"以前のやり取り{len(omitted)}件の抜粋: ", lines)
+        return HistorySelection(summary, messages[len(messages) - keep:] if keep else [])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                "cached_threads": len(self._excerpts),
+                "context_tokens": self.context_tokens,
+                "history_tokens": self.history_tokens
+            }
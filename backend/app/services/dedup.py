@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+import unicodedata
+import zlib
+from array import array
+from typing import List, NamedTuple, Optional, Sequence
+
+from app.models.comment import Comment
+from app.services.comment_batch import CommentBatch
+
+# 近似重複判定
+# 正規化した本文の文字3-gramから One Permutation Hashing で MinHash 署名を作り、
+# 署名をバンドに分けた LSH で候補を絞ってから3-gramのJaccard類似度で確認する。
+# 署名とバンドのハッシュは array に詰めて保持し、候補の突き合わせはバンドごとの
+# ソートで行うため、10万件規模でも辞書を大量に作らずに済む。
+
+NUM_BUCKETS = 64
+BAND_ROWS = 4
+SHINGLE_SIZE = 3
+# 短い本文は数文字の違いでも意味が変わるため、正規化後の完全一致のみでまとめる
+MIN_NEAR_DUPLICATE_LENGTH = 12
+_BUCKET_MASK = NUM_BUCKETS - 1
+_EMPTY = 0xFFFFFFFF
+
+_REPEATS = re.compile(r"(.)\1{2,}")
+_NON_WORD = re.compile(r"[\W_]+")
+# カタカナ→ひらがなの変換表
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+class Clustering(NamedTuple):
+    representatives: List[int]  # 各要素の代表（クラスタ内で最初に現れた要素）のインデックス
+    cluster_ids: List[Optional[str]]  # 2件以上のクラスタに属する要素のみクラスタIDを持つ
+
+
+def normalize_for_dedup(text: str) -> str:
+    """全角半角・カタカナひらがな・記号・空白・連続文字の揺れを吸収"""
+    text = _NON_WORD.sub("", unicodedata.normalize("NFKC", text).lower())
+    # 「wwwww」「ーーー」のような繰り返しは2文字にそろえる
+    return _REPEATS.sub(r"\1\1", text.translate(_KATAKANA_TO_HIRAGANA))
+
+
+def _shingles(text: str) -> List[str]:
+    if len(text) <= SHINGLE_SIZE:
+        return [text]
+    return [text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)]
+
+
+def _signature(text: str, out: array) -> None:
+    """One Permutation Hashing による MinHash 署名を out に追記（空バケットは循環で補完）"""
+    mins = [_EMPTY] * NUM_BUCKETS
+    for shingle in _shingles(text):
+        h = zlib.crc32(shingle.encode("utf-8"))
+        bucket = h & _BUCKET_MASK
+        value = h >> 6
+        if value < mins[bucket]:
+            mins[bucket] = value
+
+    if _EMPTY in mins:
+        original = list(mins)
+        for i in range(NUM_BUCKETS):
+            if original[i] != _EMPTY:
+                continue
+            # 右隣で最初に埋まっているバケットの値を、距離で区別して借りる
+            for step in range(1, NUM_BUCKETS):
+                source = original[(i + step) & _BUCKET_MASK]
+                if source != _EMPTY:
+                    mins[i] = (source + step * 0x9E3779B1) & 0xFFFFFFFF
+                    break
+    out.extend(mins)
+
+
+def jaccard(a: str, b: str) -> float:
+    """文字3-gram集合のJaccard類似度"""
+    shingles_a, shingles_b = set(_shingles(a)), set(_shingles(b))
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+
+def _find(parent: array, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _union(parent: array, a: int, b: int) -> None:
+    root_a, root_b = _find(parent, a), _find(parent, b)
+    if root_a != root_b:
+        # 小さいインデックス（先に現れた要素）を根にする
+        if root_a < root_b:
+            parent[root_b] = root_a
+        else:
+            parent[root_a] = root_b
+
+
+def default_threshold() -> float:
+    return float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", "0.7"))
+
+
+def cluster_texts(texts: Sequence[Optional[str]], threshold: Optional[float] = None) -> Clustering:
+    """本文の近似重複をまとめる（None の要素は重複判定の対象外）"""
+    threshold = default_threshold() if threshold is None else threshold
+    count = len(texts)
+    parent = array("l", range(count))
+
+    # 1. 正規化後に完全一致するものをまとめる
+    first_seen = {}
+    unique: List[int] = []
+    normalized: List[Optional[str]] = [None] * count
+    for i, text in enumerate(texts):
+        if text is None:
+            continue
+        key = normalize_for_dedup(text) or unicodedata.normalize("NFKC", text).strip()
+        normalized[i] = key
+        if key in first_seen:
+            parent[i] = first_seen[key]
+        else:
+            first_seen[key] = i
+            if len(key) >= MIN_NEAR_DUPLICATE_LENGTH:
+                unique.append(i)
+    first_seen = None
+
+    # 2. 残った異なる本文同士を MinHash + LSH で近似重複判定
+    if threshold < 1.0 and len(unique) > 1:
+        signatures = array("L")
+        for i in unique:
+            _signature(normalized[i], signatures)
+
+        bands = NUM_BUCKETS // BAND_ROWS
+        band_hashes = array("q", bytes(8 * len(unique)))
+        for band in range(bands):
+            start = band * BAND_ROWS
+            for position in range(len(unique)):
+                offset = position * NUM_BUCKETS + start
+                band_hashes[position] = hash(tuple(signatures[offset:offset + BAND_ROWS]))
+            order = sorted(range(len(unique)), key=band_hashes.__getitem__)
+            run_start = 0
+            for k in range(1, len(order) + 1):
+                if k < len(order) and band_hashes[order[k]] == band_hashes[order[run_start]]:
+                    continue
+                # 同じバンド値を持つ候補を先頭の要素と比較
+                leader = unique[order[run_start]]
+                leader_root = _find(parent, leader)
+                for position in order[run_start + 1:k]:
+                    other = unique[position]
+                    # 既に同じクラスタにまとまっていれば比較しない
+                    if _find(parent, other) == leader_root:
+                        continue
+                    if jaccard(normalized[leader], normalized[other]) >= threshold:
+                        _union(parent, leader, other)
+                        leader_root = _find(parent, leader)
+                run_start = k
+
+    representatives = [_find(parent, i) for i in range(count)]
+    sizes = {}
+    for rep in representatives:
+        sizes[rep] = sizes.get(rep, 0) + 1
+
+    cluster_ids: List[Optional[str]] = [None] * count
+    for i, rep in enumerate(representatives):
+        if sizes[rep] > 1 and normalized[rep] is not None:
+            # 代表の正規化本文から作るため、別のページ・リクエストでも同じスパムは同じIDになる
+            cluster_ids[i] = hashlib.sha1(normalized[rep].encode("utf-8")).hexdigest()[:12]
+    return Clustering(representatives, cluster_ids)
+
+
+def annotate_comments(comments: List[Comment], threshold: Optional[float] = None) -> List[Comment]:
+    """近似重複のコメントにクラスタIDを付ける"""
+    clustering = cluster_texts([c.text for c in comments], threshold)
+    return [
+        comment.model_copy(update={"cluster_id": cluster_id}) if cluster_id else comment
+        for comment, cluster_id in zip(comments, clustering.cluster_ids)
+    ]
+
+
+def annotate_batch(batch: CommentBatch, threshold: Optional[float] = None) -> CommentBatch:
+    """列指向の一覧に近似重複のクラスタIDを付ける"""
+    batch.cluster_ids = cluster_texts(batch.texts, threshold).cluster_ids
+    return batch
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import random
+import re
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+# ネットワークなしで並行スループットを計測するためのローカル疑似LLMバックエンド
+# LLM_BACKEND=fake で AnalysisService がこのクライアントを使用する
+
+FAKE_ANALYSIS_RESULT = {
+    "category": ["感想"],
+    "isCounter": False,
+    "grahamHierarchy": None,
+    "logicalFallacy": None,
+    "validityAssessment": "判断困難",
+    "safeOrOut": "safe",
+    "explanation": "疑似バックエンドによる判定です。個人的な感想であり、他者への攻撃的な表現は含まれていないためセーフと判定しました。",
+    "validityReason": "疑似バックエンドのため妥当性は評価していません。"
+}
+
+_BATCH_ITEM = re.compile(r"^\[(\d+)\] ", re.MULTILINE)
+
+FAKE_PROTEST_RESULT = {
+    "umpireResponse": "判定は変わりません。コメントの内容を再確認しましたが、元の判定に誤りは認められませんでした。",
+    "judgmentChanged": False
+}
+
+
+def _to_snake(key: str) -> str:
+    return re.sub(r"([A-Z])", lambda m: "_" + m.group(1).lower(), key)
+
+
+def malform(content: str, rng: random.Random) -> str:
+    """実際のLLMで見られる崩れたJSON（コードフェンス・末尾カンマ・snake_case・途中切れ）を再現"""
+    kind = rng.choice(["fence", "trailing_comma", "snake_case", "truncate"])
+    if kind == "fence":
+        return f"以下が分析結果です。\n```json\n{content}\n```"
+    if kind == "trailing_comma":
+        return content[:-1] + ",}"
+    if kind == "snake_case":
+        return re.sub(r'"([a-z]+[A-Z][A-Za-z]*)":', lambda m: f'"{_to_snake(m.group(1))}":', content)
+    return content[:int(len(content) * 0.8)]
+
+
+def _estimate_tokens(text: str) -> int:
+    """おおよそのトークン数を見積もる"""
+    return max(1, len(text) // 2)
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeAsyncLLMClient"):
+        self._owner = owner
+
+    async def create(self, model: str, messages: List[Dict[str, str]], temperature: float = 1.0, stream: bool = False, **kwargs: Any):
+        if stream:
+            return self._owner.stream(model, messages)
+        return await self._owner.complete(model, messages)
+
+
+class FakeLLMError(RuntimeError):
+    """疑似バックエンドの一時的なエラー（OpenAIの503と同じく再試行の対象）"""
+
+    status_code = 503
+
+
+class FakeAsyncLLMClient:
+    """OpenAI互換の chat.completions.create を提供する疑似クライアント"""
+
+    def __init__(self, latency: Optional[float] = None, jitter: Optional[float] = None, error_rate: Optional[float] = None, malformed_rate: Optional[float] = None):
+        self.latency = latency if latency is not None else float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0.5"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("FAKE_LLM_JITTER_SECONDS", "0.1"))
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+        self.malformed_rate = malformed_rate if malformed_rate is not None else float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0"))
+        self._rng = random.Random()
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+        self.calls = 0
+
+    def render_content(self, messages: List[Dict[str, str]]) -> str:
+        """プロンプトの種類に応じた応答本文を生成"""
+        prompt = messages[-1]["content"] if messages else ""
+        if "umpireResponse" in prompt:
+            content = json.dumps(FAKE_PROTEST_RESULT, ensure_ascii=False)
+        elif '"results"' in prompt:
+            results = [{"index": int(i), **FAKE_ANALYSIS_RESULT} for i in _BATCH_ITEM.findall(prompt)]
+            content = json.dumps({"results": results}, ensure_ascii=False)
+        else:
+            content = json.dumps(FAKE_ANALYSIS_RESULT, ensure_ascii=False)
+        if self.malformed_rate and self._rng.random() < self.malformed_rate:
+            content = malform(content, self._rng)
+        return content
+
+    async def complete(self, model: str, messages: List[Dict[str, str]]):
+        self.calls += 1
+        delay = self.latency + random.uniform(0, self.jitter) if self.jitter else self.latency
+        await asyncio.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeLLMError("疑似LLMバックエンドのエラー")
+
+        content = self.render_content(messages)
+        prompt_tokens = sum(_estimate_tokens(m["content"]) for m in messages)
+        completion_tokens = _estimate_tokens(content)
+
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    async def stream(self, model: str, messages: List[Dict[str, str]], chunk_chars: int = 8):
+        """応答本文を小さな断片に分けて順に返す"""
+        self.calls += 1
+        content = self.render_content(messages)
+        chunks = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+        delay = self.latency / max(len(chunks), 1)
+        for text in chunks:
+            await asyncio.sleep(delay)
+            yield SimpleNamespace(
+                model=model,
+                choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=text), finish_reason=None)],
+                usage=None
+            )
+        # stream_options={"include_usage": True} と同じく最後に使用量だけのチャンクを返す
+        yield SimpleNamespace(
+            model=model,
+            choices=[],
+            usage=SimpleNamespace(
+                prompt_tokens=sum(_estimate_tokens(m["content"]) for m in messages),
+                completion_tokens=_estimate_tokens(content)
+            )
+        )
+
+    async def close(self) -> None:
+        pass
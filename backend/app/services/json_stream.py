@@ -0,0 +1,128 @@
+import json
+from typing import Callable, Optional
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class IncrementalJSONParser:
+    """LLMの出力を逐次受け取り、最初のトップレベルJSONオブジェクトを抽出するパーサー
+
+    文字列中の括弧を正しく無視し、指定したキーの文字列値を生成途中から
+    デコード済みテキストとして on_text に渡す。
+    """
+
+    def __init__(self, stream_key: Optional[str] = None, on_text: Optional[Callable[[str], None]] = None):
+        self.stream_key = stream_key
+        self.on_text = on_text
+        self.result: Optional[dict] = None
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._expect_key = False
+        self._string_is_key = False
+        self._streaming = False
+        self._current = []
+        self._last_key: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def feed(self, chunk: str) -> None:
+        """テキスト断片を入力"""
+        for char in chunk:
+            if self.done:
+                return
+            if self._depth == 0:
+                if char == "{":
+                    self._buffer = ["{"]
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                self._feed_string(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_is_key = self._depth == 1 and self._expect_key
+                self._streaming = (
+                    self._depth == 1 and not self._string_is_key
+                    and self.stream_key is not None and self._last_key == self.stream_key
+                )
+                self._current = []
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish()
+            elif self._depth == 1 and char == ",":
+                self._expect_key = True
+            elif self._depth == 1 and char == ":":
+                self._expect_key = False
+
+    def _feed_string(self, char: str) -> None:
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) == 4:
+                try:
+                    decoded = chr(int(self._unicode, 16))
+                except ValueError:
+                    decoded = ""
+                self._unicode = None
+                self._emit(decoded)
+            return
+
+        if self._escape:
+            self._escape = False
+            if char == "u":
+                self._unicode = ""
+            else:
+                self._emit(_ESCAPES.get(char, char))
+            return
+
+        if char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._last_key = "".join(self._current)
+            self._streaming = False
+        else:
+            self._emit(char)
+
+    def _emit(self, text: str) -> None:
+        if self._string_is_key:
+            self._current.append(text)
+        elif self._streaming and text and self.on_text is not None:
+            self.on_text(text)
+
+    def _finish(self) -> None:
+        raw = "".join(self._buffer)
+        try:
+            self.result = json.loads(raw)
+        except json.JSONDecodeError:
+            # 不正なオブジェクトは捨てて、後続のテキストから探し直す
+            self._reset()
+
+    def _reset(self) -> None:
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode = None
+        self._last_key = None
+
+
+def extract_json_object(content: str) -> dict:
+    """テキストから最初の有効なトップレベルJSONオブジェクトを取り出す"""
+    parser = IncrementalJSONParser()
+    parser.feed(content)
+    if not parser.done:
+        raise ValueError("有効なJSON応答が得られませんでした")
+    return parser.result
@@ -0,0 +1,435 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.log import log_event
+from app.core.upstream import UpstreamUnavailable
+from app.models.comment import Comment, AnalysisRequest, AnalysisResult
+from app.models.job import JudgeJob, JudgeJobResult
+from app.models.response import CommentThread
+from app.services.comment_store import CommentStore
+from app.services.dedup import cluster_texts
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# 動画全体の判定ジョブ
+# YouTubeのコメントページを順に取得し、上限付きキューを介して分析ワーカーへ流す。
+# 結果は逐次SQLiteへ書き込み、処理中ページのトークンをチェックポイントとして
+# 保存することで、再起動後も途中から再開できる。
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JudgeJobStore:
+    """判定ジョブと結果のSQLite永続化"""
+
+    def __init__(self, db_path: str):
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.executescript(
+                """
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS judge_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    include_replies INTEGER NOT NULL,
+                    max_comments INTEGER,
+                    page_token TEXT,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    comments_seen INTEGER NOT NULL DEFAULT 0,
+                    analyzed INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS judge_job_results (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    comment_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    author TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    published_at TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    cluster_id TEXT,
+                    UNIQUE (job_id, comment_id)
+                );
+                """
+            )
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(judge_job_results)")}
+            if "cluster_id" not in columns:
+                # 近似重複のクラスタIDを追加する前に作られたデータベース
+                self._db.execute("ALTER TABLE judge_job_results ADD COLUMN cluster_id TEXT")
+            self._db.commit()
+
+    def create(self, video_id: str, include_replies: bool, max_comments: Optional[int]) -> JudgeJob:
+        job_id = uuid.uuid4().hex
+        now = _now()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO judge_jobs (job_id, video_id, status, include_replies, max_comments, created_at, updated_at) "
+                "VALUES (?, ?, 'pending', ?, ?, ?, ?)",
+                (job_id, video_id, int(include_replies), max_comments, now, now)
+            )
+            self._db.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[JudgeJob]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM judge_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row is not None else None
+
+    def get_page_token(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT page_token FROM judge_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row["page_token"] if row is not None else None
+
+    def list_unfinished(self) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id FROM judge_jobs WHERE status IN ('pending', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE judge_jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, _now(), job_id)
+            )
+            self._db.commit()
+
+    def checkpoint(self, job_id: str, page_token: Optional[str]) -> None:
+        """ページの処理完了を記録し、次に処理するページのトークンを保存"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE judge_jobs SET page_token = ?, pages_done = pages_done + 1, updated_at = ? WHERE job_id = ?",
+                (page_token, _now(), job_id)
+            )
+            self._db.commit()
+
+    def processed_ids(self, job_id: str, comment_ids: Iterable[str]) -> Set[str]:
+        """保存済みのコメントIDを返す（再開時の重複分析を防ぐ）"""
+        ids = list(comment_ids)
+        if not ids:
+            return set()
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT comment_id FROM judge_job_results WHERE job_id = ? AND comment_id IN ({placeholders})",
+                (job_id, *ids)
+            ).fetchall()
+        return {row["comment_id"] for row in rows}
+
+    def count_top_level(self, job_id: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM judge_job_results WHERE job_id = ? AND parent_id IS NULL", (job_id,)
+            ).fetchone()
+        return row[0]
+
+    def save_results(self, job_id: str, entries: List[Tuple[Comment, Optional[AnalysisResult], Optional[str], Optional[str]]]) -> None:
+        """分析結果を保存し、ジョブの進捗カウンタを更新"""
+        seen = analyzed = 0
+        with self._lock:
+            for comment, result, error, cluster_id in entries:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO judge_job_results "
+                    "(job_id, comment_id, parent_id, author, text, published_at, result, error, cluster_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job_id, comment.id, comment.parent_id, comment.author, comment.text,
+                        comment.published_at.isoformat(),
+                        result.model_dump_json() if result is not None else None,
+                        error,
+                        cluster_id
+                    )
+                )
+                if cursor.rowcount:
+                    seen += 1
+                    analyzed += result is not None
+            self._db.execute(
+                "UPDATE judge_jobs SET comments_seen = comments_seen + ?, analyzed = analyzed + ?, "
+                "failed = failed + ?, updated_at = ? WHERE job_id = ?",
+                (seen, analyzed, seen - analyzed, _now(), job_id)
+            )
+            self._db.commit()
+
+    def list_results(self, job_id: str, after: int = 0, limit: int = 100) -> List[JudgeJobResult]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM judge_job_results WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after, limit)
+            ).fetchall()
+        return [
+            JudgeJobResult(
+                seq=row["seq"],
+                comment_id=row["comment_id"],
+                parent_id=row["parent_id"],
+                author=row["author"],
+                text=row["text"],
+                published_at=datetime.fromisoformat(row["published_at"]),
+                result=AnalysisResult.model_validate_json(row["result"]) if row["result"] else None,
+                error=row["error"],
+                cluster_id=row["cluster_id"]
+            )
+            for row in rows
+        ]
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> JudgeJob:
+        return JudgeJob(
+            job_id=row["job_id"],
+            video_id=row["video_id"],
+            status=row["status"],
+            include_replies=bool(row["include_replies"]),
+            max_comments=row["max_comments"],
+            pages_done=row["pages_done"],
+            comments_seen=row["comments_seen"],
+            analyzed=row["analyzed"],
+            failed=row["failed"],
+            error=row["error"],
+            created_at=datetime.fromisoformat(row["created_at"]),
+            updated_at=datetime.fromisoformat(row["updated_at"])
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class JudgeJobManager:
+    """判定ジョブの実行（取得→分析のパイプライン）と進捗通知を管理"""
+
+    def __init__(self, store: JudgeJobStore, get_youtube_service: Callable, get_analysis_service: Callable, comment_store: Optional[CommentStore] = None, workers: Optional[int] = None, queue_size: Optional[int] = None):
+        self.store = store
+        self.comment_store = comment_store
+        self._get_youtube_service = get_youtube_service
+        self._get_analysis_service = get_analysis_service
+        self.workers = workers or int(os.getenv("JUDGE_JOB_WORKERS", "4"))
+        self.queue_size = queue_size or int(os.getenv("JUDGE_JOB_QUEUE_SIZE", "200"))
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._conditions: Dict[str, asyncio.Condition] = {}
+
+    @classmethod
+    def from_env(cls, get_youtube_service: Callable, get_analysis_service: Callable, comment_store: Optional[CommentStore] = None) -> "JudgeJobManager":
+        store = JudgeJobStore(os.getenv("JUDGE_JOBS_DB", "judge_jobs.db"))
+        return cls(store, get_youtube_service, get_analysis_service, comment_store)
+
+    def start(self, video_id: str, include_replies: bool = True, max_comments: Optional[int] = None) -> JudgeJob:
+        """ジョブを作成してバックグラウンドで実行開始"""
+        job = self.store.create(video_id, include_replies, max_comments)
+        self._launch(job.job_id)
+        return job
+
+    def resume(self) -> List[str]:
+        """前回の実行で終わらなかったジョブを再開"""
+        job_ids = self.store.list_unfinished()
+        for job_id in job_ids:
+            self._launch(job_id)
+        return job_ids
+
+    def cancel(self, job_id: str) -> bool:
+        task = self._tasks.get(job_id)
+        if task is None:
+            return False
+        task.cancel()
+        self.store.set_status(job_id, "cancelled")
+        return True
+
+    def queue_depths(self) -> Dict[str, int]:
+        """実行中のジョブごとの分析待ちキューの長さ"""
+        return {job_id: queue.qsize() for job_id, queue in list(self._queues.items())}
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    def condition(self, job_id: str) -> asyncio.Condition:
+        """進捗更新の通知を待つための条件変数（実行中でないジョブには通知されない条件変数を返し、登録はしない）"""
+        if job_id not in self._tasks:
+            return asyncio.Condition()
+        if job_id not in self._conditions:
+            self._conditions[job_id] = asyncio.Condition()
+        return self._conditions[job_id]
+
+    async def _notify(self, job_id: str) -> None:
+        condition = self._conditions.get(job_id)
+        if condition is not None:
+            async with condition:
+                condition.notify_all()
+
+    async def _notify_finished(self, job_id: str) -> None:
+        """最後の通知を送り、ジョブの条件変数を破棄する（待機中の配信は終了状態を読んで終わる）"""
+        await self._notify(job_id)
+        self._conditions.pop(job_id, None)
+
+    def _launch(self, job_id: str) -> None:
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        try:
+            youtube_service = self._get_youtube_service()
+            analysis_service = self._get_analysis_service()
+        except LookupError as e:
+            self.store.set_status(job_id, "failed", str(e))
+            await self._notify_finished(job_id)
+            return
+
+        self.store.set_status(job_id, "running")
+        await self._notify(job_id)
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queues[job_id] = queue
+        workers = [
+            asyncio.create_task(self._consume(job_id, queue, analysis_service))
+            for _ in range(self.workers)
+        ]
+        try:
+            await self._produce(job, queue, youtube_service)
+            self.store.set_status(job_id, "completed")
+        except asyncio.CancelledError:
+            # シャットダウン時はステータスを running のまま残し、次回起動時に再開する
+            raise
+        except Exception as e:
+            log_event("judge_job_failed", level="error", job_id=job_id, error=type(e).__name__, detail=str(e))
+            self.store.set_status(job_id, "failed", str(e))
+        finally:
+            self._queues.pop(job_id, None)
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self._notify_finished(job_id)
+
+    async def _fetch_page(self, youtube_service, job: JudgeJob, page_token: Optional[str]) -> Tuple[List[CommentThread], Optional[str]]:
+        """1ページ分のスレッドを取得（返信が必要なスレッドはYouTubeService側で並行取得）"""
+        while True:
+            try:
+                if job.include_replies:
+                    return await asyncio.to_thread(youtube_service.get_comment_threads, job.video_id, page_token, 100)
+                comments, next_page_token = await asyncio.to_thread(youtube_service.get_comments, job.video_id, page_token, 100)
+                return [CommentThread(comment=comment, replies=[]) for comment in comments], next_page_token
+            except UpstreamUnavailable as e:
+                # 上流が回復するまでジョブを失敗させずに待つ
+                log_event("judge_job_waiting", level="warning", job_id=job.job_id, upstream="youtube", retry_after=round(e.retry_after, 1))
+                await asyncio.sleep(e.retry_after)
+
+    async def _produce(self, job: JudgeJob, queue: asyncio.Queue, youtube_service) -> None:
+        """コメントページを順に取得してキューへ投入（ページ単位でチェックポイント）"""
+        page_token = self.store.get_page_token(job.job_id)
+        remaining = None
+        if job.max_comments is not None:
+            remaining = job.max_comments - self.store.count_top_level(job.job_id)
+
+        page = await self._fetch_page(youtube_service, job, page_token)
+        if remaining is not None:
+            # 再開時、チェックポイントのページで処理済みのコメントは上限から差し引かない
+            remaining += len(self.store.processed_ids(job.job_id, (t.comment.id for t in page[0])))
+        while True:
+            threads, next_page_token = page
+            if remaining is not None:
+                threads = threads[:max(remaining, 0)]
+                remaining -= len(threads)
+                if remaining <= 0:
+                    next_page_token = None
+
+            # 現在のページを分析している間に次のページを先読みする
+            next_fetch = None
+            if next_page_token:
+                next_fetch = asyncio.create_task(self._fetch_page(youtube_service, job, next_page_token))
+
+            try:
+                await self._enqueue_page(job, threads, queue)
+                await queue.join()
+            except BaseException:
+                if next_fetch is not None:
+                    next_fetch.cancel()
+                raise
+
+            self.store.checkpoint(job.job_id, next_page_token)
+            await self._notify(job.job_id)
+
+            if next_fetch is None:
+                return
+            page = await next_fetch
+
+    async def _enqueue_page(self, job: JudgeJob, threads: List[CommentThread], queue: asyncio.Queue) -> None:
+        ids = [t.comment.id for t in threads] + [r.id for t in threads for r in t.replies]
+        done = self.store.processed_ids(job.job_id, ids)
+        if self.comment_store is not None:
+            # 分析結果（comment_idで保存される）と突き合わせられるようにコメントも保存
+            comments = [t.comment for t in threads] + [r for t in threads for r in t.replies]
+            await asyncio.to_thread(self.comment_store.save_comments, job.video_id, comments)
+
+        # 近似重複の親コメントは同じキュー項目にまとめ、同じバッチで分析されるようにする
+        top_level = [t.comment for t in threads if t.comment.id not in done]
+        representatives = cluster_texts([c.text for c in top_level]).representatives
+        groups: Dict[int, List[Comment]] = {}
+        for comment, representative in zip(top_level, representatives):
+            groups.setdefault(representative, []).append(comment)
+        for group in groups.values():
+            await queue.put((group, [AnalysisRequest(comment_text=c.text, comment_id=c.id) for c in group]))
+
+        for thread in threads:
+            comment, replies = thread.comment, thread.replies
+            for i, reply in enumerate(replies):
+                if reply.id in done:
+                    continue
+                # 親コメントとそれまでの返信を文脈として渡す
+                request = AnalysisRequest(comment_text=reply.text, context_comments=[comment, *replies[:i]], comment_id=reply.id)
+                await queue.put(([reply], [request]))
+
+    async def _consume(self, job_id: str, queue: asyncio.Queue, analysis_service) -> None:
+        """キューから取り出したコメントをまとめて分析し、結果を保存"""
+        while True:
+            batch = [await queue.get()]
+            size = len(batch[0][0])
+            while size < analysis_service.batch_chunk_size and not queue.empty():
+                batch.append(queue.get_nowait())
+                size += len(batch[-1][0])
+
+            comments = [comment for group, _ in batch for comment in group]
+            requests = [request for _, requests in batch for request in requests]
+            while True:
+                try:
+                    items = await analysis_service.analyze_batch(requests)
+                    entries = [(comment, item.result, item.error, item.cluster_id) for comment, item in zip(comments, items)]
+                except UpstreamUnavailable as e:
+                    # 上流が回復するまで待ってから同じバッチをやり直す（完了分はキャッシュ済み）
+                    log_event("judge_job_waiting", level="warning", job_id=job_id, upstream="llm", retry_after=round(e.retry_after, 1))
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except Exception as e:
+                    entries = [(comment, None, str(e), None) for comment in comments]
+                break
+
+            try:
+                await asyncio.to_thread(self.store.save_results, job_id, entries)
+            except Exception as e:
+                log_event("judge_job_save_failed", level="error", job_id=job_id, error=type(e).__name__, detail=str(e))
+            finally:
+                for _ in batch:
+                    queue.task_done()
+            await self._notify(job_id)
+
+    async def shutdown(self) -> None:
+        """実行中のジョブを停止（状態は保存済みのため次回起動時に再開される）"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.store.close()
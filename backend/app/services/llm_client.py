@@ -0,0 +1,40 @@
+import os
+from typing import Optional, Tuple
+
+from openai import AsyncOpenAI
+
+from app.services.fake_llm import FakeAsyncLLMClient
+
+
+def create_llm_client(api_key: str, timeout: Optional[float] = None, base_url: Optional[str] = None):
+    """LLM_BACKEND環境変数に応じて非同期LLMクライアントを生成"""
+    backend = os.getenv("LLM_BACKEND", "openai").lower()
+
+    if backend == "fake":
+        return FakeAsyncLLMClient()
+
+    if backend != "openai":
+        raise ValueError(f"未対応のLLMバックエンドです: {backend}")
+
+    # 再試行は呼び出し側（app.core.upstream）で行うため、SDK側の自動再試行は無効にする
+    kwargs = {"api_key": api_key, "max_retries": 0}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    if base_url:
+        kwargs["base_url"] = base_url
+    return AsyncOpenAI(**kwargs)
+
+
+def create_provider_client(provider: str, timeout: Optional[float] = None) -> Tuple[object, str]:
+    """代替モデル用のOpenAI互換プロバイダーのクライアントと APIキーを生成
+
+    接続先は LLM_PROVIDER_{名前}_BASE_URL / LLM_PROVIDER_{名前}_API_KEY で指定する（名前が fake なら疑似バックエンド）。
+    """
+    if provider == "fake":
+        return FakeAsyncLLMClient(), ""
+    prefix = f"LLM_PROVIDER_{provider.upper()}"
+    base_url = os.getenv(f"{prefix}_BASE_URL")
+    if not base_url:
+        raise ValueError(f"プロバイダー {provider} の接続先（{prefix}_BASE_URL）が設定されていません")
+    api_key = os.getenv(f"{prefix}_API_KEY", "")
+    return create_llm_client(api_key, timeout=timeout, base_url=base_url), api_key
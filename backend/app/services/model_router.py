@@ -0,0 +1,183 @@
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from app.models.comment import AnalysisRequest, ProtestRequest
+from app.services.context_budget import count_tokens
+
+# リクエストごとのモデル選択
+# モデルを安価なものから順に階層として並べ、分析・抗議は基準の階層から始めて
+# 難しさの兆候（長いコメント・長いスレッド・ローカル分類器の確信度の低さ・抗議の回数）が
+# 1つあるごとに1段上の階層へ上げる。モデル名は「プロバイダー:モデル」の形で
+# OpenAI互換の別プロバイダーを指定でき、失敗・タイムアウト時の代替モデルと、
+# 応答が遅いときに同じ呼び出しをもう1回送るヘッジの判断もここで行う。
+
+DEFAULT_PROVIDER = "openai"
+_HEDGE_MIN_SAMPLES = 20
+_LATENCY_WINDOW = 200
+
+
+class Route(NamedTuple):
+    tier: str
+    model: str
+    reasons: Tuple[str, ...]  # 階層を上げた理由
+
+
+def split_model(spec: str) -> Tuple[str, str]:
+    """「プロバイダー:モデル」を (プロバイダー, モデル) に分ける（プロバイダー省略時は openai）"""
+    provider, sep, model = spec.partition(":")
+    if not sep:
+        return DEFAULT_PROVIDER, spec
+    return provider.strip().lower() or DEFAULT_PROVIDER, model.strip()
+
+
+def parse_pairs(value: str) -> List[Tuple[str, str]]:
+    """「名前=値,名前=値」形式の設定を順序を保って読む"""
+    pairs = []
+    for item in value.split(","):
+        name, sep, target = item.partition("=")
+        if sep and name.strip() and target.strip():
+            pairs.append((name.strip(), target.strip()))
+    return pairs
+
+
+class ModelRouter:
+    """分析・抗議に使うモデルの選択、代替モデル、ヘッジの判断"""
+
+    def __init__(self, tiers: List[Tuple[str, str]], fallbacks: Optional[Dict[str, str]] = None,
+                 analysis_tier: Optional[str] = None, protest_tier: Optional[str] = None,
+                 long_comment_tokens: int = 150, context_comments: int = 3, min_confidence: float = 0.5,
+                 protest_escalate_round: int = 2, hedge_enabled: bool = True, hedge_percentile: float = 95.0,
+                 hedge_min_seconds: float = 1.0, hedge_max_ratio: float = 0.05):
+        if not tiers:
+            raise ValueError("モデルの階層が設定されていません")
+        self.tiers = tiers
+        self.tier_names = [name for name, _ in tiers]
+        self.fallbacks = fallbacks or {}
+        self.analysis_tier = self._tier_index(analysis_tier or self.tier_names[0])
+        # 抗議は従来どおり最上位の階層（gpt-4o）を既定とする
+        self.protest_tier = self._tier_index(protest_tier or self.tier_names[-1])
+        self.long_comment_tokens = long_comment_tokens
+        self.context_comments = context_comments
+        self.min_confidence = min_confidence
+        self.protest_escalate_round = protest_escalate_round
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.hedge_max_ratio = hedge_max_ratio
+        # モデルごとの直近の応答時間（ヘッジまでの待ち時間の算出用）
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], int] = {}
+        self._stats = {"calls": 0, "fallbacks": 0, "hedged": 0, "hedge_wins": 0}
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        return cls(
+            tiers=parse_pairs(os.getenv("LLM_MODEL_TIERS", "small=gpt-4o-mini,large=gpt-4o")),
+            fallbacks=dict(parse_pairs(os.getenv("LLM_FALLBACK_MODELS", "gpt-4o=gpt-4o-mini,gpt-4o-mini=gpt-4o"))),
+            analysis_tier=os.getenv("ROUTER_ANALYSIS_TIER") or None,
+            protest_tier=os.getenv("ROUTER_PROTEST_TIER") or None,
+            long_comment_tokens=int(os.getenv("ROUTER_LONG_COMMENT_TOKENS", "150")),
+            context_comments=int(os.getenv("ROUTER_CONTEXT_COMMENTS", "3")),
+            min_confidence=float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.5")),
+            protest_escalate_round=int(os.getenv("ROUTER_PROTEST_ESCALATE_ROUND", "2")),
+            hedge_enabled=os.getenv("LLM_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes"),
+            hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+            hedge_min_seconds=float(os.getenv("LLM_HEDGE_MIN_SECONDS", "1.0")),
+            hedge_max_ratio=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05"))
+        )
+
+    def _tier_index(self, name: str) -> int:
+        if name not in self.tier_names:
+            raise ValueError(f"未定義のモデル階層です: {name}（{', '.join(self.tier_names)}）")
+        return self.tier_names.index(name)
+
+    def _route(self, task: str, base: int, reasons: List[str]) -> Route:
+        index = min(base + len(reasons), len(self.tiers) - 1)
+        tier, model = self.tiers[index]
+        with self._lock:
+            self._routes[(task, tier)] = self._routes.get((task, tier), 0) + 1
+        return Route(tier, model, tuple(reasons))
+
+    def route_analysis(self, request: AnalysisRequest, confidence: Optional[float] = None) -> Route:
+        """コメントの長さ・文脈の長さ・ローカル分類器の確信度からモデルを選ぶ"""
+        reasons = []
+        if count_tokens(request.comment_text) >= self.long_comment_tokens:
+            reasons.append("long_comment")
+        if request.context_comments and len(request.context_comments) >= self.context_comments:
+            reasons.append("long_thread")
+        if confidence is not None and confidence < self.min_confidence:
+            reasons.append("low_confidence")
+        return self._route("analysis", self.analysis_tier, reasons)
+
+    def route_protest(self, request: ProtestRequest) -> Route:
+        """抗議の回数とコメントの長さからモデルを選ぶ"""
+        reasons = []
+        protest_round = 1 + sum(1 for message in request.conversation_history if message.role == "user")
+        if protest_round >= self.protest_escalate_round:
+            reasons.append("repeated_protest")
+        if count_tokens(request.comment_text) >= self.long_comment_tokens:
+            reasons.append("long_comment")
+        return self._route("protest", self.protest_tier, reasons)
+
+    def candidates(self, model: str) -> List[str]:
+        """指定モデルと、失敗時に順に試す代替モデルの列（循環は除く）"""
+        chain = [model]
+        while chain[-1] in self.fallbacks and self.fallbacks[chain[-1]] not in chain:
+            chain.append(self.fallbacks[chain[-1]])
+        return chain
+
+    def record_call(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._stats["calls"] += 1
+            latencies = self._latencies.get(model)
+            if latencies is None:
+                latencies = self._latencies[model] = deque(maxlen=_LATENCY_WINDOW)
+            latencies.append(seconds)
+
+    def record_fallback(self) -> None:
+        with self._lock:
+            self._stats["fallbacks"] += 1
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """直近の応答時間のパーセンタイルを超えたらヘッジする（記録が少ないうちはしない）"""
+        if not self.hedge_enabled:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(model) or ())
+        if len(latencies) < _HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return max(self.hedge_min_seconds, latencies[index])
+
+    def acquire_hedge(self) -> bool:
+        """ヘッジによる追加の呼び出しが全体の hedge_max_ratio 以内に収まる場合のみ許可"""
+        with self._lock:
+            if self._stats["hedged"] + 1 > self._stats["calls"] * self.hedge_max_ratio:
+                return False
+            self._stats["hedged"] += 1
+            return True
+
+    def record_hedge_win(self) -> None:
+        with self._lock:
+            self._stats["hedge_wins"] += 1
+
+    def route_counts(self) -> Dict[Tuple[str, str], int]:
+        with self._lock:
+            return dict(self._routes)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            stats = dict(self._stats)
+            routes: Dict[str, Dict[str, int]] = {}
+            for (task, tier), count in self._routes.items():
+                routes.setdefault(task, {})[tier] = count
+        return {
+            **stats,
+            "tiers": dict(self.tiers),
+            "fallbacks_config": self.fallbacks,
+            "routes": routes,
+            "hedge_delay_seconds": {model: self.hedge_delay(model) for model in list(self._latencies)}
+        }
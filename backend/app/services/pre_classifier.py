@@ -0,0 +1,276 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.log import log_event
+from app.models.comment import AnalysisRequest, AnalysisResult
+from app.services.analysis_cache import normalize_text
+
+# ローカルで判定するカテゴリ（それ以外はすべてLLMへ回す）
+LOCAL_LABELS = ["感謝", "賞賛", "感想"]
+OTHER_LABEL = "その他"
+LABELS = LOCAL_LABELS + [OTHER_LABEL]
+
+# ローカル判定した結果を保存するときのバージョン接頭辞（学習データから除外するため）
+LOCAL_VERSION_PREFIX = "local:"
+
+# 辞書ルール：NFKC正規化・小文字化した本文に対して評価する
+# 「草」「w」「笑」「lol」などは嘲笑（アウト）にもなるため、どのカテゴリーにも含めない
+_LEXICON = [
+    ("感謝", re.compile(r"ありがと|有難う|有り難う|感謝|サンキュー|\bthanks\b|\bthank you\b|\bthx\b|\bty\b")),
+    ("賞賛", re.compile(r"すご[いすっ]|凄[いすっ]|すばらし|素晴らし|最高|神(回|動画|すぎ|過ぎ|編集)?$|天才|かっこい|カッコい|かわい|可愛|上手|"
+                      r"\bgreat\b|\bamazing\b|\bawesome\b|\bnice\b|\bcool\b|\bbest\b|\bgoat\b")),
+    ("感想", re.compile(r"面白|おもしろ|泣いた|感動|好き|楽しかった|\bfirst\b$|\b1st\b$|一番乗り|初見")),
+]
+# 学習済みモデルがない場合は、本文全体がお礼だけのコメントに限ってローカルで判定する
+_THANKS_ONLY = re.compile(
+    r"(ありがと(う|うございます|うございました)?|有(難|り難)う(ございます|ございました)?|感謝(します|です)?|サンキュー|"
+    r"thanks?( you)?( so much| a lot)?|thx|ty)[ !！。.〜~♪]*"
+)
+# 反論・質問・否定・攻撃・嘲笑の兆候があればローカルでは判定しない
+_ESCALATE = re.compile(
+    r"[?？]|でも|しかし|けど|けれど|だが|違う|ちが[うく]|嘘|うそ|ない|ません|じゃね|だろ|"
+    r"バカ|馬鹿|アホ|クソ|くそ|死ね|しね|シネ|消え|キモ|きも|キショ|きしょ|下手|つまらな|ひど|酷|"
+    r"ゴミ|ごみ|カス|ブス|ぶす|うざ|ウザ|詐欺|ハゲ|はげ|デブ|でぶ|雑魚|ざこ|ザコ|ガイジ|"
+    r"下品|げひん|最低|さいてい|ダサ|ダセ|(?<!く)ださ|(?<!く)だせ|ブサ|ぶさ|醜|気持ち悪|きもちわる|不快|"
+    r"草|笑|わろ|ワロ|(^|[^a-z])w+$|"
+    r"\bbut\b|\bnot\b|n't|\bno\b|wrong|stupid|idiot|dumb|moron|loser|ugly|trash|garbage|nasty|gross|"
+    r"clown|scam|fraud|fake|worst|hate|sucks|lame|cringe|\bkys\b|kill yourself|\blol\b|\blmao\b|\brofl\b|"
+    r"https?://|@"
+)
+_EMOJI_PRAISE = set("🔥👏👍💯✨🙌🎉❤💕💖😍🥰🤩⭐🌟")
+# 笑い転げる絵文字は「草」と同じく嘲笑にも使われるため含めない
+_EMOJI_FUN = set("😄😁😊☺🥲😭")
+
+
+def _is_emoji_only(text: str) -> bool:
+    return bool(text) and all(unicodedata.category(c) in ("So", "Sk", "Mn", "Cf", "Zs") or c in "!！." for c in text)
+
+
+def _features(text: str, dimensions: int) -> Dict[int, float]:
+    """文字1〜3-gramをハッシュ化した疎ベクトル（L2正規化済み）"""
+    padded = f"^{text}$"
+    counts: Dict[int, float] = {}
+    for n in (1, 2, 3):
+        for i in range(len(padded) - n + 1):
+            index = zlib.crc32(padded[i:i + n].encode("utf-8")) % dimensions
+            counts[index] = counts.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+
+class HashedNGramModel:
+    """ハッシュ化n-gramの多クラスロジスティック回帰（ソフトマックス）"""
+
+    def __init__(self, dimensions: int = 1 << 18, weights: Optional[List[Dict[int, float]]] = None, bias: Optional[List[float]] = None, samples: int = 0):
+        self.dimensions = dimensions
+        self.weights = weights or [{} for _ in LABELS]
+        self.bias = bias or [0.0] * len(LABELS)
+        self.samples = samples
+
+    def predict(self, text: str) -> List[float]:
+        features = _features(text, self.dimensions)
+        scores = [
+            self.bias[k] + sum(self.weights[k].get(i, 0.0) * v for i, v in features.items())
+            for k in range(len(LABELS))
+        ]
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    @classmethod
+    def train(cls, samples: List[Tuple[str, int]], epochs: int = 5, learning_rate: float = 0.5, l2: float = 1e-6, dimensions: int = 1 << 18) -> "HashedNGramModel":
+        """確率的勾配降下法で学習"""
+        model = cls(dimensions=dimensions, samples=len(samples))
+        vectors = [(_features(text, dimensions), label) for text, label in samples]
+        rng = random.Random(0)
+        for epoch in range(epochs):
+            rng.shuffle(vectors)
+            rate = learning_rate / (1 + epoch)
+            for features, label in vectors:
+                scores = [
+                    model.bias[k] + sum(model.weights[k].get(i, 0.0) * v for i, v in features.items())
+                    for k in range(len(LABELS))
+                ]
+                top = max(scores)
+                exps = [math.exp(s - top) for s in scores]
+                total = sum(exps)
+                for k in range(len(LABELS)):
+                    gradient = exps[k] / total - (1.0 if k == label else 0.0)
+                    if gradient == 0.0:
+                        continue
+                    weights = model.weights[k]
+                    for i, v in features.items():
+                        w = weights.get(i, 0.0)
+                        weights[i] = w - rate * (gradient * v + l2 * w)
+                    model.bias[k] -= rate * gradient
+        return model
+
+    def to_dict(self) -> dict:
+        return {
+            "labels": LABELS,
+            "dimensions": self.dimensions,
+            "samples": self.samples,
+            "bias": self.bias,
+            # 影響の小さい重みは保存しない
+            "weights": [{str(i): round(w, 6) for i, w in weights.items() if abs(w) >= 1e-4} for weights in self.weights]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HashedNGramModel":
+        if data.get("labels") != LABELS:
+            raise ValueError("学習済みモデルのラベル構成が一致しません")
+        return cls(
+            dimensions=data["dimensions"],
+            weights=[{int(i): w for i, w in weights.items()} for weights in data["weights"]],
+            bias=data["bias"],
+            samples=data.get("samples", 0)
+        )
+
+
+def label_for(result: AnalysisResult) -> int:
+    """保存済みの分析結果を学習ラベルへ変換（ローカル判定対象のカテゴリのみのものだけを正例とする）"""
+    if result.is_counter or result.safe_or_out != "safe" or not result.category:
+        return LABELS.index(OTHER_LABEL)
+    if all(c in LOCAL_LABELS or c == "共感" for c in result.category) and result.category[0] in LOCAL_LABELS:
+        return LABELS.index(result.category[0])
+    return LABELS.index(OTHER_LABEL)
+
+
+class PreClassifier:
+    """明らかに無害な短いコメントをLLMを呼ばずに判定するローカル分類器
+
+    辞書ルールで候補を決め、学習済みモデルがあれば確信度を確認する。
+    反論・否定・質問などの兆候があるコメントや長いコメントは判定せず None を返す。
+    """
+
+    def __init__(self, model_path: Optional[str] = None, threshold: float = 0.9, max_length: int = 40):
+        self.model_path = model_path
+        self.threshold = threshold
+        self.max_length = max_length
+        self.model: Optional[HashedNGramModel] = None
+        self._lock = threading.Lock()
+        self._stats = {"local": 0, "escalated": 0}
+        if model_path and os.path.exists(model_path):
+            try:
+                with open(model_path, "r", encoding="utf-8") as f:
+                    self.model = HashedNGramModel.from_dict(json.load(f))
+                log_event("pre_classifier_loaded", samples=self.model.samples)
+            except (OSError, ValueError, KeyError) as e:
+                log_event("pre_classifier_load_failed", level="warning", path=model_path, error=type(e).__name__, detail=str(e))
+
+    @classmethod
+    def from_env(cls) -> Optional["PreClassifier"]:
+        if os.getenv("PRE_CLASSIFIER_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            model_path=os.getenv("PRE_CLASSIFIER_MODEL", "pre_classifier.json"),
+            threshold=float(os.getenv("PRE_CLASSIFIER_THRESHOLD", "0.9")),
+            max_length=int(os.getenv("PRE_CLASSIFIER_MAX_LENGTH", "40"))
+        )
+
+    @property
+    def version(self) -> str:
+        samples = self.model.samples if self.model is not None else 0
+        return f"{LOCAL_VERSION_PREFIX}{samples}"
+
+    def _rule_label(self, text: str) -> Optional[str]:
+        if _is_emoji_only(text):
+            emojis = set(text)
+            if emojis & _EMOJI_PRAISE:
+                return "賞賛"
+            if emojis & _EMOJI_FUN:
+                return "感想"
+            return None
+        for label, pattern in _LEXICON:
+            if pattern.search(text):
+                return label
+        return None
+
+    def _predict(self, text: str) -> Optional[str]:
+        if not text or len(text) > self.max_length or _ESCALATE.search(text):
+            return None
+
+        # 絵文字だけ・お礼だけのコメントは辞書だけで判定する
+        if _is_emoji_only(text):
+            return self._rule_label(text)
+        if _THANKS_ONLY.fullmatch(text):
+            return "感謝"
+
+        # それ以外は辞書の部分一致だけで判定すると侮辱を含むコメントを見逃すため、学習済みモデルの確信度も求める
+        model = self.model
+        if model is None:
+            return None
+
+        label = self._rule_label(text)
+
+        probabilities = model.predict(text)
+        best = max(range(len(LABELS)), key=lambda k: probabilities[k])
+        if label is not None:
+            # 辞書の候補も、モデルがそのカテゴリーを高い確信度で支持する場合だけローカルで判定する
+            return label if probabilities[LABELS.index(label)] >= self.threshold else None
+        if LABELS[best] != OTHER_LABEL and probabilities[best] >= self.threshold:
+            return LABELS[best]
+        return None
+
+    def classify(self, request: AnalysisRequest) -> Optional[AnalysisResult]:
+        """確信度が高い場合のみ分析結果を返す"""
+        label = self._predict(normalize_text(request.comment_text).lower())
+        with self._lock:
+            self._stats["local" if label is not None else "escalated"] += 1
+        if label is None:
+            return None
+        return AnalysisResult(
+            category=[label],
+            is_counter=False,
+            graham_hierarchy=None,
+            logical_fallacy=None,
+            validity_assessment="判断困難",
+            safe_or_out="safe",
+            explanation=f"{label}を伝える短いコメントであり、他者への攻撃的な表現は含まれていないためセーフと判定しました。",
+            validity_reason="主張を含まないコメントのため妥当性は評価していません。"
+        )
+
+    def confidence(self, request: AnalysisRequest) -> Optional[float]:
+        """学習済みモデルが最も確からしいとしたカテゴリの確率（モデルがなければ None）"""
+        model = self.model
+        text = normalize_text(request.comment_text).lower()
+        if model is None or not text:
+            return None
+        return max(model.predict(text))
+
+    def train(self, examples: Iterable[Tuple[str, AnalysisResult]], epochs: int = 5) -> Dict[str, int]:
+        """保存済みの分析結果（LLMによるもの）から学習し、モデルを保存"""
+        samples = [(normalize_text(text).lower(), label_for(result)) for text, result in examples]
+        samples = [(text, label) for text, label in samples if text]
+        if not samples:
+            raise ValueError("学習に使える分析結果がありません")
+
+        model = HashedNGramModel.train(samples, epochs=epochs)
+        if self.model_path:
+            with open(self.model_path, "w", encoding="utf-8") as f:
+                json.dump(model.to_dict(), f)
+        self.model = model
+
+        counts = {label: 0 for label in LABELS}
+        for _, label in samples:
+            counts[LABELS[label]] += 1
+        return counts
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            total = self._stats["local"] + self._stats["escalated"]
+            return {
+                **self._stats,
+                "local_ratio": self._stats["local"] / total if total else 0.0,
+                "threshold": self.threshold,
+                "max_length": self.max_length,
+                "model_samples": self.model.samples if self.model is not None else 0
+            }
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.models.comment import AnalysisResult, ConversationMessage, ProtestRequest
+
+# サーバー側で保持する抗議の会話
+# クライアントは新しい抗議の本文だけを送り、サーバーが会話にやり取りを追記する。
+# プロンプトの固定部分（元のコメントと判定）と会話部分は追記のたびに差分だけ更新し、
+# 抗議のたびに会話全体を組み立て直さない。
+
+
+class ProtestSession:
+    """1件の判定に対する抗議の会話"""
+
+    def __init__(self, session_id: str, comment_text: str, result: AnalysisResult, head: str):
+        self.session_id = session_id
+        self.comment_text = comment_text
+        self.original_result = result
+        # 判定が変更されたら新しい判定に置き換える（以降の抗議はその判定に対するもの）
+        self.current_result = result
+        self.history: List[ConversationMessage] = []
+        # プロンプトの固定部分と、追記していく会話部分（「ユーザー: ...」の行）
+        self.head = head
+        self.conversation = ""
+        self.history_tokens = 0
+        self.expires_at = 0.0
+        # 同じ会話への抗議は1件ずつ処理する
+        self.lock = asyncio.Lock()
+
+    @property
+    def protest_round(self) -> int:
+        return 1 + sum(1 for message in self.history if message.role == "user")
+
+    def append(self, message: ConversationMessage, line: str, tokens: int) -> None:
+        self.history.append(message)
+        self.conversation += line
+        self.history_tokens += tokens
+
+    def as_request(self, protest_message: str) -> ProtestRequest:
+        """従来の抗議リクエストと同じ形（モデル選択・履歴の要約用。検証は省く）"""
+        return ProtestRequest.model_construct(
+            comment_text=self.comment_text,
+            original_result=self.current_result,
+            protest_message=protest_message,
+            conversation_history=self.history
+        )
+
+
+class ProtestSessionStore:
+    """抗議の会話をメモリ上に保持するストア（最後の抗議から ttl 秒で失効、件数の上限を超えたら古いものから破棄）"""
+
+    def __init__(self, ttl_seconds: float = 1800, max_sessions: int = 1000, max_turns: int = 20):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, ProtestSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "expired": 0, "evicted": 0}
+
+    @classmethod
+    def from_env(cls) -> "ProtestSessionStore":
+        return cls(
+            ttl_seconds=float(os.getenv("PROTEST_SESSION_TTL_SECONDS", "1800")),
+            max_sessions=int(os.getenv("PROTEST_SESSION_MAX", "1000")),
+            max_turns=int(os.getenv("PROTEST_SESSION_MAX_TURNS", "20"))
+        )
+
+    def _purge(self, now: float) -> None:
+        # 並びは最終利用順なので、先頭から期限切れを捨てる
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.expires_at > now:
+                break
+            self._sessions.popitem(last=False)
+            self._stats["expired"] += 1
+
+    def create(self, comment_text: str, result: AnalysisResult, head: str) -> ProtestSession:
+        session = ProtestSession(uuid.uuid4().hex, comment_text, result, head)
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            session.expires_at = now + self.ttl_seconds
+            self._sessions[session.session_id] = session
+            self._stats["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[ProtestSession]:
+        """期限内の会話を取得し、有効期限を延ばす"""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.expires_at = now + self.ttl_seconds
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            self._purge(time.time())
+            return {
+                **self._stats,
+                "active": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds
+            }
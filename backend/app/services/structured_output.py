@@ -0,0 +1,268 @@
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+from app.services.json_stream import extract_json_object
+
+# LLMの構造化出力
+# スキーマ付きのJSON出力を要求し、返ってきた応答はローカルで修復・検証する。
+# 修復できなかった項目だけを呼び出し側が再要求できるよう、不足項目の一覧を返す。
+
+CATEGORIES = [
+    "皮肉", "嘲笑", "感想", "意見", "アドバイス", "批判", "誹謗中傷", "悪口", "侮辱", "上から目線", "論点すり替え",
+    "攻撃的", "賞賛", "感謝", "情報提供", "問題提起", "正論", "差別的", "共感", "質問", "回答", "要望", "指図"
+]
+VALIDITY_LEVELS = ["高い", "中程度", "低い", "判断困難"]
+
+_NULLABLE_STRING = {"type": ["string", "null"]}
+
+ANALYSIS_PROPERTIES: Dict[str, dict] = {
+    "category": {"type": "array", "items": {"type": "string", "enum": CATEGORIES}},
+    "isCounter": {"type": "boolean"},
+    "grahamHierarchy": _NULLABLE_STRING,
+    "logicalFallacy": _NULLABLE_STRING,
+    "validityAssessment": {"type": "string", "enum": VALIDITY_LEVELS},
+    "safeOrOut": {"type": "string", "enum": ["safe", "out"]},
+    "explanation": {"type": "string"},
+    "validityReason": {"type": "string"}
+}
+
+PROTEST_PROPERTIES: Dict[str, dict] = {
+    "umpireResponse": {"type": "string"},
+    "judgmentChanged": {"type": "boolean"},
+    "newSafeOrOut": {"type": ["string", "null"], "enum": ["safe", "out", None]},
+    "newExplanation": _NULLABLE_STRING
+}
+
+# 省略しても既定値で補える項目（それ以外が欠けていたら再要求する）
+ANALYSIS_OPTIONAL = {"grahamHierarchy": None, "logicalFallacy": None, "validityAssessment": "判断困難", "validityReason": ""}
+PROTEST_OPTIONAL = {"newSafeOrOut": None, "newExplanation": None}
+
+_CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_CAMEL_BOUNDARY = re.compile(r"_([a-z])")
+
+
+def object_schema(properties: Dict[str, dict]) -> dict:
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+def response_format(name: str, schema: dict) -> dict:
+    """OpenAI の Structured Outputs 形式の response_format"""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+
+ANALYSIS_RESPONSE_FORMAT = response_format("comment_analysis", object_schema(ANALYSIS_PROPERTIES))
+BATCH_RESPONSE_FORMAT = response_format("comment_analysis_batch", object_schema({
+    "results": {"type": "array", "items": object_schema({"index": {"type": "integer"}, **ANALYSIS_PROPERTIES})}
+}))
+PROTEST_RESPONSE_FORMAT = response_format("protest_response", object_schema(PROTEST_PROPERTIES))
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """文字列の外にある閉じ括弧直前のカンマを取り除く"""
+    out: List[str] = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "}]":
+            # 直前の空白を飛ばしてカンマがあれば削除
+            i = len(out) - 1
+            while i >= 0 and out[i].isspace():
+                i -= 1
+            if i >= 0 and out[i] == ",":
+                del out[i]
+        out.append(char)
+    return "".join(out)
+
+
+def _close_truncated(text: str) -> str:
+    """途中で切れたJSONの文字列・配列・オブジェクトを閉じる"""
+    stack: List[str] = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    if escape:
+        text = text[:-1]
+    if in_string:
+        text += '"'
+    # 値の途中（「"key":」や末尾のカンマ）で切れている場合は取り除く
+    text = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*|:\s*)$', "", text.rstrip())
+    return text + "".join(reversed(stack))
+
+
+def repair_json(content: str) -> Tuple[dict, bool]:
+    """LLMの応答からJSONオブジェクトを取り出す（必要ならコードフェンス・末尾カンマ・途中切れを修復）
+
+    (オブジェクト, 修復したかどうか) を返す。修復できなければ ValueError。
+    """
+    try:
+        return extract_json_object(content), False
+    except ValueError:
+        pass
+
+    fenced = _CODE_FENCE.search(content)
+    text = fenced.group(1) if fenced else content
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("有効なJSON応答が得られませんでした")
+    text = _strip_trailing_commas(text[start:])
+    for candidate in (text, _close_truncated(text)):
+        try:
+            return extract_json_object(candidate), True
+        except ValueError:
+            continue
+    raise ValueError("有効なJSON応答が得られませんでした")
+
+
+def to_camel(key: str) -> str:
+    return _CAMEL_BOUNDARY.sub(lambda m: m.group(1).upper(), key)
+
+
+# 検証関数が「不足・不正」を表すために返す値（None は null 許容の項目の正しい値）
+_INVALID = object()
+
+
+def _as_bool(value: Any) -> Any:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    return _INVALID
+
+
+def _as_judgment(value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("safe", "セーフ"):
+            return "safe"
+        if value in ("out", "アウト"):
+            return "out"
+    return _INVALID
+
+
+def _as_text(value: Any) -> Any:
+    return value if isinstance(value, str) and value.strip() else _INVALID
+
+
+def _as_nullable_text(value: Any) -> Any:
+    if value is None or (isinstance(value, str) and value.strip().lower() in ("", "null", "none")):
+        return None
+    return value if isinstance(value, str) else _INVALID
+
+
+def _as_validity(value: Any) -> Any:
+    return value if value in VALIDITY_LEVELS else _INVALID
+
+
+def _as_categories(value: Any) -> Any:
+    if isinstance(value, str):
+        value = [part.strip() for part in re.split(r"[、,/]", value)]
+    if not isinstance(value, list):
+        return _INVALID
+    categories = [c for c in value if isinstance(c, str) and c in CATEGORIES]
+    return categories or _INVALID
+
+
+_ANALYSIS_VALIDATORS = {
+    "category": _as_categories,
+    "isCounter": _as_bool,
+    "grahamHierarchy": _as_nullable_text,
+    "logicalFallacy": _as_nullable_text,
+    "validityAssessment": _as_validity,
+    "safeOrOut": _as_judgment,
+    "explanation": _as_text,
+    "validityReason": _as_text
+}
+
+# 新しい判定・説明の null は「未指定」として扱い、判定が変わった場合だけ再要求する
+_PROTEST_VALIDATORS = {
+    "umpireResponse": _as_text,
+    "judgmentChanged": _as_bool,
+    "newSafeOrOut": _as_judgment,
+    "newExplanation": _as_text
+}
+
+
+def _validate(data: dict, validators: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    normalized = {to_camel(key): value for key, value in data.items()}
+    valid: Dict[str, Any] = {}
+    failing: List[str] = []
+    for key, validator in validators.items():
+        value = validator(normalized[key]) if key in normalized else _INVALID
+        if value is _INVALID:
+            failing.append(key)
+        else:
+            valid[key] = value
+    return valid, failing
+
+
+def validate_analysis(data: dict) -> Tuple[Dict[str, Any], List[str]]:
+    """分析結果のJSONを検証し、(正しい項目, 不足・不正な項目) を返す（snake_caseのキーも受け付ける）"""
+    return _validate(data, _ANALYSIS_VALIDATORS)
+
+
+def validate_protest(data: dict) -> Tuple[Dict[str, Any], List[str]]:
+    """抗議への応答のJSONを検証し、(正しい項目, 不足・不正な項目) を返す"""
+    return _validate(data, _PROTEST_VALIDATORS)
+
+
+def protest_required(valid: Dict[str, Any]) -> List[str]:
+    """省略可の項目のうち、判定が変わった場合に必須となる項目（新しい判定と説明）"""
+    return list(PROTEST_OPTIONAL) if valid.get("judgmentChanged") else []
+
+
+def fill_defaults(valid: Dict[str, Any], failing: List[str], optional: Dict[str, Any]) -> List[str]:
+    """既定値で補える項目を補い、補えない項目を返す"""
+    remaining = []
+    for key in failing:
+        if key in optional:
+            valid[key] = optional[key]
+        else:
+            remaining.append(key)
+    return remaining
+
+
+def _non_null(schema: dict) -> dict:
+    """null を許容しないスキーマ（再要求する項目は値が必要なため）"""
+    schema = dict(schema)
+    if isinstance(schema.get("type"), list):
+        types = [t for t in schema["type"] if t != "null"]
+        schema["type"] = types[0] if len(types) == 1 else types
+    if "enum" in schema:
+        schema["enum"] = [value for value in schema["enum"] if value is not None]
+    return schema
+
+
+def field_request(fields: List[str], properties: Dict[str, dict]) -> Tuple[str, dict]:
+    """不足項目だけを再要求するメッセージと response_format"""
+    schema = {key: _non_null(properties[key]) for key in fields}
+    message = (
+        "直前の応答では次の項目が欠けているか形式が正しくありませんでした：" + ", ".join(fields) + "\n"
+        "これらの項目だけを含むJSONオブジェクトを返してください。\n"
+        + json.dumps(schema, ensure_ascii=False)
+    )
+    return message, response_format("missing_fields", object_schema(schema))
@@ -0,0 +1,194 @@
+import json
+import re
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.models.comment import AnalysisResult
+from app.services.structured_output import CATEGORIES, VALIDITY_LEVELS
+
+# 動画ごとの判定結果の集計
+# 分析結果が保存されるたびに差分だけを加算し（再分析で置き換えた結果は減算）、
+# 問い合わせ時は保持している件数を読むだけにする。件数は動画ごとに1本の array に
+# 固定の並びで詰め、投稿者と時間帯の件数だけを辞書で持つ。
+
+GRAHAM_LEVELS = 7  # Lv1: 罵倒 〜 Lv7: 主眼論破
+LOGICAL_FALLACIES = ["対人論証", "権威論証", "ストローマン論法", "お前だって論法", "滑り坂論法"]
+OTHER = "その他"
+TOP_AUTHORS = 10
+
+_GRAHAM_LEVEL = re.compile(r"(?:Lv|レベル)\s*([1-7])", re.IGNORECASE)
+_CATEGORY_INDEX = {name: i for i, name in enumerate(CATEGORIES)}
+_FALLACY_INDEX = {name: i for i, name in enumerate(LOGICAL_FALLACIES)}
+_VALIDITY_INDEX = {name: i for i, name in enumerate(VALIDITY_LEVELS)}
+
+# 件数の並び：全体・アウト・反論 / カテゴリー / 反論レベル（該当なしを含む）/ 論理的誤謬（その他を含む）/ 妥当性
+_TOTAL, _OUT, _COUNTER = 0, 1, 2
+_CATEGORY = 3
+_GRAHAM = _CATEGORY + len(CATEGORIES)
+_FALLACY = _GRAHAM + GRAHAM_LEVELS + 1
+_VALIDITY = _FALLACY + len(LOGICAL_FALLACIES) + 1
+_SIZE = _VALIDITY + len(VALIDITY_LEVELS)
+
+
+def _indices(result: dict) -> List[int]:
+    """分析結果（AnalysisResult を辞書にしたもの）が加算する件数の位置"""
+    indices = [_TOTAL]
+    if result.get("safe_or_out") == "out":
+        indices.append(_OUT)
+    if result.get("is_counter"):
+        indices.append(_COUNTER)
+    for category in dict.fromkeys(result.get("category") or ()):
+        if category in _CATEGORY_INDEX:
+            indices.append(_CATEGORY + _CATEGORY_INDEX[category])
+    graham = result.get("graham_hierarchy")
+    if graham:
+        match = _GRAHAM_LEVEL.search(graham)
+        if match:
+            indices.append(_GRAHAM + int(match.group(1)) - 1)
+        else:
+            indices.append(_GRAHAM + GRAHAM_LEVELS)
+    fallacy = result.get("logical_fallacy")
+    if fallacy:
+        indices.append(_FALLACY + _FALLACY_INDEX.get(fallacy, len(LOGICAL_FALLACIES)))
+    validity = result.get("validity_assessment")
+    if validity in _VALIDITY_INDEX:
+        indices.append(_VALIDITY + _VALIDITY_INDEX[validity])
+    return indices
+
+
+class VideoAggregate:
+    """1本の動画の集計"""
+
+    __slots__ = ("counts", "offenders", "top_offenders", "buckets")
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * _SIZE))
+        # 投稿者ごとのアウト件数と、その上位の (-件数, 投稿者)（アウト件数が変わった投稿者だけで更新する）
+        self.offenders: Dict[str, int] = {}
+        self.top_offenders: List[Tuple[int, str]] = []
+        # 時間帯（投稿日時の先頭部分）ごとの [件数, アウト件数]
+        self.buckets: Dict[str, array] = {}
+
+    def apply(self, result: dict, author: str, bucket: str, sign: int) -> None:
+        counts = self.counts
+        for index in _indices(result):
+            counts[index] += sign
+        is_out = result.get("safe_or_out") == "out"
+
+        counter = self.buckets.get(bucket)
+        if counter is None:
+            counter = self.buckets[bucket] = array("q", (0, 0))
+        counter[0] += sign
+        if is_out:
+            counter[1] += sign
+        if counter[0] <= 0:
+            del self.buckets[bucket]
+
+        if is_out:
+            count = self.offenders.get(author, 0) + sign
+            if count > 0:
+                self.offenders[author] = count
+            else:
+                self.offenders.pop(author, None)
+            self._update_top(author, count, sign)
+
+    def _update_top(self, author: str, count: int, sign: int) -> None:
+        # 並びはアウト件数の多い順、同数なら投稿者名の順（並べ直しても作り直しても同じ結果になるように）
+        top = [entry for entry in self.top_offenders if entry[1] != author]
+        was_listed = len(top) < len(self.top_offenders)
+        if sign < 0 and was_listed and len(self.offenders) > TOP_AUTHORS:
+            # 上位から外れた可能性があるので数え直す（再分析で減ったときだけ）
+            self.top_offenders = sorted((-c, a) for a, c in self.offenders.items())[:TOP_AUTHORS]
+            return
+        entry = (-count, author)
+        if count > 0 and (len(top) < TOP_AUTHORS or entry < top[-1]):
+            top.append(entry)
+        self.top_offenders = sorted(top)[:TOP_AUTHORS]
+
+    def snapshot(self) -> Dict[str, object]:
+        counts = self.counts
+        total = counts[_TOTAL]
+        return {
+            "analyzed": total,
+            "safe": total - counts[_OUT],
+            "out": counts[_OUT],
+            "out_ratio": counts[_OUT] / total if total else 0.0,
+            "counter": counts[_COUNTER],
+            "categories": {name: counts[_CATEGORY + i] for i, name in enumerate(CATEGORIES)},
+            "graham_hierarchy": {
+                **{f"Lv{level + 1}": counts[_GRAHAM + level] for level in range(GRAHAM_LEVELS)},
+                OTHER: counts[_GRAHAM + GRAHAM_LEVELS]
+            },
+            "logical_fallacies": {
+                **{name: counts[_FALLACY + i] for i, name in enumerate(LOGICAL_FALLACIES)},
+                OTHER: counts[_FALLACY + len(LOGICAL_FALLACIES)]
+            },
+            "validity": {name: counts[_VALIDITY + i] for i, name in enumerate(VALIDITY_LEVELS)},
+            "top_offenders": [{"author": author, "out": -count} for count, author in self.top_offenders],
+            "time_buckets": [
+                {"start": bucket, "analyzed": counter[0], "out": counter[1]}
+                for bucket, counter in sorted(self.buckets.items())
+            ]
+        }
+
+
+def result_fields(result: AnalysisResult) -> dict:
+    return {
+        "category": result.category,
+        "is_counter": result.is_counter,
+        "graham_hierarchy": result.graham_hierarchy,
+        "logical_fallacy": result.logical_fallacy,
+        "validity_assessment": result.validity_assessment,
+        "safe_or_out": result.safe_or_out
+    }
+
+
+class VideoAggregates:
+    """動画ごとの集計の一覧（ローカルストアの分析結果とコメントから差分で更新）"""
+
+    def __init__(self, bucket: str = "day"):
+        if bucket not in ("hour", "day"):
+            raise ValueError("集計の時間帯は hour または day を指定してください")
+        self.bucket = bucket
+        # 投稿日時（UTCのISO形式）の先頭部分を時間帯とする
+        self._bucket_length = 13 if bucket == "hour" else 10
+        self._videos: Dict[str, VideoAggregate] = {}
+        self._lock = threading.Lock()
+
+    def _apply(self, video_id: str, author: str, published_at: str, result: dict, sign: int) -> None:
+        aggregate = self._videos.get(video_id)
+        if aggregate is None:
+            aggregate = self._videos[video_id] = VideoAggregate()
+        aggregate.apply(result, author, published_at[:self._bucket_length], sign)
+
+    def replace(self, video_id: str, author: str, published_at: str, result: dict, previous: Optional[dict] = None) -> None:
+        """分析結果を加算（同じコメントの以前の結果があれば減算してから）"""
+        with self._lock:
+            if previous is not None:
+                self._apply(video_id, author, published_at, previous, -1)
+            self._apply(video_id, author, published_at, result, 1)
+
+    def rebuild(self, rows: Iterable[Tuple[str, str, str, str]]) -> int:
+        """(動画ID, 投稿者, 投稿日時, 分析結果のJSON) の列から集計を作り直す"""
+        videos: Dict[str, VideoAggregate] = {}
+        count = 0
+        for video_id, author, published_at, raw in rows:
+            aggregate = videos.get(video_id)
+            if aggregate is None:
+                aggregate = videos[video_id] = VideoAggregate()
+            aggregate.apply(json.loads(raw), author, published_at[:self._bucket_length], 1)
+            count += 1
+        with self._lock:
+            self._videos = videos
+        return count
+
+    def get(self, video_id: str) -> Dict[str, object]:
+        """動画の集計（判定結果がまだない動画はすべて0件）"""
+        with self._lock:
+            aggregate = self._videos.get(video_id) or VideoAggregate()
+            return {"video_id": video_id, "bucket": self.bucket, **aggregate.snapshot()}
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"videos": len(self._videos), "bucket": self.bucket}
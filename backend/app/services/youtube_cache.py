@@ -0,0 +1,205 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# YouTube Data API の1リクエストあたりのクォータ消費量（list系はすべて1ユニット）
+QUOTA_COSTS = {
+    "videos": 1,
+    "commentThreads": 1,
+    "comments": 1,
+    "channels": 1,
+    "playlistItems": 1,
+}
+
+# YouTube のクォータは太平洋時間の0時にリセットされる
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "expires_at")
+
+    def __init__(self, body: dict, etag: Optional[str], expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+
+class YouTubeResponseCache:
+    """YouTube API 応答のLRUキャッシュ
+
+    TTLを過ぎたエントリも容量が許す限り保持し、ETagによる条件付きリクエストで
+    再検証できるようにする。
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, body: dict, etag: Optional[str], ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = CachedResponse(body, etag, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hit: bool = False, revalidated: bool = False) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if revalidated:
+                self.revalidated += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+class PrefetchBuffer:
+    """先読みした応答を動画ごとに短時間だけ保持するバッファ
+
+    動画あたりの件数と動画数の上限を超えたら古いものから捨てる。
+    取り出した応答はバッファから消え、以降は通常の応答キャッシュで扱う。
+    """
+
+    def __init__(self, ttl: float = 60.0, max_per_video: int = 16, max_videos: int = 128):
+        self.ttl = ttl
+        self.max_per_video = max_per_video
+        self.max_videos = max_videos
+        self._videos: "OrderedDict[str, OrderedDict[Hashable, Tuple[float, dict]]]" = OrderedDict()
+        self._index: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+        self._stats = {"stored": 0, "hits": 0, "expired": 0, "evicted": 0}
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._index
+
+    def _drop(self, video_id: str, key: Hashable) -> None:
+        entries = self._videos.get(video_id)
+        if entries is not None:
+            entries.pop(key, None)
+            if not entries:
+                del self._videos[video_id]
+        self._index.pop(key, None)
+
+    def put(self, video_id: str, key: Hashable, body: dict) -> None:
+        with self._lock:
+            previous = self._index.get(key)
+            if previous is not None:
+                self._drop(previous, key)
+            entries = self._videos.setdefault(video_id, OrderedDict())
+            entries[key] = (time.time() + self.ttl, body)
+            self._index[key] = video_id
+            self._videos.move_to_end(video_id)
+            self._stats["stored"] += 1
+            while len(entries) > self.max_per_video:
+                old_key, _ = entries.popitem(last=False)
+                self._index.pop(old_key, None)
+                self._stats["evicted"] += 1
+            while len(self._videos) > self.max_videos:
+                _, dropped = self._videos.popitem(last=False)
+                for old_key in dropped:
+                    self._index.pop(old_key, None)
+                self._stats["evicted"] += len(dropped)
+
+    def take(self, key: Hashable) -> Optional[dict]:
+        """期限内の応答を取り出す（取り出した応答はバッファから消える）"""
+        with self._lock:
+            video_id = self._index.get(key)
+            if video_id is None:
+                return None
+            expires_at, body = self._videos[video_id][key]
+            self._drop(video_id, key)
+            if expires_at <= time.time():
+                self._stats["expired"] += 1
+                return None
+            self._stats["hits"] += 1
+            return body
+
+    def clear(self) -> None:
+        with self._lock:
+            self._videos.clear()
+            self._index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._index),
+                "videos": len(self._videos),
+                "ttl_seconds": self.ttl
+            }
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    """APIキーそのものを出さずに識別するための短いハッシュ"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+class QuotaTracker:
+    """APIキーごと・日ごとのクォータ消費量を集計"""
+
+    def __init__(self, daily_limit: int = 10000):
+        self.daily_limit = daily_limit
+        self._usage: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def today() -> str:
+        return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    def record(self, key_id: str, endpoint: str, units: Optional[int] = None) -> None:
+        units = QUOTA_COSTS.get(endpoint, 1) if units is None else units
+        with self._lock:
+            usage = self._usage.setdefault((key_id, self.today()), {})
+            usage[endpoint] = usage.get(endpoint, 0) + units
+
+    def used(self, key_id: str) -> int:
+        with self._lock:
+            return sum(self._usage.get((key_id, self.today()), {}).values())
+
+    def remaining(self, key_id: str) -> int:
+        return max(self.daily_limit - self.used(key_id), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            days = {}
+            for (key_id, day), usage in sorted(self._usage.items(), key=lambda item: item[0][1], reverse=True):
+                days.setdefault(day, {})[key_id] = {
+                    "used": sum(usage.values()),
+                    "by_endpoint": dict(usage)
+                }
+            return {"daily_limit": self.daily_limit, "today": self.today(), "usage": days}
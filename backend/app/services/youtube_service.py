@@ -1,115 +1,465 @@
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
+import httplib2
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-from app.models.comment import Comment, VideoInfo
+from app.core.log import log_event
+from app.core.singleflight import SingleFlight
+from app.core.upstream import get_governor
+from app.models.comment import BulkVideoItem, Comment, VideoInfo
+from app.models.response import CommentThread
+from app.services.comment_batch import CommentBatch
+from app.services.youtube_cache import PrefetchBuffer, YouTubeResponseCache, QuotaTracker, api_key_fingerprint
+
+# URLから動画ID・再生リスト・チャンネルを取り出すパターン（大量のURLを処理するため事前にコンパイル）
+_VIDEO_ID_PATTERNS = [
+    re.compile(r'(?:v=|\/)([0-9A-Za-z_-]{11}).*'),
+    re.compile(r'(?:embed\/)([0-9A-Za-z_-]{11})'),
+    re.compile(r'(?:watch\?v=)([0-9A-Za-z_-]{11})')
+]
+_BARE_VIDEO_ID = re.compile(r'^[0-9A-Za-z_-]{11}$')
+_PLAYLIST_URL = re.compile(r'youtube\.com\/playlist\?(?:.*&)?list=([0-9A-Za-z_-]+)')
+_CHANNEL_ID_URL = re.compile(r'youtube\.com\/channel\/(UC[0-9A-Za-z_-]{22})')
+_CHANNEL_HANDLE_URL = re.compile(r'youtube\.com\/(@[0-9A-Za-z_.\-]+)')
+_CHANNEL_USER_URL = re.compile(r'youtube\.com\/user\/([0-9A-Za-z_.\-]+)')
+
+# videos().list の id に一度に指定できる動画数
+VIDEOS_PER_REQUEST = 50
 
 class YouTubeService:
-    def __init__(self, api_key: str):
-        self.youtube = build('youtube', 'v3', developerKey=api_key)
+    def __init__(self, api_key: str, timeout: Optional[float] = 30, max_workers: Optional[int] = None):
+        self.timeout = timeout
+        self.key_id = api_key_fingerprint(api_key)
+        # 応答キャッシュ（エンドポイントごとのTTL）とクォータ集計
+        self.cache = YouTubeResponseCache(int(os.getenv("YOUTUBE_CACHE_SIZE", "2048")))
+        self.cache_ttls = {
+            "videos": float(os.getenv("YOUTUBE_CACHE_TTL_VIDEO_SECONDS", "3600")),
+            "commentThreads": float(os.getenv("YOUTUBE_CACHE_TTL_COMMENTS_SECONDS", "30")),
+            "comments": float(os.getenv("YOUTUBE_CACHE_TTL_REPLIES_SECONDS", "60")),
+        }
+        self.quota = QuotaTracker(int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000")))
+        # APIキーごとの送信レート制限・再試行・サーキットブレーカー
+        self.governor = get_governor("youtube", self.key_id)
+        # 同一リクエストの同時実行を1回にまとめる
+        self._inflight = SingleFlight()
+        # 複数スレッドの返信を並行取得するワーカープール
+        self.max_workers = max_workers or int(os.getenv("YOUTUBE_MAX_WORKERS", "8"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="youtube")
+        # 一括取得で受け付ける入力数・動画数の上限と、チャンネル・再生リスト1件から取得する動画数
+        self.bulk_max_inputs = int(os.getenv("VIDEO_BULK_MAX_INPUTS", "500"))
+        self.bulk_max_videos = int(os.getenv("VIDEO_BULK_MAX_VIDEOS", "500"))
+        self.bulk_playlist_limit = int(os.getenv("VIDEO_BULK_PLAYLIST_LIMIT", "50"))
+        # 次のページと返信の多いスレッドの返信の先読み（クォータ残量が下限を切ったら止める）
+        self.prefetch_enabled = os.getenv("PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.prefetch_buffer = PrefetchBuffer(
+            ttl=float(os.getenv("PREFETCH_TTL_SECONDS", "60")),
+            max_per_video=int(os.getenv("PREFETCH_MAX_PER_VIDEO", "16")),
+            max_videos=int(os.getenv("PREFETCH_MAX_VIDEOS", "128"))
+        )
+        self.prefetch_reply_min_count = int(os.getenv("PREFETCH_REPLY_MIN_COUNT", "5"))
+        self.prefetch_reply_threads = int(os.getenv("PREFETCH_REPLY_THREADS", "5"))
+        self.prefetch_quota_floor = float(os.getenv("PREFETCH_QUOTA_FLOOR", "0.2"))
+        self.prefetch_max_in_flight = int(os.getenv("PREFETCH_MAX_IN_FLIGHT", "2"))
+        # 先読みは利用者の要求を待たせないよう専用のワーカーで行う
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=self.prefetch_max_in_flight, thread_name_prefix="youtube-prefetch")
+        self._prefetching = 0
+        self._prefetch_lock = threading.Lock()
+        self.prefetch_stats = {"scheduled": 0, "failed": 0, "skipped_quota": 0, "skipped_busy": 0}
+        # ディスカバリー文書はパッケージ同梱のものを使い、キャッシュ書き込みも行わない
+        # YOUTUBE_API_ENDPOINT を指定すると別のエンドポイント（ベンチマーク用のスタブなど）へ送る
+        endpoint = os.getenv("YOUTUBE_API_ENDPOINT")
+        client_options = {"api_endpoint": endpoint} if endpoint else None
+        self.youtube = build('youtube', 'v3', developerKey=api_key, cache_discovery=False, static_discovery=True, client_options=client_options)
+        # httplib2.Http はスレッドセーフではないため、スレッドごとにkeep-alive接続を保持する
+        self._local = threading.local()
+        self._connections: List[httplib2.Http] = []
+        self._connections_lock = threading.Lock()
+    
+    def _http(self) -> httplib2.Http:
+        """現在のスレッド用のHTTP接続を取得"""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = httplib2.Http(timeout=self.timeout)
+            self._local.http = http
+            with self._connections_lock:
+                self._connections.append(http)
+        return http
+    
+    def close(self) -> None:
+        """ワーカープールと保持しているHTTP接続を閉じる"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        with self._connections_lock:
+            for http in self._connections:
+                http.close()
+            self._connections.clear()
+    
+    @staticmethod
+    def _request_key(endpoint: str, params: dict) -> Tuple[dict, tuple]:
+        params = {name: value for name, value in params.items() if value is not None}
+        return params, (endpoint, tuple(sorted(params.items())))
+    
+    def _call(self, endpoint: str, **params) -> dict:
+        """先読みバッファ・キャッシュ・ETag再検証・同時リクエストの集約を経由してAPIを呼び出す"""
+        params, key = self._request_key(endpoint, params)
+        
+        prefetched = self._take_prefetched(endpoint, key)
+        if prefetched is not None:
+            return prefetched
+        
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            self.cache.record(hit=True)
+            return entry.body
+        
+        response = self._inflight.do(key, lambda: self._fetch(endpoint, params, key))
+        # 実行中の先読みに合流した場合は、その応答をバッファから応答キャッシュへ移す
+        return self._take_prefetched(endpoint, key) or response
+    
+    def _take_prefetched(self, endpoint: str, key: tuple) -> Optional[dict]:
+        prefetched = self.prefetch_buffer.take(key)
+        if prefetched is not None:
+            self.cache.set(key, prefetched, prefetched.get('etag'), self.cache_ttls.get(endpoint, 60))
+        return prefetched
+    
+    def _fetch(self, endpoint: str, params: dict, key) -> dict:
+        # 待っている間に他のリクエストが更新している場合はそれを使う
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            self.cache.record(hit=True)
+            return entry.body
+        
+        request = getattr(self.youtube, endpoint)().list(**params)
+        if entry is not None and entry.etag:
+            request.headers['If-None-Match'] = entry.etag
+        
+        ttl = self.cache_ttls.get(endpoint, 60)
+        try:
+            response = self.governor.call_sync(lambda: request.execute(http=self._http()), target=endpoint)
+        except HttpError as e:
+            if e.resp.status == 304 and entry is not None:
+                # 変更なし：保持している応答の有効期限だけを延長
+                self.quota.record(self.key_id, endpoint)
+                self.cache.set(key, entry.body, entry.etag, ttl)
+                self.cache.record(revalidated=True)
+                return entry.body
+            raise
+        
+        self.quota.record(self.key_id, endpoint)
+        self.cache.set(key, response, response.get('etag'), ttl)
+        self.cache.record()
+        return response
+    
+    def _prefetch(self, video_id: str, endpoint: str, **params) -> None:
+        """次に要求されそうな呼び出しをバックグラウンドで先読み（クォータ残量と同時実行数に余裕がある場合のみ）"""
+        if not self.prefetch_enabled:
+            return
+        params, key = self._request_key(endpoint, params)
+        if key in self.prefetch_buffer or key in self._inflight:
+            return
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            return
+        with self._prefetch_lock:
+            if self.quota.remaining(self.key_id) < self.quota.daily_limit * self.prefetch_quota_floor:
+                self.prefetch_stats["skipped_quota"] += 1
+                return
+            if self._prefetching >= self.prefetch_max_in_flight:
+                self.prefetch_stats["skipped_busy"] += 1
+                return
+            self._prefetching += 1
+            self.prefetch_stats["scheduled"] += 1
+        try:
+            self._prefetch_executor.submit(self._run_prefetch, video_id, endpoint, params, key)
+        except RuntimeError:
+            # 終了処理中
+            with self._prefetch_lock:
+                self._prefetching -= 1
+    
+    def _run_prefetch(self, video_id: str, endpoint: str, params: dict, key: tuple) -> None:
+        try:
+            # 先読み中に同じ要求が来たら、その要求はこの呼び出しの結果を待つ
+            self._inflight.do(key, lambda: self._fetch_for_prefetch(video_id, endpoint, params, key))
+        except Exception as e:
+            with self._prefetch_lock:
+                self.prefetch_stats["failed"] += 1
+            log_event("prefetch_failed", level="warning", endpoint=endpoint, error=type(e).__name__, detail=str(e))
+        finally:
+            with self._prefetch_lock:
+                self._prefetching -= 1
+    
+    def _fetch_for_prefetch(self, video_id: str, endpoint: str, params: dict, key: tuple) -> dict:
+        request = getattr(self.youtube, endpoint)().list(**params)
+        response = self.governor.call_sync(lambda: request.execute(http=self._http()), target=endpoint)
+        self.quota.record(self.key_id, endpoint)
+        self.prefetch_buffer.put(video_id, key, response)
+        return response
+    
+    def prefetch_snapshot(self) -> Dict[str, object]:
+        """先読みの実行状況とバッファの統計"""
+        with self._prefetch_lock:
+            stats = {**self.prefetch_stats, "in_flight": self._prefetching}
+        return {
+            "enabled": self.prefetch_enabled,
+            **stats,
+            "buffer": self.prefetch_buffer.stats(),
+            "quota_floor": self.prefetch_quota_floor
+        }
     
     def extract_video_id(self, url: str) -> str:
         """YouTube URLから動画IDを抽出"""
-        patterns = [
-            r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-            r'(?:embed\/)([0-9A-Za-z_-]{11})',
-            r'(?:watch\?v=)([0-9A-Za-z_-]{11})'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in _VIDEO_ID_PATTERNS:
+            match = pattern.search(url)
             if match:
                 return match.group(1)
         
         raise ValueError("有効なYouTube URLではありません")
     
+    @staticmethod
+    def _to_video_info(video_id: str, item: dict) -> VideoInfo:
+        snippet = item['snippet']
+        return VideoInfo(
+            video_id=video_id,
+            title=snippet['title'],
+            channel_name=snippet['channelTitle'],
+            thumbnail_url=snippet['thumbnails']['medium']['url'],
+            published_at=datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00'))
+        )
+    
     def get_video_info(self, video_id: str) -> VideoInfo:
         """動画情報を取得"""
         try:
-            request = self.youtube.videos().list(
-                part="snippet",
-                id=video_id
-            )
-            response = request.execute()
+            response = self._call("videos", part="snippet", id=video_id)
             
             if not response['items']:
                 raise ValueError("動画が見つかりません")
             
-            item = response['items'][0]
-            snippet = item['snippet']
-            
-            return VideoInfo(
-                video_id=video_id,
-                title=snippet['title'],
-                channel_name=snippet['channelTitle'],
-                thumbnail_url=snippet['thumbnails']['medium']['url'],
-                published_at=datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00'))
+            return self._to_video_info(video_id, response['items'][0])
+        
+        except HttpError as e:
+            raise ValueError(f"YouTube API エラー: {e}")
+    
+    def _list_videos(self, video_ids: List[str]) -> Dict[str, VideoInfo]:
+        """最大50件の動画情報を1回の videos().list で取得"""
+        response = self._call("videos", part="snippet", id=",".join(video_ids))
+        return {item['id']: self._to_video_info(item['id'], item) for item in response['items']}
+    
+    def _playlist_video_ids(self, playlist_id: str, limit: int) -> List[str]:
+        """再生リストの動画IDを新しい順に最大 limit 件取得"""
+        video_ids: List[str] = []
+        page_token = None
+        while len(video_ids) < limit:
+            response = self._call(
+                "playlistItems",
+                part="contentDetails",
+                playlistId=playlist_id,
+                maxResults=VIDEOS_PER_REQUEST,
+                pageToken=page_token
             )
+            video_ids.extend(item['contentDetails']['videoId'] for item in response['items'])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return video_ids[:limit]
+    
+    def _channel_uploads_playlist(self, **selector) -> str:
+        """チャンネルのアップロード動画の再生リストIDを取得（selector は id / forHandle / forUsername）"""
+        response = self._call("channels", part="contentDetails", **selector)
+        if not response.get('items'):
+            raise ValueError("チャンネルが見つかりません")
+        return response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+    
+    def resolve_video_ids(self, source: str, playlist_limit: int) -> List[str]:
+        """動画URL・動画ID・チャンネルURL・再生リストURLを動画IDの列に変換"""
+        source = source.strip()
+        if _BARE_VIDEO_ID.match(source):
+            return [source]
+        try:
+            match = _PLAYLIST_URL.search(source)
+            if match:
+                return self._playlist_video_ids(match.group(1), playlist_limit)
+            for pattern, selector in ((_CHANNEL_ID_URL, "id"), (_CHANNEL_HANDLE_URL, "forHandle"), (_CHANNEL_USER_URL, "forUsername")):
+                match = pattern.search(source)
+                if match:
+                    return self._playlist_video_ids(self._channel_uploads_playlist(**{selector: match.group(1)}), playlist_limit)
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise ValueError("チャンネルまたは再生リストが見つかりません")
+            raise ValueError(f"YouTube API エラー: {e}")
+        return [self.extract_video_id(source)]
+    
+    def get_videos_bulk(self, sources: List[str]) -> List[BulkVideoItem]:
+        """複数のURL・IDの動画情報を50件ずつまとめて取得（入力ごとの失敗は項目のエラーとして返す）"""
+        if len(sources) > self.bulk_max_inputs:
+            raise ValueError(f"一度に指定できるURLは{self.bulk_max_inputs}件までです")
+        
+        items: List[BulkVideoItem] = []
+        for index, source in enumerate(sources):
+            try:
+                video_ids = self.resolve_video_ids(source, self.bulk_playlist_limit)
+            except ValueError as e:
+                items.append(BulkVideoItem(index=index, source=source, error=str(e)))
+                continue
+            if not video_ids:
+                items.append(BulkVideoItem(index=index, source=source, error="動画が含まれていません"))
+            items.extend(BulkVideoItem(index=index, source=source, video_id=video_id) for video_id in video_ids)
+        
+        video_ids = list(dict.fromkeys(item.video_id for item in items if item.video_id))
+        if len(video_ids) > self.bulk_max_videos:
+            raise ValueError(f"一度に取得できる動画は{self.bulk_max_videos}件までです（指定: {len(video_ids)}件）")
         
+        # 順序を揃えてキャッシュに当たりやすくし、50件ずつのリクエストを並行して送る
+        video_ids.sort()
+        chunks = [video_ids[i:i + VIDEOS_PER_REQUEST] for i in range(0, len(video_ids), VIDEOS_PER_REQUEST)]
+        
+        def fetch(chunk: List[str]):
+            try:
+                return self._list_videos(chunk), None
+            except HttpError as e:
+                return {}, f"YouTube API エラー: {e}"
+        
+        videos: Dict[str, VideoInfo] = {}
+        errors: Dict[str, str] = {}
+        for chunk, (found, error) in zip(chunks, self._executor.map(fetch, chunks)):
+            videos.update(found)
+            if error:
+                errors.update(dict.fromkeys(chunk, error))
+        
+        for item in items:
+            if item.video_id is None:
+                continue
+            item.video = videos.get(item.video_id)
+            if item.video is None:
+                item.error = errors.get(item.video_id, "動画が見つかりません")
+        return items
+    
+    @staticmethod
+    def _to_comment(comment_id: str, snippet: dict, reply_count: int = 0, parent_id: Optional[str] = None) -> Comment:
+        return Comment(
+            id=comment_id,
+            text=snippet['textDisplay'],
+            author=snippet['authorDisplayName'],
+            published_at=datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00')),
+            like_count=snippet.get('likeCount', 0),
+            reply_count=reply_count,
+            parent_id=parent_id
+        )
+    
+    @staticmethod
+    def _thread_params(video_id: str, page_token: Optional[str], max_results: int, part: str) -> dict:
+        return {"part": part, "videoId": video_id, "maxResults": max_results, "order": "time", "pageToken": page_token}
+    
+    @staticmethod
+    def _reply_params(comment_id: str, page_token: Optional[str] = None) -> dict:
+        return {"part": "snippet", "parentId": comment_id, "maxResults": 100, "pageToken": page_token}
+    
+    def _list_threads(self, video_id: str, page_token: Optional[str], max_results: int, part: str) -> dict:
+        return self._call("commentThreads", **self._thread_params(video_id, page_token, max_results, part))
+    
+    def get_comments_batch(self, video_id: str, page_token: Optional[str] = None, max_results: int = 100) -> Tuple[CommentBatch, Optional[str]]:
+        """動画の親コメントのみを列指向の一覧で取得（返信は含めない）"""
+        try:
+            response = self._list_threads(video_id, page_token, max_results, part="snippet")
         except HttpError as e:
             raise ValueError(f"YouTube API エラー: {e}")
+        
+        batch = CommentBatch.from_threads(response['items'])
+        next_page_token = response.get('nextPageToken')
+        self._prefetch_following(video_id, next_page_token, max_results, "snippet", zip(batch.ids, batch.reply_counts))
+        return batch, next_page_token
     
     def get_comments(self, video_id: str, page_token: Optional[str] = None, max_results: int = 100) -> Tuple[List[Comment], Optional[str]]:
         """動画の親コメントのみを取得（返信は含めない）"""
+        batch, next_page_token = self.get_comments_batch(video_id, page_token, max_results)
+        return batch.to_comments(), next_page_token
+    
+    def get_replies_batch(self, comment_id: str) -> CommentBatch:
+        """コメントの返信をすべて列指向の一覧で取得（nextPageTokenを最後までたどる）"""
         try:
-            # 親コメントのみを取得
-            request = self.youtube.commentThreads().list(
-                part="snippet",  # repliesを除外
-                videoId=video_id,
-                maxResults=max_results,  # 直接max_resultsを使用
-                order="time",
-                pageToken=page_token
-            )
-            response = request.execute()
-            
-            comments = []
-            
-            for item in response['items']:
-                # 親コメントのみを追加
-                snippet = item['snippet']['topLevelComment']['snippet']
-                parent_comment = Comment(
-                    id=item['snippet']['topLevelComment']['id'],
-                    text=snippet['textDisplay'],
-                    author=snippet['authorDisplayName'],
-                    published_at=datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00')),
-                    like_count=snippet.get('likeCount', 0),
-                    reply_count=item['snippet'].get('totalReplyCount', 0)
-                )
-                comments.append(parent_comment)
-            
-            next_page_token = response.get('nextPageToken')
-            return comments, next_page_token
+            replies = CommentBatch()
+            page_token = None
+            while True:
+                response = self._call("comments", **self._reply_params(comment_id, page_token))
+                replies.extend_replies(response['items'], comment_id)
+                
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    return replies
         
         except HttpError as e:
             raise ValueError(f"YouTube API エラー: {e}")
     
     def get_replies(self, comment_id: str) -> List[Comment]:
-        """コメントの返信を取得"""
+        """コメントの返信をすべて取得"""
+        return self.get_replies_batch(comment_id).to_comments()
+    
+    def get_replies_batches(self, comment_ids: Iterable[str]) -> Dict[str, CommentBatch]:
+        """複数の親コメントの返信をワーカープールで並行取得（列指向の一覧）"""
+        comment_ids = list(dict.fromkeys(comment_ids))
+        results = self._executor.map(self.get_replies_batch, comment_ids)
+        return dict(zip(comment_ids, results))
+    
+    def get_replies_bulk(self, comment_ids: Iterable[str]) -> Dict[str, List[Comment]]:
+        """複数の親コメントの返信をワーカープールで並行取得"""
+        return {comment_id: batch.to_comments() for comment_id, batch in self.get_replies_batches(comment_ids).items()}
+    
+    def get_comment_threads(self, video_id: str, page_token: Optional[str] = None, max_results: int = 100, inline_replies: bool = True) -> Tuple[List[CommentThread], Optional[str]]:
+        """親コメントと返信をスレッド単位で取得
+        
+        inline_replies が有効な場合は part=replies で同梱される返信（最大5件）を使い、
+        同梱分で全件がそろわないスレッドだけを追加で並行取得する。
+        """
         try:
-            request = self.youtube.comments().list(
-                part="snippet",
-                parentId=comment_id,
-                maxResults=100
-            )
-            response = request.execute()
+            part = "snippet,replies" if inline_replies else "snippet"
+            response = self._list_threads(video_id, page_token, max_results, part=part)
+        except HttpError as e:
+            raise ValueError(f"YouTube API エラー: {e}")
+        
+        threads = []
+        incomplete = []
+        for item in response['items']:
+            top_level = item['snippet']['topLevelComment']
+            reply_count = item['snippet'].get('totalReplyCount', 0)
+            comment = self._to_comment(top_level['id'], top_level['snippet'], reply_count=reply_count)
             
-            replies = []
-            for item in response['items']:
-                snippet = item['snippet']
-                reply = Comment(
-                    id=item['id'],
-                    text=snippet['textDisplay'],
-                    author=snippet['authorDisplayName'],
-                    published_at=datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00')),
-                    like_count=snippet.get('likeCount', 0),
-                    reply_count=0,
-                    parent_id=comment_id
-                )
-                replies.append(reply)
+            inline = item.get('replies', {}).get('comments', [])
+            replies = [self._to_comment(r['id'], r['snippet'], parent_id=comment.id) for r in inline]
+            if reply_count > len(replies):
+                incomplete.append(comment.id)
             
-            return replies
+            threads.append(CommentThread(comment=comment, replies=replies))
         
-        except HttpError as e:
-            raise ValueError(f"YouTube API エラー: {e}")
\ No newline at end of file
+        if incomplete:
+            fetched = self.get_replies_bulk(incomplete)
+            for thread in threads:
+                if thread.comment.id in fetched:
+                    thread.replies = fetched[thread.comment.id]
+        
+        for thread in threads:
+            thread.replies.sort(key=lambda reply: reply.published_at)
+        
+        self._prefetch_following(video_id, response.get('nextPageToken'), max_results, part)
+        return threads, response.get('nextPageToken')
+    
+    def _prefetch_following(self, video_id: str, next_page_token: Optional[str], max_results: int, part: str, reply_counts: Iterable[Tuple[str, int]] = ()) -> None:
+        """返したページの次のページと、返信の多いスレッドの返信を先読み"""
+        if not self.prefetch_enabled:
+            return
+        if next_page_token:
+            self._prefetch(video_id, "commentThreads", **self._thread_params(video_id, next_page_token, max_results, part))
+        busy = sorted(((count, comment_id) for comment_id, count in reply_counts if count >= self.prefetch_reply_min_count), reverse=True)
+        for _, comment_id in busy[:self.prefetch_reply_threads]:
+            self._prefetch(video_id, "comments", **self._reply_params(comment_id))
+    
+    def iter_comment_threads(self, video_id: str, page_token: Optional[str] = None, inline_replies: bool = True) -> Iterator[Tuple[List[CommentThread], Optional[str]]]:
+        """nextPageTokenを最後までたどり、ページごとのスレッドを順に返す"""
+        while True:
+            threads, page_token = self.get_comment_threads(video_id, page_token, 100, inline_replies)
+            yield threads, page_token
+            if not page_token:
+                return
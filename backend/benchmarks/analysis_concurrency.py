@@ -0,0 +1,53 @@
+"""疑似LLMバックエンドを使った AnalysisService の並行スループット計測
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.analysis_concurrency --requests 200 --concurrency 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.comment import AnalysisRequest
+from app.services.analysis_service import AnalysisService
+from app.services.fake_llm import FakeAsyncLLMClient
+
+
+async def run(total: int, concurrency: int, latency: float, max_in_flight: int) -> None:
+    client = FakeAsyncLLMClient(latency=latency, jitter=0)
+    service = AnalysisService("fake", client=client, max_concurrency=max_in_flight)
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int) -> None:
+        async with gate:
+            started = time.perf_counter()
+            await service.analyze_comment(AnalysisRequest(comment_text=f"ベンチマーク用コメント {i}"))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"requests={total} concurrency={concurrency} max_in_flight={max_in_flight} latency={latency}s")
+    print(f"elapsed={elapsed:.2f}s throughput={total / elapsed:.1f} req/s")
+    print(f"p50={statistics.median(latencies) * 1000:.0f}ms p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.latency, args.max_in_flight))
+
+
+if __name__ == "__main__":
+    main()
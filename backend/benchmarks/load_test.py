@@ -0,0 +1,369 @@
+"""スタブサーバーを相手に FastAPI アプリ全体へ負荷をかけるオフラインのベンチマーク
+
+YouTube API・OpenAI API はローカルのスタブ（benchmarks/stub_servers.py）に置き換え、
+アプリを同じプロセス内の uvicorn で起動して、指定した並行数でHTTPリクエストを送る。
+シナリオごとのスループット、p50/p95/p99 レイテンシ、上流呼び出し数、判定1件あたりの
+トークン数、最大メモリ使用量を JSON で出力する。
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.load_test --output results.json
+    python -m benchmarks.load_test --scenarios analyze,judge --concurrency 32 --llm-latency 0.3
+    python -m benchmarks.load_test --baseline results.json --tolerance 0.2   # 悪化していれば終了コード1
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_servers import Injection, YouTubeFixtures, start_openai_stub, start_youtube_stub
+
+SCENARIOS = ("analyze", "analyze_stream", "batch", "comments", "judge")
+RESULT_SCHEMA_VERSION = 1
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _peak_rss_mb() -> float:
+    # Linux の ru_maxrss はキロバイト単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Client:
+    """スレッドごとに keep-alive 接続を持つ最小限のHTTPクライアント"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=300)
+            self._local.connection = connection
+        return connection
+
+    def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, bytes, float]:
+        """(ステータス, 本文, 最初の1バイトまでの秒数) を返す"""
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                started = time.perf_counter()
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+                first_byte = response.read(1)
+                ttfb = time.perf_counter() - started
+                payload = first_byte + response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    connection.close()
+                    self._local.connection = None
+                return response.status, payload, ttfb
+            except (http.client.HTTPException, ConnectionError):
+                # サーバー側で閉じられた keep-alive 接続は1回だけ張り直す
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        raise RuntimeError("unreachable")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttfbs: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, status: int, elapsed: float, ttfb: float) -> None:
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.ttfbs.append(ttfb)
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            if status >= 400:
+                self.errors += 1
+
+    def summary(self, duration: float) -> dict:
+        latencies = sorted(self.latencies)
+        ttfbs = sorted(self.ttfbs)
+        count = len(latencies)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "status_counts": self.statuses,
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(count / duration, 2) if duration else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 2),
+                "p95": round(percentile(latencies, 95) * 1000, 2),
+                "p99": round(percentile(latencies, 99) * 1000, 2),
+                "mean": round(sum(latencies) / count * 1000, 2) if count else 0.0,
+                "max": round(latencies[-1] * 1000, 2) if count else 0.0
+            },
+            "ttfb_ms": {
+                "p50": round(percentile(ttfbs, 50) * 1000, 2),
+                "p95": round(percentile(ttfbs, 95) * 1000, 2)
+            }
+        }
+
+
+def drive(client: Client, concurrency: int, calls: List[Tuple[str, str, Optional[dict]]]) -> dict:
+    """calls を指定した並行数で送り、レイテンシを集計"""
+    recorder = Recorder()
+
+    def one(call: Tuple[str, str, Optional[dict]]) -> None:
+        method, path, body = call
+        started = time.perf_counter()
+        try:
+            status, _, ttfb = client.request(method, path, body)
+        except Exception:
+            status, ttfb = 599, time.perf_counter() - started
+        recorder.record(status, time.perf_counter() - started, ttfb)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, calls))
+    return recorder.summary(time.perf_counter() - started)
+
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.fixtures = YouTubeFixtures(pages=args.pages)
+        self.texts = [
+            item["snippet"]["topLevelComment"]["snippet"]["textOriginal"]
+            for page in self.fixtures.thread_pages for item in page["items"]
+        ]
+
+    def _upstream_delta(self, before: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+        delta = {}
+        for name, server in (("youtube", self.youtube), ("openai", self.openai)):
+            now = server.snapshot()
+            delta[name] = {key: value - before[name].get(key, 0) for key, value in now.items() if value - before[name].get(key, 0)}
+        return delta
+
+    def _analysis_request(self, i: int) -> dict:
+        text = self.texts[i % len(self.texts)]
+        if self.args.unique:
+            text = f"{text} #{i}"
+        return {"comment_text": text}
+
+    def scenario_calls(self, name: str) -> List[Tuple[str, str, Optional[dict]]]:
+        n = self.args.requests
+        if name == "analyze":
+            return [("POST", "/api/comments/analyze", self._analysis_request(i)) for i in range(n)]
+        if name == "analyze_stream":
+            return [("POST", "/api/comments/analyze/stream", self._analysis_request(i)) for i in range(n)]
+        if name == "batch":
+            size = self.args.batch_size
+            return [
+                ("POST", "/api/comments/analyze/batch", {"requests": [self._analysis_request(i * size + k) for k in range(size)]})
+                for i in range(max(1, n // size))
+            ]
+        if name == "comments":
+            calls = []
+            for i in range(n):
+                page = i % self.fixtures.pages
+                token = f"&page_token=page-{page}" if page else ""
+                calls.append(("GET", f"/api/videos/{self.fixtures.video_id}/threads?max_results=100{token}", None))
+            return calls
+        raise ValueError(f"unknown scenario: {name}")
+
+    def run_judge(self, client: Client) -> dict:
+        """動画全体の判定ジョブを1件実行し、判定したコメント数あたりの指標を集計"""
+        started = time.perf_counter()
+        status, body, _ = client.request("POST", f"/api/videos/{self.fixtures.video_id}/judge", {"include_replies": True})
+        if status != 202:
+            return {"error": f"judge start failed: {status} {body[:200]!r}"}
+        job = json.loads(body)
+        while job["status"] not in ("completed", "failed", "cancelled"):
+            time.sleep(0.05)
+            _, body, _ = client.request("GET", f"/api/jobs/{job['job_id']}")
+            job = json.loads(body)
+        duration = time.perf_counter() - started
+        return {
+            "status": job["status"],
+            "error": job.get("error"),
+            "comments_expected": self.fixtures.total_comments,
+            "comments_seen": job["comments_seen"],
+            "analyzed": job["analyzed"],
+            "failed": job["failed"],
+            "duration_s": round(duration, 3),
+            "throughput_comments_per_s": round(job["analyzed"] / duration, 2) if duration else 0.0
+        }
+
+    def run(self) -> dict:
+        args = self.args
+        self.youtube = start_youtube_stub(0, Injection(args.youtube_latency, args.youtube_jitter, args.youtube_error_rate, seed=1), self.fixtures)
+        self.openai = start_openai_stub(0, Injection(args.llm_latency, args.llm_jitter, args.llm_error_rate, seed=2), args.llm_malformed_rate)
+        workdir = tempfile.mkdtemp(prefix="comment-umpire-bench-")
+        port = _free_port()
+        os.environ.update({
+            "LLM_BACKEND": "openai",
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_BASE_URL": f"{self.openai.url}/v1",
+            "YOUTUBE_API_KEY": "benchmark",
+            "YOUTUBE_API_ENDPOINT": f"{self.youtube.url}/",
+            "COMMENT_STORE_DB": os.path.join(workdir, "comments.db"),
+            "JUDGE_JOBS_DB": os.path.join(workdir, "judge_jobs.db"),
+            "ANALYSIS_CACHE_DB": "",
+            "PRE_CLASSIFIER_MODEL": os.path.join(workdir, "pre_classifier.json"),
+            "LOG_REQUESTS": "false",
+        })
+
+        import uvicorn
+        from app.main import app
+
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+
+        client = Client(port)
+        results: Dict[str, dict] = {}
+        try:
+            for name in args.scenarios:
+                if not args.keep_cache:
+                    client.request("DELETE", "/api/admin/cache")
+                before = {"youtube": self.youtube.snapshot(), "openai": self.openai.snapshot()}
+                print(f"running {name} ...", file=sys.stderr)
+                if name == "judge":
+                    result = self.run_judge(client)
+                else:
+                    result = drive(client, args.concurrency, self.scenario_calls(name))
+                upstream = self._upstream_delta(before)
+                result["upstream"] = upstream
+                tokens = upstream["openai"].get("prompt_tokens", 0) + upstream["openai"].get("completion_tokens", 0)
+                if name == "judge":
+                    judged = result.get("analyzed")
+                elif name == "comments":
+                    judged = 0
+                else:
+                    judged = result.get("requests", 0) * (args.batch_size if name == "batch" else 1)
+                result["tokens"] = {
+                    "prompt": upstream["openai"].get("prompt_tokens", 0),
+                    "completion": upstream["openai"].get("completion_tokens", 0),
+                    "per_judged_comment": round(tokens / judged, 1) if judged else None
+                }
+                results[name] = result
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+            self.youtube.stop()
+            self.openai.stop()
+
+        return {
+            "schema": RESULT_SCHEMA_VERSION,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "scenarios": results,
+            # 負荷をかける側とアプリが同じプロセスのため、両方を含めた値
+            "memory": {"peak_rss_mb": round(_peak_rss_mb(), 1)}
+        }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """基準の結果と比べて、p95 レイテンシ・スループットが許容幅を超えて悪化したシナリオを返す"""
+    regressions = []
+    for name, current in result["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        checks: List[Tuple[str, Optional[float], Optional[float], Callable[[float, float], bool]]] = [
+            ("latency_ms.p95", current.get("latency_ms", {}).get("p95"), previous.get("latency_ms", {}).get("p95"),
+             lambda now, before: now > before * (1 + tolerance)),
+            ("throughput_rps", current.get("throughput_rps"), previous.get("throughput_rps"),
+             lambda now, before: now < before * (1 - tolerance)),
+            ("throughput_comments_per_s", current.get("throughput_comments_per_s"), previous.get("throughput_comments_per_s"),
+             lambda now, before: now < before * (1 - tolerance)),
+        ]
+        for metric, now, before, worse in checks:
+            if now is not None and before and worse(now, before):
+                regressions.append(f"{name}: {metric} {before} -> {now}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"カンマ区切り（{', '.join(SCENARIOS)}）")
+    parser.add_argument("--requests", type=int, default=200, help="シナリオごとのリクエスト数（batch は件数の合計）")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3, help="スタブが返すコメントページ数（記録済みページを繰り返す）")
+    parser.add_argument("--unique", action="store_true", help="分析するコメント本文をすべて異なるものにする（キャッシュを効かせない）")
+    parser.add_argument("--keep-cache", action="store_true", help="シナリオ間で分析キャッシュを破棄しない")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-malformed-rate", type=float, default=0.0)
+    parser.add_argument("--youtube-latency", type=float, default=0.03)
+    parser.add_argument("--youtube-jitter", type=float, default=0.01)
+    parser.add_argument("--youtube-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル（省略時は標準出力）")
+    parser.add_argument("--baseline", help="比較対象の結果JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="悪化とみなす割合")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # アプリのログは標準エラーへ流し、標準出力には結果のJSONだけを書く
+    with contextlib.redirect_stdout(sys.stderr):
+        result = Benchmark(args).run()
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
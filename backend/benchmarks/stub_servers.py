@@ -0,0 +1,307 @@
+"""ベンチマーク用の YouTube Data API・OpenAI API のスタブサーバー
+
+記録済みの YouTube API 応答（fixtures/youtube.json）と、疑似LLMバックエンドと同じ定型の
+分析結果を返す。どちらも遅延・ジッター・エラー率を指定でき、外部ネットワークなしで動く。
+
+単体で起動する場合（backend ディレクトリで実行）:
+    python -m benchmarks.stub_servers --youtube-port 8801 --openai-port 8802
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.context_budget import count_tokens
+from app.services.fake_llm import FakeAsyncLLMClient
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class Injection:
+    """応答の遅延とエラーの注入設定"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            return self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def fails(self) -> bool:
+        with self._lock:
+            return bool(self.error_rate) and self._rng.random() < self.error_rate
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int, handler, injection: Injection):
+        super().__init__(("127.0.0.1", port), handler)
+        self.injection = injection
+        self.counters: Dict[str, int] = {}
+        self._counter_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._counter_lock:
+            return dict(self.counters)
+
+    def start(self) -> "_StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self) -> bool:
+        """遅延を入れ、エラーを返した場合は True"""
+        injection: Injection = self.server.injection
+        delay = injection.delay()
+        if delay:
+            time.sleep(delay)
+        if injection.fails():
+            self.server.count("errors")
+            status = injection.error_status
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self._send_json(status, {"error": {"code": status, "message": "injected error"}}, headers)
+            return True
+        return False
+
+
+class YouTubeFixtures:
+    """記録済みの YouTube API 応答。pages を指定すると記録済みのページを ID を変えて繰り返し、任意の件数に増やす"""
+
+    def __init__(self, path: str = os.path.join(FIXTURES_DIR, "youtube.json"), pages: Optional[int] = None):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.video_id: str = data["video_id"]
+        self.videos: dict = data["videos"]
+        self.thread_pages = data["comment_threads"]
+        self.replies: Dict[str, list] = data["replies"]
+        self.pages = pages or len(self.thread_pages)
+
+    def video_list(self, video_ids: str) -> dict:
+        """記録済みの動画を雛形に、指定された各IDの動画を返す（一括取得の計測用）"""
+        template = self.videos["items"][0]
+        items = []
+        for video_id in filter(None, video_ids.split(",")):
+            item = copy.deepcopy(template)
+            item["id"] = video_id
+            items.append(item)
+        return {**self.videos, "items": items}
+
+    @staticmethod
+    def playlist_page(playlist_id: str, page_token: Optional[str], size: int = 50, total: int = 120) -> dict:
+        """再生リストごとに決まったIDの動画を total 件返す"""
+        start = int(page_token.split("-", 1)[1]) if page_token else 0
+        items = [
+            {"kind": "youtube#playlistItem", "contentDetails": {"videoId": f"{playlist_id[-6:]}{i:05d}"[-11:].rjust(11, "v")}}
+            for i in range(start, min(start + size, total))
+        ]
+        page = {"kind": "youtube#playlistItemListResponse", "items": items}
+        if start + size < total:
+            page["nextPageToken"] = f"item-{start + size}"
+        return page
+
+    def thread_page(self, page_token: Optional[str]) -> Optional[dict]:
+        index = int(page_token.split("-", 1)[1]) if page_token else 0
+        if index >= self.pages:
+            return None
+        page = copy.deepcopy(self.thread_pages[index % len(self.thread_pages)])
+        cycle = index // len(self.thread_pages)
+        if cycle:
+            # 繰り返し分は ID に周回番号を付けて別のコメントとして扱わせる
+            for item in page["items"]:
+                item["id"] = f"{item['id']}.c{cycle}"
+                item["snippet"]["topLevelComment"]["id"] = item["id"]
+                for reply in item.get("replies", {}).get("comments", []):
+                    reply["id"] = f"{reply['id']}.c{cycle}"
+                    reply["snippet"]["parentId"] = item["id"]
+        page.pop("nextPageToken", None)
+        if index + 1 < self.pages:
+            page["nextPageToken"] = f"page-{index + 1}"
+        return page
+
+    def reply_page(self, parent_id: str) -> dict:
+        base, _, cycle = parent_id.partition(".c")
+        pages = self.replies.get(base)
+        if not pages:
+            return {"kind": "youtube#commentListResponse", "items": []}
+        page = copy.deepcopy(pages[0])
+        if cycle:
+            for item in page["items"]:
+                item["id"] = f"{item['id']}.c{cycle}"
+                item["snippet"]["parentId"] = parent_id
+        return page
+
+    @property
+    def total_comments(self) -> int:
+        """繰り返し分を含めた親コメントと返信の件数"""
+        total = 0
+        for index in range(self.pages):
+            for item in self.thread_pages[index % len(self.thread_pages)]["items"]:
+                total += 1 + item["snippet"].get("totalReplyCount", 0)
+        return total
+
+
+class _YouTubeHandler(_Handler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        self.server.count(endpoint)
+        if self._inject():
+            return
+
+        fixtures: YouTubeFixtures = self.server.fixtures
+        if endpoint == "videos":
+            body = fixtures.video_list(params.get("id", ""))
+        elif endpoint == "playlistItems":
+            body = fixtures.playlist_page(params.get("playlistId", ""), params.get("pageToken"))
+        elif endpoint == "channels":
+            channel = params.get("id") or params.get("forHandle") or params.get("forUsername") or ""
+            body = {"kind": "youtube#channelListResponse", "items": [
+                {"id": channel, "contentDetails": {"relatedPlaylists": {"uploads": f"UU{channel.lstrip('@UC')}"}}}
+            ]}
+        elif endpoint == "commentThreads":
+            body = fixtures.thread_page(params.get("pageToken"))
+            if body is None:
+                self._send_json(400, {"error": {"code": 400, "message": "invalid page token"}})
+                return
+            if "replies" not in params.get("part", ""):
+                for item in body["items"]:
+                    item.pop("replies", None)
+        elif endpoint == "comments":
+            body = fixtures.reply_page(params.get("parentId", ""))
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": f"unknown endpoint {endpoint}"}})
+            return
+        self._send_json(200, body)
+
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count("chat_completions")
+        if self._inject():
+            return
+
+        messages = request.get("messages", [])
+        model = request.get("model", "")
+        content = self.server.renderer.render_content(messages)
+        prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+        completion_tokens = count_tokens(content)
+        self.server.count("prompt_tokens", prompt_tokens)
+        self.server.count("completion_tokens", completion_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        created = int(time.time())
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created, "model": model}
+        for i in range(0, len(content), 8):
+            chunk = {**base, "choices": [{"index": 0, "delta": {"content": content[i:i + 8]}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self.wfile.write(f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_youtube_stub(port: int = 0, injection: Optional[Injection] = None, fixtures: Optional[YouTubeFixtures] = None) -> _StubServer:
+    server = _StubServer(port, _YouTubeHandler, injection or Injection())
+    server.fixtures = fixtures or YouTubeFixtures()
+    return server.start()
+
+
+def start_openai_stub(port: int = 0, injection: Optional[Injection] = None, malformed_rate: float = 0.0) -> _StubServer:
+    server = _StubServer(port, _OpenAIHandler, injection or Injection())
+    # 応答本文は疑似LLMバックエンドと同じ定型の結果（崩れたJSONの割合も同じ仕組みで指定）
+    server.renderer = FakeAsyncLLMClient(latency=0, jitter=0, error_rate=0, malformed_rate=malformed_rate)
+    return server.start()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--youtube-port", type=int, default=8801)
+    parser.add_argument("--openai-port", type=int, default=8802)
+    parser.add_argument("--pages", type=int, default=None, help="返すコメントページ数（記録済みページを繰り返す）")
+    parser.add_argument("--youtube-latency", type=float, default=0.05)
+    parser.add_argument("--youtube-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    youtube = start_youtube_stub(args.youtube_port, Injection(args.youtube_latency, 0, args.youtube_error_rate), YouTubeFixtures(pages=args.pages))
+    openai = start_openai_stub(args.openai_port, Injection(args.llm_latency, args.llm_jitter, args.llm_error_rate))
+    print(f"YOUTUBE_API_ENDPOINT={youtube.url}/")
+    print(f"OPENAI_BASE_URL={openai.url}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        youtube.stop()
+        openai.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import asyncio
+
+from app.services.judge_jobs import JudgeJobManager, JudgeJobStore
+
+
+def _unavailable():
+    raise LookupError("サービスが設定されていません")
+
+
+def _manager(tmp_path):
+    return JudgeJobManager(JudgeJobStore(str(tmp_path / "jobs.db")), _unavailable, _unavailable, workers=1, queue_size=1)
+
+
+def test_condition_is_released_when_job_finishes(tmp_path):
+    async def run():
+        manager = _manager(tmp_path)
+        job = manager.start("dQw4w9WgXcQ")
+        condition = manager.condition(job.job_id)
+
+        async with condition:
+            await asyncio.wait_for(condition.wait(), timeout=5)
+        await asyncio.sleep(0)
+        return manager, job.job_id
+
+    manager, job_id = asyncio.run(run())
+    assert manager.store.get(job_id).status == "failed"
+    assert manager._conditions == {}
+
+
+def test_condition_for_finished_job_is_not_registered(tmp_path):
+    async def run():
+        manager = _manager(tmp_path)
+        job = manager.start("dQw4w9WgXcQ")
+        while manager.is_running(job.job_id):
+            await asyncio.sleep(0)
+        manager.condition(job.job_id)
+        return manager
+
+    assert asyncio.run(run())._conditions == {}
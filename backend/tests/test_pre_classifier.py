@@ -0,0 +1,111 @@
+import pytest
+
+from app.models.comment import AnalysisRequest
+from app.services.pre_classifier import PreClassifier
+
+
+@pytest.fixture
+def classifier():
+    # 学習済みモデルなし（辞書ルールのみ）
+    return PreClassifier(model_path=None)
+
+
+def _classify(classifier, text):
+    return classifier.classify(AnalysisRequest(comment_text=text))
+
+
+@pytest.mark.parametrize("text", [
+    "しね草",
+    "ブスすぎて草",
+    "才能ゴミすぎて草",
+    "うざすぎて草",
+    "カスすぎて最高",
+    "最高の詐欺師",
+    "you are nasty",
+    "ugly lol",
+    "trash lol",
+    "草",
+    "www",
+    "ｗｗｗ",
+    "lol",
+    "笑",
+    "🤣🤣",
+    "最高",
+    "面白い",
+    "great video",
+])
+def test_without_model_leaves_everything_but_thanks_and_emoji_to_llm(classifier, text):
+    assert _classify(classifier, text) is None
+
+
+@pytest.mark.parametrize("text, label", [
+    ("ありがとうございます！", "感謝"),
+    ("thank you so much", "感謝"),
+    ("ty", "感謝"),
+    ("👏👏🔥", "賞賛"),
+])
+def test_without_model_judges_thanks_and_emoji_only(classifier, text, label):
+    result = _classify(classifier, text)
+    assert result is not None
+    assert result.category == [label]
+    assert result.safe_or_out == "safe"
+
+
+@pytest.mark.parametrize("text", [
+    "しね草",
+    "カスすぎて最高",
+    "最高の詐欺師",
+    "you are nasty",
+    "ugly lol",
+    "trash lol",
+    "ブスすぎて草",
+])
+def test_rules_escalate_insults_and_mockery(classifier, text):
+    # 学習済みモデルがあっても辞書の候補にならない（LLMへ回る）
+    from app.services.pre_classifier import HashedNGramModel
+    classifier.model = HashedNGramModel(dimensions=1 << 10)
+    assert _classify(classifier, text) is None
+
+
+def test_english_tokens_need_word_boundaries(classifier):
+    from app.services.pre_classifier import HashedNGramModel
+    assert classifier._rule_label("you are nasty") is None
+    assert classifier._rule_label("coolant leak") is None
+    assert classifier._rule_label("so cool") == "賞賛"
+    assert _classify(classifier, "so cool") is None
+
+
+@pytest.fixture
+def trained_classifier():
+    from app.services.pre_classifier import LABELS, HashedNGramModel
+    praise, other = LABELS.index("賞賛"), LABELS.index("その他")
+    samples = [(text, praise) for text in ("すごい", "すごいです", "最高", "最高です", "すごい編集")] * 20
+    samples += [(text, other) for text in ("今日は雨", "明日の予定", "説明をお願いします")] * 20
+    classifier = PreClassifier(model_path=None)
+    classifier.model = HashedNGramModel.train(samples, dimensions=1 << 12)
+    return classifier
+
+
+def test_model_confirms_lexicon_label(trained_classifier):
+    result = _classify(trained_classifier, "すごい")
+    assert result is not None
+    assert result.category == ["賞賛"]
+
+
+@pytest.mark.parametrize("text", ["すごい下品", "最高にダサい", "すごい最低", "最高に気持ち悪い"])
+def test_model_backed_mixed_praise_and_slur_escalates(trained_classifier, text):
+    assert _classify(trained_classifier, text) is None
+
+
+@pytest.mark.parametrize("text", ["すごい", "最高", "すごい下品", "最高にダサい", "面白い"])
+def test_weak_model_does_not_accept_lexicon_label(classifier, text):
+    from app.services.pre_classifier import HashedNGramModel
+    classifier.model = HashedNGramModel(dimensions=1 << 10)
+    assert _classify(classifier, text) is None
+
+
+def test_kudasai_is_not_escalated_as_slur():
+    from app.services.pre_classifier import _ESCALATE
+    assert _ESCALATE.search("続編お願いします") is None
+    assert _ESCALATE.search("また見てください") is None
+    assert _ESCALATE.search("ださい") is not None
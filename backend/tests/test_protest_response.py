@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pytest
+
+from app.models.comment import AnalysisResult, ProtestRequest
+from app.services.analysis_service import AnalysisService
+from app.services.fake_llm import FakeAsyncLLMClient
+
+
+class ScriptedLLMClient(FakeAsyncLLMClient):
+    """決められた応答を順に返す疑似クライアント（尽きたら空のオブジェクト）"""
+
+    def __init__(self, responses):
+        super().__init__(latency=0, jitter=0, error_rate=0, malformed_rate=0)
+        self.responses = [json.dumps(response, ensure_ascii=False) for response in responses]
+
+    def render_content(self, messages):
+        return self.responses.pop(0) if self.responses else "{}"
+
+
+ORIGINAL = AnalysisResult(
+    category=["批判"], is_counter=False, graham_hierarchy=None, logical_fallacy=None,
+    validity_assessment="中程度", safe_or_out="out", explanation="元の説明", validity_reason="元の理由"
+)
+CHANGED_WITHOUT_FIELDS = {"umpireResponse": "判定を変更します。", "judgmentChanged": True}
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_ENABLED", "false")
+    monkeypatch.setenv("PRE_CLASSIFIER_ENABLED", "false")
+
+    def make(responses):
+        return AnalysisService(openai_api_key="test", client=ScriptedLLMClient(responses))
+    return make
+
+
+def _protest_request():
+    return ProtestRequest(comment_text="このコメントは批判です", original_result=ORIGINAL, protest_message="セーフでは？", conversation_history=[])
+
+
+def test_changed_judgment_reasks_missing_fields(make_service):
+    service = make_service([CHANGED_WITHOUT_FIELDS, {"newSafeOrOut": "safe", "newExplanation": "新しい説明"}])
+    response = asyncio.run(service.handle_protest(_protest_request()))
+    assert service.parse_stats["reasked"] == 1
+    assert response.new_result.safe_or_out == "safe"
+    assert response.new_result.explanation == "新しい説明"
+
+
+def test_changed_judgment_without_fields_keeps_original(make_service):
+    service = make_service([CHANGED_WITHOUT_FIELDS, {"newSafeOrOut": None, "newExplanation": None}])
+    response = asyncio.run(service.handle_protest(_protest_request()))
+    assert response.judgment_changed
+    assert response.new_result.safe_or_out == "out"
+    assert response.new_result.explanation == "元の説明"
+
+
+def test_unchanged_judgment_does_not_reask(make_service):
+    service = make_service([{"umpireResponse": "判定は変わりません。", "judgmentChanged": False}])
+    response = asyncio.run(service.handle_protest(_protest_request()))
+    assert service.parse_stats["reasked"] == 0
+    assert response.new_result is None
+
+
+def test_session_keeps_valid_result_when_fields_missing(make_service):
+    service = make_service([CHANGED_WITHOUT_FIELDS, {}])
+    session = service.start_protest_session("このコメントは批判です", ORIGINAL)
+    response = asyncio.run(service.handle_protest_turn(session, "セーフでは？"))
+    assert response.new_result.safe_or_out == "out"
+    assert session.current_result.safe_or_out == "out"
+    assert session.current_result.explanation == "元の説明"
+    assert "元の説明" in session.head
+
+
+def test_session_stream_keeps_valid_result_when_fields_missing(make_service):
+    service = make_service([CHANGED_WITHOUT_FIELDS, {}])
+    session = service.start_protest_session("このコメントは批判です", ORIGINAL)
+
+    async def run():
+        return [event async for event in service.handle_protest_turn_stream(session, "セーフでは？")]
+
+    kind, response = asyncio.run(run())[-1]
+    assert kind == "result"
+    assert response.new_result.safe_or_out == "out"
+    assert session.current_result.explanation == "元の説明"
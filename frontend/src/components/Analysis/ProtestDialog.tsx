@@ -1,7 +1,8 @@
 import React, { useState, useRef, useEffect } from 'react';
+import axios from 'axios';
 import styled from 'styled-components';
 import type { AnalysisResult } from '@/types';
-import { protestJudgment } from '@/services/api';
+import { protestJudgment, protestInSession, startProtestSession } from '@/services/api';
 
 interface ProtestDialogProps {
   result: AnalysisResult;
@@ -175,6 +176,9 @@ export const ProtestDialog: React.FC<ProtestDialogProps> = ({
   const [isLoading, setIsLoading] = useState(false);
   const [status, setStatus] = useState<{ type: 'info' | 'success' | 'error'; message: string } | null>(null);
   const chatEndRef = useRef<HTMLDivElement>(null);
+  // サーバー側の会話（期限切れになったら以降は履歴ごと送る従来の方式に切り替える）
+  const sessionIdRef = useRef<string | null>(null);
+  const sessionExpiredRef = useRef(false);
 
   useEffect(() => {
     chatEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -190,13 +194,29 @@ export const ProtestDialog: React.FC<ProtestDialogProps> = ({
     setStatus(null);
 
     try {
-      const response = await protestJudgment({
+      const sendStateless = () => protestJudgment({
         comment_text: commentText,
         original_result: result,
         protest_message: userMessage,
         conversation_history: messages
       });
 
+      let response;
+      if (sessionExpiredRef.current) {
+        response = await sendStateless();
+      } else {
+        if (!sessionIdRef.current) {
+          sessionIdRef.current = (await startProtestSession(commentText, result)).session_id;
+        }
+        try {
+          response = await protestInSession(sessionIdRef.current, userMessage);
+        } catch (error) {
+          if (!axios.isAxiosError(error) || error.response?.status !== 404) throw error;
+          sessionExpiredRef.current = true;
+          response = await sendStateless();
+        }
+      }
+
       setMessages(prev => [...prev, { role: 'umpire', content: response.umpire_response }]);
 
       if (response.judgment_changed) {
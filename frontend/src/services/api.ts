@@ -5,8 +5,10 @@ import type {
   Comment, 
   AnalysisRequest, 
   AnalysisResult,
+  BatchAnalysisResponse,
   ProtestRequest,
-  ProtestResponse
+  ProtestResponse,
+  ProtestSession
 } from '@/types';
 
 class CommentUmpireAPI {
@@ -51,6 +53,11 @@ class CommentUmpireAPI {
     return response.data;
   }
 
+  async analyzeComments(requests: AnalysisRequest[]): Promise<BatchAnalysisResponse> {
+    const response = await this.axios.post<BatchAnalysisResponse>('/comments/analyze/batch', { requests });
+    return response.data;
+  }
+
   async getPrompts(): Promise<{ core_prompt: string; additional_prompt: string }> {
     const response = await this.axios.get('/prompts');
     return response.data;
@@ -72,8 +79,25 @@ class CommentUmpireAPI {
     const response = await this.axios.post<ProtestResponse>('/comments/protest', request);
     return response.data;
   }
+
+  async startProtestSession(commentText: string, originalResult: AnalysisResult): Promise<ProtestSession> {
+    const response = await this.axios.post<ProtestSession>('/comments/protest/sessions', {
+      comment_text: commentText,
+      original_result: originalResult
+    });
+    return response.data;
+  }
+
+  async protestInSession(sessionId: string, protestMessage: string): Promise<ProtestResponse> {
+    const response = await this.axios.post<ProtestResponse>(`/comments/protest/sessions/${sessionId}`, {
+      protest_message: protestMessage
+    });
+    return response.data;
+  }
 }
 
 export const api = new CommentUmpireAPI();
 export const protestJudgment = api.protestJudgment.bind(api);
+export const startProtestSession = api.startProtestSession.bind(api);
+export const protestInSession = api.protestInSession.bind(api);
 export default CommentUmpireAPI;
\ No newline at end of file
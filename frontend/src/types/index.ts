@@ -6,6 +6,7 @@ export interface Comment {
   like_count: number;
   reply_count: number;
   parent_id?: string;
+  cluster_id?: string;
 }
 
 export interface VideoInfo {
@@ -57,4 +58,24 @@ export interface ProtestResponse {
   umpire_response: string;
   judgment_changed: boolean;
   new_result?: AnalysisResult;
-}
\ No newline at end of file
+}
+
+export interface ProtestSession {
+  session_id: string;
+  current_result: AnalysisResult;
+  conversation_history: Array<{
+    role: 'user' | 'umpire';
+    content: string;
+  }>;
+  expires_in_seconds: number;
+}
+export interface BatchAnalysisItem {
+  index: number;
+  result?: AnalysisResult;
+  error?: string;
+  cluster_id?: string;
+}
+
+export interface BatchAnalysisResponse {
+  results: BatchAnalysisItem[];
+}